@@ -0,0 +1,197 @@
+# bench/bench_cleaning.py
+"""
+回复后处理基准：先与黄金语料逐条对拍，再测 extract_clean_response 每条回复的 CPU 开销
+
+黄金语料 bench/golden/response_cleaning.jsonl 由 _corpus_inputs 生成输入，
+期望输出由 bench/reference_cleaning.py（原 LoraChatModel 的逐条 re.sub 实现）给出，而不是被测的 response_cleaning。
+清理规则有意调整时，先修改参考实现，再用下面的命令重新生成（提交前检查差异）：
+    python -m bench.bench_cleaning --update
+"""
+import argparse
+import json
+import os
+import random
+import re
+import time
+
+from bench import reference_cleaning
+from bench.common import REPO_ROOT, MemoryMonitor, percentiles, setup_import_paths
+
+GOLDEN_PATH = os.path.join(REPO_ROOT, "bench", "golden", "response_cleaning.jsonl")
+
+# 与 LoraChatModel.SYSTEM_PROMPT 一致；解码时 skip_special_tokens 会去掉 <|...|> 特殊 token
+SYSTEM_PROMPT = (
+    "<|start_header_id|>system<|end_header_id|>\n\n\n你是一个有帮助的AI助手。请针对用户的最新问题进行直接回答，"
+    "不要以\"Assistant\"、\"助手\"或任何类似前缀开头，直接给出答案内容。<|eot_id|>\n"
+)
+SYSTEM_TEXT = re.sub(r'<\|.*?\|>', '', SYSTEM_PROMPT)
+
+QUESTIONS = [
+    "类型#上衣*材质#牛仔裤*颜色#白色*风格#简约*图案#刺绣*衣样式#外套*衣款式#破洞",
+    "类型#连衣裙*材质#雪纺*风格#正式*衣型*颜色#淡紫色",
+    "类型#耳机*特点#降噪*适用#游戏",
+    "类型#口红*质地#丝绒*功能#易启*场景#约会",
+    "裤子",
+    "帮我写一段文案",
+    "what is this?",
+]
+
+PREFIXES = [
+    "assistant", "Assistant:", "ASSISTANT ", "assistant: ", "assistant is ", "Assistant is great",
+    "助手：", "AI助手:", "ai助理 ", "机器人", "好的，", "明白了,", "根据您的问题 ", "针对这个问题，",
+    "这款，", "这是一个,", "首先，", "嗯，", "那个,", "那么，", "接下来，", "此外,", "另外，",
+    "「", "【", "(", "[", "\"", "'", "，", ".", "：", "!", "？", " ", "\n", "\t", "　", "\xa0",
+]
+
+BODIES = [
+    "这款牛仔外套采用简约的白色设计，搭配精致刺绣与破洞细节，时尚又百搭。",
+    "淡紫色雪纺连衣裙，轻盈飘逸，正式场合也能穿出优雅气质。",
+    "降噪耳机让你沉浸在游戏世界中",
+    "丝绒口红显白又持久",
+    "好看",
+    "ok",
+    "(注：以上为示例)",
+    "[1]",
+    "（全角括号不会被删除）",
+    "<|eot_id|>",
+    "<|start_header_id|>assistant<|end_header_id|>",
+    "<|start_header_id|>user<|end_header_id|>",
+    "<|reserved_special_token_0|>",
+    "<|未闭合",
+    "|>",
+    "(未闭合",
+    ")",
+    "[未闭合",
+    "]",
+    "assistant:",
+    "Assistant:",
+    "助手:",
+    "助手：",
+    "\n\n",
+    "  ",
+    "\t",
+    "\r\n",
+    "　",
+    "。",
+    "，",
+    "!",
+    "So comfortable and stylish.",
+]
+
+def _random_text(rng, parts, max_parts):
+    return "".join(rng.choice(parts) for _ in range(rng.randint(0, max_parts)))
+
+def _reply(rng):
+    return _random_text(rng, PREFIXES, 3) + _random_text(rng, BODIES, 6)
+
+def build_prompt(question):
+    """与 LoraChatModel._build_correct_prompt 相同的单轮 prompt（语料中不保存，按问题重建）"""
+    return (
+        f"{SYSTEM_PROMPT}<|start_header_id|>user<|end_header_id|>\n\n{question}<|eot_id|>\n"
+        "<|start_header_id|>assistant<|end_header_id|>\n\n"
+    )
+
+def _corpus_inputs(num_cases=250, seed=0):
+    """生成 (response, question)：解码文本 / 以 prompt 开头的文本 / 随机片段三种形态"""
+    rng = random.Random(seed)
+    cases = []
+    for i in range(num_cases):
+        question = rng.choice(QUESTIONS)
+        history = "".join(
+            f"user\n\n{rng.choice(QUESTIONS)}\nassistant\n\n{_reply(rng)}\n" for _ in range(rng.randint(0, 2))
+        )
+        mode = i % 5
+        if mode in (0, 1):
+            response = f"{SYSTEM_TEXT}{history}user\n\n{question}\nassistant\n\n{_reply(rng)}"
+        elif mode == 2:
+            response = build_prompt(question) + _reply(rng)
+        else:
+            response = _random_text(rng, PREFIXES + BODIES + [question], 10)
+        cases.append((response, question))
+    return cases
+
+def _outputs(cleaning, response, question):
+    clean = cleaning.extract_clean_response(response, build_prompt(question), question)
+    return {
+        "clean": clean,
+        "by_question": cleaning.extract_by_current_question(response, question),
+        "aggressive": cleaning.aggressive_clean(response),
+        "prefix": cleaning.remove_assistant_prefix(response),
+        "relevant": cleaning.is_response_relevant(clean, question),
+    }
+
+def load_golden(path=GOLDEN_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def verify_golden(path=GOLDEN_PATH):
+    """返回与黄金语料不一致的记录 [(行号, 字段, 期望, 实际)]"""
+    setup_import_paths()
+    import response_cleaning
+
+    mismatches = []
+    for line_no, record in enumerate(load_golden(path), 1):
+        actual = _outputs(response_cleaning, record["response"], record["question"])
+        for key, value in actual.items():
+            if record[key] != value:
+                mismatches.append((line_no, key, record[key], value))
+    return mismatches
+
+def update_golden(path=GOLDEN_PATH):
+    """按参考实现重新生成黄金语料"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for response, question in _corpus_inputs():
+            record = {"response": response, "question": question}
+            record.update(_outputs(reference_cleaning, response, question))
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def run(repeats=5):
+    setup_import_paths()
+    from response_cleaning import extract_clean_response, is_response_relevant
+
+    mismatches = verify_golden()
+    if mismatches:
+        line_no, key, expected, actual = mismatches[0]
+        raise RuntimeError(
+            f"回复清理结果与黄金语料不一致（{len(mismatches)} 处），第 {line_no} 行 {key}: {expected!r} -> {actual!r}"
+        )
+
+    records = [(r["response"], build_prompt(r["question"]), r["question"]) for r in load_golden()]
+
+    # 与 LoraChatModel.chat 一致：提取 + 清理 + 相关性检查
+    def _clean_all():
+        for response, prompt, question in records:
+            is_response_relevant(extract_clean_response(response, prompt, question), question)
+
+    _clean_all()  # 预热
+    latencies = []
+    with MemoryMonitor() as memory:
+        for _ in range(max(1, repeats)):
+            start = time.perf_counter()
+            _clean_all()
+            latencies.append((time.perf_counter() - start) * 1000)
+    per_response_us = min(latencies) * 1000 / len(records)
+    return [{
+        "suite": "cleaning",
+        "case": "extract_clean_response",
+        "batch_size": len(records),
+        "seq_len": None,
+        "latency_ms": percentiles(latencies),
+        "samples_per_s": round(len(records) / (min(latencies) / 1000), 2),
+        "us_per_response": round(per_response_us, 3),
+        **memory.as_dict(),
+    }]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="回复后处理对拍与微基准")
+    parser.add_argument("--update", action="store_true", help="按参考实现重新生成黄金语料")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.update:
+        update_golden()
+        print(f"✅ 已更新黄金语料: {GOLDEN_PATH}")
+    else:
+        result = run(args.repeats)[0]
+        print(f"✅ 与黄金语料一致，{result['batch_size']} 条回复，每条 {result['us_per_response']:.1f} µs")
@@ -0,0 +1,148 @@
+# bench/bench_concurrency.py
+"""
+并发突发基准：num_users 个会话同时提交请求，经 GenerationQueue 排队、在工作线程中执行 chat_stream，
+与界面 respond 的调用路径一致（不启动 Gradio）。记录完成 / 拒绝数、端到端与排队耗时、
+首段文本时间，以及事件循环的最大卡顿（每 10ms 打点一次的实际间隔），
+用于确认突发流量下事件循环不被生成阻塞、排队请求都能完成。
+单独运行：
+    python -m bench.bench_concurrency --num_users 100 --max_concurrency 2
+"""
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+import threading
+import time
+
+import torch
+
+from bench.common import MemoryMonitor, build_tiny_checkpoint, percentiles, sample_inputs, setup_import_paths
+
+TICK_SECONDS = 0.01
+
+async def _watch_event_loop(stop, lags):
+    """每 TICK_SECONDS 打点一次，记录超出预期的间隔（事件循环被阻塞的时间）"""
+    while not stop.is_set():
+        before = time.perf_counter()
+        await asyncio.sleep(TICK_SECONDS)
+        lags.append((time.perf_counter() - before - TICK_SECONDS) * 1000)
+
+async def _user(chat_model, queue, message, max_new_tokens, record):
+    from app.request_queue import QueueFullError, iterate_in_thread
+
+    start = time.perf_counter()
+    try:
+        async for _ in queue.admit():
+            pass
+    except QueueFullError:
+        record["rejected"] += 1
+        return
+    admitted = time.perf_counter()
+    first_chunk = None
+    try:
+        async for _ in iterate_in_thread(chat_model.chat_stream, message, [], 0.7, max_new_tokens):
+            if first_chunk is None:
+                first_chunk = time.perf_counter()
+    finally:
+        queue.release()
+    end = time.perf_counter()
+    record["queue_ms"].append((admitted - start) * 1000)
+    record["latency_ms"].append((end - start) * 1000)
+    record["first_chunk_ms"].append(((first_chunk or end) - start) * 1000)
+
+async def _burst(chat_model, num_users, max_concurrency, max_queue_size, overflow, max_new_tokens):
+    from app.request_queue import GenerationQueue
+
+    queue = GenerationQueue(max_concurrency, max_queue_size, overflow)
+    record = {"rejected": 0, "queue_ms": [], "latency_ms": [], "first_chunk_ms": []}
+    lags, stop = [], asyncio.Event()
+    watcher = asyncio.create_task(_watch_event_loop(stop, lags))
+    messages = sample_inputs(num_users)
+    # 每个会话的输入各不相同（末尾附编号），不会命中回复缓存
+    users = [
+        _user(chat_model, queue, f"{messages[i]}；{i}", max_new_tokens, record)
+        for i in range(num_users)
+    ]
+    start = time.perf_counter()
+    await asyncio.gather(*users)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await watcher
+    return record, lags, elapsed, queue.stats()
+
+def load_chat_model(base_path, lora_path):
+    from app.config import Config
+    from app.chat_model import LoraChatModel
+
+    Config.BASE_MODEL_PATH = base_path
+    Config.LORA_CHECKPOINT_PATH = lora_path
+    Config.LORA_ADAPTERS = {}
+    Config.MERGE_LORA = False
+    Config.ENABLE_BATCHING = False
+    Config.CPU_QUANTIZATION = None
+    Config.ENABLE_RESPONSE_CACHE = False
+    chat_model = LoraChatModel()
+    chat_model.load_model()
+    return chat_model
+
+def run(base_path, lora_path, num_users=100, max_concurrency=2, max_queue_size=100, overflow="queue", max_new_tokens=16):
+    setup_import_paths()
+    chat_model = load_chat_model(base_path, lora_path)
+    torch.manual_seed(0)
+    list(chat_model.chat_stream(sample_inputs(1)[0], [], 0.7, max_new_tokens))  # 预热
+
+    with MemoryMonitor() as memory:
+        threads_before = threading.active_count()
+        record, lags, elapsed, stats = asyncio.run(
+            _burst(chat_model, num_users, max_concurrency, max_queue_size, overflow, max_new_tokens)
+        )
+    completed = len(record["latency_ms"])
+    return [{
+        "suite": "concurrency",
+        "case": f"burst_{overflow}",
+        "batch_size": num_users,
+        "seq_len": None,
+        "max_new_tokens": max_new_tokens,
+        "max_concurrency": max_concurrency,
+        "max_queue_size": max_queue_size,
+        "completed": completed,
+        "rejected": record["rejected"],
+        "requests_per_s": round(completed / elapsed, 2),
+        "latency_ms": percentiles(record["latency_ms"]) if completed else None,
+        "queue_ms": percentiles(record["queue_ms"]) if completed else None,
+        "first_chunk_ms": percentiles(record["first_chunk_ms"]) if completed else None,
+        "max_event_loop_lag_ms": round(max(lags), 2) if lags else 0.0,
+        "leaked_threads": max(0, threading.active_count() - threads_before),
+        "queue": stats,
+        **memory.as_dict(),
+    }]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="突发并发：排队、拒绝与事件循环卡顿")
+    parser.add_argument("--hidden_size", type=int, default=64)
+    parser.add_argument("--num_layers", type=int, default=2)
+    parser.add_argument("--num_users", type=int, default=100)
+    parser.add_argument("--max_concurrency", type=int, default=2)
+    parser.add_argument("--max_queue_size", type=int, default=100)
+    parser.add_argument("--overflow", type=str, default="queue", choices=["queue", "reject"])
+    parser.add_argument("--max_new_tokens", type=int, default=16)
+    parser.add_argument("--output", type=str, default=None, help="结果 JSON 路径")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("app").setLevel(logging.ERROR)
+    setup_import_paths()
+    with tempfile.TemporaryDirectory() as root:
+        base_path, lora_path = build_tiny_checkpoint(root, args.hidden_size, args.num_layers)
+        results = run(base_path, lora_path, args.num_users, args.max_concurrency, args.max_queue_size,
+                      args.overflow, args.max_new_tokens)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    for r in results:
+        print(f"{r['case']}: {r['completed']} 完成 / {r['rejected']} 拒绝, {r['requests_per_s']} req/s, "
+              f"p95 延迟 {r['latency_ms']['p95'] if r['latency_ms'] else '-'} ms, "
+              f"p95 排队 {r['queue_ms']['p95'] if r['queue_ms'] else '-'} ms, "
+              f"事件循环最大卡顿 {r['max_event_loop_lag_ms']} ms, 残留线程 {r['leaked_threads']}")
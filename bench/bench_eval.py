@@ -0,0 +1,55 @@
+# bench/bench_eval.py
+"""
+评测基准：evaluate.generate_predictions 的批量生成吞吐与 compute_scores 的打分吞吐
+"""
+import torch
+from peft import PeftModel
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from bench.common import MemoryMonitor, percentiles, sample_inputs, timed
+
+def run(base_path, lora_path, batch_sizes, max_new_tokens=32, num_samples=16):
+    from evaluate import compute_scores, generate_predictions
+
+    tokenizer = AutoTokenizer.from_pretrained(base_path)
+    model = AutoModelForCausalLM.from_pretrained(base_path, torch_dtype=torch.float32)
+    model = PeftModel.from_pretrained(model, lora_path)
+    model.to("cuda" if torch.cuda.is_available() else "cpu").eval()
+    inputs = sample_inputs(num_samples)
+    results = []
+
+    predictions = None
+    for batch_size in batch_sizes:
+        torch.manual_seed(0)
+        generate_predictions(model, tokenizer, inputs[:batch_size], batch_size, max_new_tokens)  # 预热
+        with MemoryMonitor() as memory:
+            predictions, elapsed = timed(generate_predictions, model, tokenizer, inputs, batch_size, max_new_tokens)
+        tokens = sum(len(tokenizer(p, add_special_tokens=False)["input_ids"]) for p in predictions)
+        results.append({
+            "suite": "eval",
+            "case": "generate_predictions",
+            "batch_size": batch_size,
+            "seq_len": None,
+            "max_new_tokens": max_new_tokens,
+            "latency_ms": percentiles([elapsed]),
+            "samples_per_s": round(num_samples / (elapsed / 1000), 2),
+            "tokens_per_s": round(tokens / (elapsed / 1000), 2),
+            **memory.as_dict(),
+        })
+
+    # 打分：把预测与输入文本成对放大到 2000 条，测 scoring 的吞吐
+    pairs = 2000
+    preds = [predictions[i % len(predictions)] or "空" for i in range(pairs)]
+    refs = [inputs[i % len(inputs)] for i in range(pairs)]
+    with MemoryMonitor() as memory:
+        _, elapsed = timed(compute_scores, preds, refs)
+    results.append({
+        "suite": "eval",
+        "case": "compute_scores",
+        "batch_size": pairs,
+        "seq_len": None,
+        "latency_ms": percentiles([elapsed]),
+        "samples_per_s": round(pairs / (elapsed / 1000), 2),
+        **memory.as_dict(),
+    })
+    return results
@@ -0,0 +1,129 @@
+# bench/bench_inference.py
+"""
+推理基准：LoraChatModel.chat / chat_stream 的延迟与首 token 时间，_generate_batch 的批量吞吐
+"""
+import torch
+
+from bench.common import SAMPLE_CONTENTS, MemoryMonitor, percentiles, sample_inputs, timed
+
+def _make_message(chat_model, seq_len):
+    """构造使 prompt 约为 seq_len 个 token 的用户消息"""
+    base = "；".join(sample_inputs(8))
+    message = ""
+    while len(chat_model.tokenizer(chat_model._build_correct_prompt(message, []))["input_ids"]) < seq_len:
+        message += base[len(message) % len(base)]
+    return message
+
+def _count_new_tokens(tokenizer, prompt, full_text):
+    """_generate_batch 返回 prompt + 回复的解码文本，这里按去掉特殊 token 后的长度差估算生成 token 数"""
+    prompt_text = tokenizer.decode(tokenizer(prompt)["input_ids"], skip_special_tokens=True)
+    encode = lambda text: len(tokenizer(text, add_special_tokens=False)["input_ids"])
+    return max(0, encode(full_text) - encode(prompt_text))
+
+def load_chat_model(base_path, lora_path):
+    from app.config import Config
+    from app.chat_model import LoraChatModel
+
+    Config.BASE_MODEL_PATH = base_path
+    Config.LORA_CHECKPOINT_PATH = lora_path
+    Config.LORA_ADAPTERS = {}
+    Config.MERGE_LORA = False
+    Config.ENABLE_BATCHING = False
+    Config.CPU_QUANTIZATION = None  # 量化路径由 bench_quant 单独对比
+    Config.ENABLE_RESPONSE_CACHE = False  # 基准反复发送同一条消息，命中回复缓存就测不到生成；命中耗时单独测
+    chat_model = LoraChatModel()
+    chat_model.load_model()
+    return chat_model
+
+def _bench_cached_chat(chat_model, max_new_tokens, repeats):
+    from app.response_cache import ResponseCache
+
+    chat_model.response_cache = ResponseCache(num_variants=1)
+    attributes = SAMPLE_CONTENTS[0].split("*")
+    try:
+        chat_model.chat(SAMPLE_CONTENTS[0], [], 0.7, max_new_tokens)  # 写入缓存
+        latencies = []
+        with MemoryMonitor() as memory:
+            for i in range(repeats):
+                message = "*".join(attributes[i % len(attributes):] + attributes[:i % len(attributes)])
+                _, elapsed = timed(chat_model.chat, message, [], 0.7, max_new_tokens)
+                latencies.append(elapsed)
+        hit_rate = chat_model.response_cache.hits / repeats
+    finally:
+        chat_model.response_cache = None
+    return {
+        "suite": "inference",
+        "case": "chat_cached",
+        "batch_size": 1,
+        "seq_len": None,
+        "max_new_tokens": max_new_tokens,
+        # 命中耗时在亚毫秒级，抖动远大于回归阈值，不用 latency_ms 这个名字以免参与 --compare
+        "hit_latency_ms": percentiles(latencies),
+        "cache_hit_rate": hit_rate,
+        **memory.as_dict(),
+    }
+
+def run(base_path, lora_path, batch_sizes, seq_lens, max_new_tokens=32, repeats=5):
+    chat_model = load_chat_model(base_path, lora_path)
+    tokenizer = chat_model.tokenizer
+    results = []
+
+    for seq_len in seq_lens:
+        message = _make_message(chat_model, seq_len)
+
+        # 单请求延迟：chat 的端到端耗时、首 token 时间（prefill + 1 个 token）与 chat_stream 的首段文本时间
+        # （流式清理会暂缓输出可能是前缀的文本，首段文本时间 >= 首 token 时间）
+        torch.manual_seed(0)
+        prompt = chat_model._build_correct_prompt(message, [])
+        chat_model.chat(message, [], 0.7, max_new_tokens)  # 预热
+        latencies, ttfts, first_chunks, tokens_out = [], [], [], 0
+        with MemoryMonitor() as memory:
+            for _ in range(repeats):
+                response, elapsed = timed(chat_model.chat, message, [], 0.7, max_new_tokens)
+                latencies.append(elapsed)
+                tokens_out += len(tokenizer(response, add_special_tokens=False)["input_ids"])
+            for _ in range(repeats):
+                _, first_token_ms = timed(chat_model._generate_batch, [prompt], [0.7], [1])
+                ttfts.append(first_token_ms)
+                stream = chat_model.chat_stream(message, [], 0.7, max_new_tokens)
+                _, first_chunk_ms = timed(next, stream, None)
+                first_chunks.append(first_chunk_ms)
+                for _ in stream:
+                    pass
+        results.append({
+            "suite": "inference",
+            "case": "chat",
+            "batch_size": 1,
+            "seq_len": seq_len,
+            "max_new_tokens": max_new_tokens,
+            "latency_ms": percentiles(latencies),
+            "ttft_ms": percentiles(ttfts),
+            "first_chunk_ms": percentiles(first_chunks),
+            "tokens_per_s": round(tokens_out / (sum(latencies) / 1000), 2),
+            **memory.as_dict(),
+        })
+
+        # 批量吞吐：同一批 prompt 一次 _generate_batch
+        for batch_size in batch_sizes:
+            torch.manual_seed(0)
+            args = ([prompt] * batch_size, [0.7] * batch_size, [max_new_tokens] * batch_size)
+            chat_model._generate_batch(*args)  # 预热
+            latencies, new_tokens = [], 0
+            with MemoryMonitor() as memory:
+                for _ in range(repeats):
+                    outputs, elapsed = timed(chat_model._generate_batch, *args)
+                    latencies.append(elapsed)
+                    new_tokens += sum(_count_new_tokens(tokenizer, prompt, text) for text in outputs)
+            results.append({
+                "suite": "inference",
+                "case": "generate_batch",
+                "batch_size": batch_size,
+                "seq_len": seq_len,
+                "max_new_tokens": max_new_tokens,
+                "latency_ms": percentiles(latencies),
+                "tokens_per_s": round(new_tokens / (sum(latencies) / 1000), 2),
+                **memory.as_dict(),
+            })
+    # 回复缓存命中：同一组属性打乱顺序后发送，全部命中同一条目
+    results.append(_bench_cached_chat(chat_model, max_new_tokens, repeats))
+    return results
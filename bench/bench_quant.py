@@ -0,0 +1,141 @@
+# bench/bench_quant.py
+"""
+CPU 量化推理基准：同一模型分别以 fp32 / bf16 / int8 / int4 在 CPU 上加载，对比
+生成延迟、首 token 时间、tokens/s、权重占用与峰值 RSS，并以 fp32 的 logits 为参照记录量化误差
+
+随 bench.run 运行时使用公共的小模型（hidden 64，只用于发现回归）；
+低比特内核的收益要在较大的线性层上才能体现，单独运行时默认用 hidden 1024 的模型：
+    python -m bench.bench_quant --hidden_size 1024 --num_layers 4
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import tempfile
+
+import torch
+
+from bench.bench_inference import _count_new_tokens
+from bench.common import MemoryMonitor, build_tiny_checkpoint, percentiles, sample_inputs, setup_import_paths, timed
+
+# (用例名, CPU_DTYPE, CPU_QUANTIZATION)
+VARIANTS = (
+    ("cpu_fp32", "float32", None),
+    ("cpu_bf16", "bfloat16", None),
+    ("cpu_int8", "bfloat16", "int8"),
+    ("cpu_int4", "bfloat16", "int4"),
+)
+
+def _group_size(base_path):
+    """不超过 128、且能整除所有投影层输入维度的分组大小"""
+    with open(os.path.join(base_path, "config.json"), 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    return math.gcd(128, config["hidden_size"], config["intermediate_size"])
+
+def load_cpu_model(base_path, lora_path, dtype, quantization, cache_dir, group_size=128):
+    from app.config import Config
+    from app.chat_model import LoraChatModel
+
+    Config.BASE_MODEL_PATH = base_path
+    Config.LORA_CHECKPOINT_PATH = lora_path
+    Config.LORA_ADAPTERS = {}
+    Config.MERGE_LORA = False
+    Config.ENABLE_BATCHING = False
+    Config.INFERENCE_DEVICE = "cpu"
+    Config.CPU_DTYPE = dtype
+    Config.CPU_QUANTIZATION = quantization
+    Config.QUANT_GROUP_SIZE = group_size
+    Config.QUANTIZED_MODEL_CACHE_DIR = cache_dir
+    chat_model = LoraChatModel()
+    chat_model.load_model()
+    return chat_model
+
+def _logits(chat_model, input_ids):
+    with torch.no_grad():
+        return chat_model.model(input_ids=input_ids).logits.float()
+
+def run(base_path, lora_path, seq_len=256, max_new_tokens=32, repeats=5, variants=None):
+    setup_import_paths()
+    from app.quantization import quantized_size_bytes
+
+    group_size = _group_size(base_path)
+    variants = [v for v in VARIANTS if variants is None or v[0] in variants]
+    results = []
+    reference = None
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for case, dtype, quantization in variants:
+            # 第一次加载写量化缓存，第二次从缓存加载（线上的常规启动路径）
+            load_cpu_model(base_path, lora_path, dtype, quantization, cache_dir, group_size)
+            with MemoryMonitor() as load_memory:
+                chat_model, load_ms = timed(load_cpu_model, base_path, lora_path, dtype, quantization, cache_dir, group_size)
+            tokenizer = chat_model.tokenizer
+
+            message = ""
+            base = "；".join(sample_inputs(8))
+            while len(tokenizer(chat_model._build_correct_prompt(message, []))["input_ids"]) < seq_len:
+                message += base[len(message) % len(base)]
+            prompt = chat_model._build_correct_prompt(message, [])
+            input_ids = tokenizer(prompt, return_tensors="pt")["input_ids"]
+
+            logits = _logits(chat_model, input_ids)
+            if reference is None:
+                reference = logits
+            max_logit_diff = (logits - reference).abs().max().item()
+
+            torch.manual_seed(0)
+            chat_model._generate_batch([prompt], [0.7], [max_new_tokens])  # 预热
+            latencies, ttfts, new_tokens = [], [], 0
+            with MemoryMonitor() as memory:
+                for _ in range(repeats):
+                    _, first_token_ms = timed(chat_model._generate_batch, [prompt], [0.7], [1])
+                    ttfts.append(first_token_ms)
+                    outputs, elapsed = timed(chat_model._generate_batch, [prompt], [0.7], [max_new_tokens])
+                    latencies.append(elapsed)
+                    new_tokens += _count_new_tokens(tokenizer, prompt, outputs[0])
+            results.append({
+                "suite": "quant",
+                "case": case,
+                "batch_size": 1,
+                "seq_len": seq_len,
+                "max_new_tokens": max_new_tokens,
+                "quantization": quantization,
+                "dtype": dtype,
+                "group_size": group_size if quantization == "int4" else None,
+                "latency_ms": percentiles(latencies),
+                "ttft_ms": percentiles(ttfts),
+                "tokens_per_s": round(new_tokens / (sum(latencies) / 1000), 2),
+                "load_ms": round(load_ms, 1),
+                "load_peak_rss_mb": load_memory.as_dict()["peak_rss_mb"],
+                "weights_mb": round(quantized_size_bytes(chat_model.model) / 2 ** 20, 2),
+                "max_logit_diff_vs_fp32": round(max_logit_diff, 5),
+                **memory.as_dict(),
+            })
+            del chat_model
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CPU fp32 / bf16 / int8 / int4 推理对比")
+    parser.add_argument("--hidden_size", type=int, default=1024)
+    parser.add_argument("--num_layers", type=int, default=4)
+    parser.add_argument("--seq_len", type=int, default=256)
+    parser.add_argument("--max_new_tokens", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--variants", type=str, default=",".join(v[0] for v in VARIANTS))
+    parser.add_argument("--output", type=str, default=None, help="结果 JSON 路径")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("app").setLevel(logging.ERROR)
+    setup_import_paths()
+    with tempfile.TemporaryDirectory() as root:
+        base_path, lora_path = build_tiny_checkpoint(root, args.hidden_size, args.num_layers)
+        results = run(base_path, lora_path, args.seq_len, args.max_new_tokens, args.repeats, args.variants.split(","))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"{'case':<10}{'tok/s':>10}{'p50 ms':>10}{'ttft ms':>10}{'weights MB':>12}{'rss MB':>9}{'Δlogit':>10}")
+    for r in results:
+        print(f"{r['case']:<10}{r['tokens_per_s']:>10.1f}{r['latency_ms']['p50']:>10.1f}{r['ttft_ms']['p50']:>10.1f}"
+              f"{r['weights_mb']:>12.2f}{r['peak_rss_mb']:>9.1f}{r['max_logit_diff_vs_fp32']:>10.4f}")
@@ -0,0 +1,135 @@
+# bench/bench_speculative.py
+"""
+投机解码基准：同一 prompt 分别用逐 token 生成、prompt 查表草稿、小模型草稿生成，
+对比延迟、tokens/s、草稿接受率、每次目标前向产出的 token 数与实测加速比
+
+随机初始化的两个独立小模型几乎不会给出相同的 token，这里的草稿模型取目标基础模型的前若干层
+（共用 embedding 与 lm_head，类似 layer-skip 草稿），分布与目标模型相关，接受率才有参考意义。
+单独运行：
+    python -m bench.bench_speculative --hidden_size 256 --num_layers 4 --draft_layers 1
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+
+import torch
+
+from bench.bench_inference import _count_new_tokens
+from bench.common import MemoryMonitor, build_tiny_checkpoint, percentiles, sample_inputs, setup_import_paths, timed
+
+MODES = ("off", "prompt_lookup", "draft_model")
+
+def build_draft_checkpoint(base_path, root, num_layers=1):
+    """截取基础模型的前 num_layers 层作为草稿模型，返回保存路径"""
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    draft_path = os.path.join(root, "draft")
+    model = AutoModelForCausalLM.from_pretrained(base_path)
+    model.model.layers = model.model.layers[:num_layers]
+    model.config.num_hidden_layers = num_layers
+    if getattr(model.config, "layer_types", None):
+        model.config.layer_types = model.config.layer_types[:num_layers]
+    model.save_pretrained(draft_path)
+    AutoTokenizer.from_pretrained(base_path).save_pretrained(draft_path)
+    return draft_path
+
+def load_speculative_model(base_path, lora_path, mode, draft_path=None, num_draft_tokens=4):
+    from app.config import Config
+    from app.chat_model import LoraChatModel
+
+    Config.BASE_MODEL_PATH = base_path
+    Config.LORA_CHECKPOINT_PATH = lora_path
+    Config.LORA_ADAPTERS = {}
+    Config.MERGE_LORA = False
+    Config.ENABLE_BATCHING = False
+    Config.CPU_QUANTIZATION = None
+    Config.SPECULATIVE_DECODING = None if mode == "off" else mode
+    Config.DRAFT_MODEL_PATH = draft_path
+    Config.NUM_DRAFT_TOKENS = num_draft_tokens
+    chat_model = LoraChatModel()
+    chat_model.load_model()
+    return chat_model
+
+def run(base_path, lora_path, seq_len=256, max_new_tokens=32, repeats=5, draft_layers=1, num_draft_tokens=4):
+    setup_import_paths()
+    from app.metrics import MetricsRegistry, RequestTrace
+
+    results = []
+    baseline_ms = None
+    with tempfile.TemporaryDirectory() as root:
+        draft_path = build_draft_checkpoint(base_path, root, draft_layers)
+        for mode in MODES:
+            chat_model = load_speculative_model(base_path, lora_path, mode, draft_path, num_draft_tokens)
+            tokenizer = chat_model.tokenizer
+            message = ""
+            base = "；".join(sample_inputs(8))
+            while len(tokenizer(chat_model._build_correct_prompt(message, []))["input_ids"]) < seq_len:
+                message += base[len(message) % len(base)]
+            prompt = chat_model._build_correct_prompt(message, [])
+
+            torch.manual_seed(0)
+            chat_model._generate_batch([prompt], [0.7], [max_new_tokens])  # 预热
+            latencies, new_tokens = [], 0
+            drafted = accepted = target_steps = spec_tokens = 0
+            with MemoryMonitor() as memory:
+                for _ in range(repeats):
+                    trace = RequestTrace("bench", registry=MetricsRegistry())
+                    outputs, elapsed = timed(chat_model._generate_batch, [prompt], [0.7], [max_new_tokens], trace=trace)
+                    latencies.append(elapsed)
+                    new_tokens += _count_new_tokens(tokenizer, prompt, outputs[0])
+                    if trace.speculative is not None:
+                        drafted += trace.speculative[0]
+                        accepted += trace.speculative[1]
+                        target_steps += trace.speculative[2]
+                        spec_tokens += trace.speculative[2] * trace.speculative[3]
+
+            latency = percentiles(latencies)
+            if mode == "off":
+                baseline_ms = latency["mean"]
+            results.append({
+                "suite": "speculative",
+                "case": f"spec_{mode}",
+                "batch_size": 1,
+                "seq_len": seq_len,
+                "max_new_tokens": max_new_tokens,
+                "num_draft_tokens": None if mode == "off" else num_draft_tokens,
+                "latency_ms": latency,
+                "tokens_per_s": round(new_tokens / (sum(latencies) / 1000), 2),
+                "acceptance_rate": round(accepted / drafted, 4) if drafted else None,
+                "tokens_per_target_step": round(spec_tokens / target_steps, 3) if target_steps else None,
+                "speedup": round(baseline_ms / latency["mean"], 3) if baseline_ms else None,
+                **memory.as_dict(),
+            })
+            del chat_model
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="投机解码对比：逐 token / prompt 查表 / 小模型草稿")
+    parser.add_argument("--hidden_size", type=int, default=256)
+    parser.add_argument("--num_layers", type=int, default=4)
+    parser.add_argument("--draft_layers", type=int, default=1)
+    parser.add_argument("--num_draft_tokens", type=int, default=4)
+    parser.add_argument("--seq_len", type=int, default=256)
+    parser.add_argument("--max_new_tokens", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", type=str, default=None, help="结果 JSON 路径")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("app").setLevel(logging.ERROR)
+    setup_import_paths()
+    with tempfile.TemporaryDirectory() as root:
+        base_path, lora_path = build_tiny_checkpoint(root, args.hidden_size, args.num_layers)
+        results = run(base_path, lora_path, args.seq_len, args.max_new_tokens, args.repeats,
+                      args.draft_layers, args.num_draft_tokens)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"{'case':<20}{'tok/s':>10}{'p50 ms':>10}{'accept':>9}{'tok/step':>10}{'speedup':>9}")
+    for r in results:
+        print(f"{r['case']:<20}{r['tokens_per_s']:>10.1f}{r['latency_ms']['p50']:>10.1f}"
+              f"{r['acceptance_rate'] if r['acceptance_rate'] is not None else '-':>9}"
+              f"{r['tokens_per_target_step'] or '-':>10}{r['speedup'] or '-':>9}")
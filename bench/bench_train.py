@@ -0,0 +1,102 @@
+# bench/bench_train.py
+"""
+训练基准：预处理分词（tokenize_texts）-> 内存映射数据集 -> collator -> AdGenTrainer.compute_loss 前向反向 + 优化器一步
+分别测 padding 与序列打包两种组 batch 方式
+"""
+import os
+import random
+import tempfile
+
+import torch
+from peft import LoraConfig, get_peft_model
+from transformers import AutoModelForCausalLM, AutoTokenizer, TrainingArguments
+
+from bench.common import MemoryMonitor, percentiles, sample_inputs, timed
+
+def _build_dataset(tokenizer, data_dir, seq_len, num_samples, seed=0):
+    """合成 AdGen 样本：真实的 prompt 模板 + 随机长度的回复，每条截断到 seq_len"""
+    from process_data import SYSTEM_PROMPT, build_prompt, tokenize_texts
+    from token_dataset import MemmapTokenDataset, TokenFileWriter
+
+    rng = random.Random(seed)
+    inputs = sample_inputs(num_samples)
+    prompts = [build_prompt(SYSTEM_PROMPT, text) for text in inputs]
+    filler = "这款裙子采用轻盈雪纺面料，清新碎花点缀，穿上显瘦又有气质。"
+    responses = [filler * rng.randint(1, max(1, seq_len // 30)) + "<|eot_id|>" for _ in inputs]
+
+    with TokenFileWriter(data_dir) as writer:
+        for input_ids, label_start in tokenize_texts(tokenizer, prompts, responses):
+            writer.add(input_ids[:seq_len], min(label_start, seq_len - 1))
+    return MemmapTokenDataset(data_dir)
+
+def _train_steps(base_path, dataset, collator, batch_size, steps, sample_batches):
+    from train import AdGenTrainer
+
+    model = AutoModelForCausalLM.from_pretrained(base_path, torch_dtype=torch.float32)
+    model.config.use_cache = False
+    model = get_peft_model(model, LoraConfig(
+        r=8, lora_alpha=16, target_modules=["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"]
+    ))
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model.to(device).train()
+    with tempfile.TemporaryDirectory() as output_dir:
+        args = TrainingArguments(output_dir=output_dir, report_to=[], use_cpu=device == "cpu")
+        trainer = AdGenTrainer(model=model, args=args, label_only_logits=True, loss_chunk_size=1024)
+    optimizer = torch.optim.AdamW([p for p in model.parameters() if p.requires_grad], lr=1e-4)
+
+    def step(batch):
+        loss = trainer.compute_loss(model, batch)
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+
+    batches = []
+    for indices in sample_batches(batch_size, steps + 1):
+        batch = collator([dataset[i] for i in indices])
+        batches.append({k: v.to(device) for k, v in batch.items()})
+
+    step(batches[0])  # 预热
+    latencies, tokens = [], 0
+    with MemoryMonitor() as memory:
+        for batch in batches[1:]:
+            _, elapsed = timed(step, batch)
+            latencies.append(elapsed)
+            # 有效 token：padding 模式看 attention_mask，打包模式看非填充位置
+            if "attention_mask" in batch:
+                tokens += int(batch["attention_mask"].sum())
+            else:
+                tokens += int((batch["input_ids"] != collator.pad_token_id).sum())
+    return latencies, tokens, memory
+
+def run(base_path, batch_sizes, seq_lens, steps=5):
+    from token_dataset import PackedCollator, PackedTokenDataset, PaddingCollator
+
+    tokenizer = AutoTokenizer.from_pretrained(base_path)
+    results = []
+    for seq_len in seq_lens:
+        with tempfile.TemporaryDirectory() as data_dir:
+            num_samples = max(batch_sizes) * (steps + 1) * 4
+            dataset = _build_dataset(tokenizer, os.path.join(data_dir, "tokens"), seq_len, num_samples)
+            packed = PackedTokenDataset(dataset, seq_len)
+            modes = {
+                "padded": (dataset, PaddingCollator(tokenizer.pad_token_id)),
+                "packed": (packed, PackedCollator(tokenizer.pad_token_id)),
+            }
+            for mode, (data, collator) in modes.items():
+                def sample_batches(batch_size, count, data=data):
+                    rng = random.Random(0)
+                    return [[rng.randrange(len(data)) for _ in range(batch_size)] for _ in range(count)]
+
+                for batch_size in batch_sizes:
+                    torch.manual_seed(0)
+                    latencies, tokens, memory = _train_steps(base_path, data, collator, batch_size, steps, sample_batches)
+                    results.append({
+                        "suite": "train",
+                        "case": mode,
+                        "batch_size": batch_size,
+                        "seq_len": seq_len,
+                        "latency_ms": percentiles(latencies),
+                        "tokens_per_s": round(tokens / (sum(latencies) / 1000), 2),
+                        **memory.as_dict(),
+                    })
+    return results
@@ -0,0 +1,180 @@
+# bench/common.py
+"""
+基准测试公共工具：小型随机 Llama 模型构造、计时与内存统计
+
+所有基准都在一个极小的随机 Llama（默认 2 层、hidden 64）上运行，CPU 即可完成，
+用于发现代码路径上的性能回归，而不是衡量 8B 模型的绝对性能。
+"""
+import os
+import resource
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+import torch
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(REPO_ROOT, "src")
+
+# Llama-3 的特殊 token，小模型的分词器沿用同样的模板
+SPECIAL_TOKENS = [
+    "<|begin_of_text|>", "<|end_of_text|>", "<|start_header_id|>", "<|end_header_id|>", "<|eot_id|>"
+]
+
+def setup_import_paths():
+    """
+    训练侧脚本用 `from process_data import ...`，服务侧模块用 `from app.xxx import ...`（部署时 src 即 app 包），
+    这里把 src 同时注册为顶层路径和 app 包，两类模块都能直接导入。
+    """
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
+    if "app" not in sys.modules:
+        package = types.ModuleType("app")
+        package.__path__ = [SRC_DIR]
+        sys.modules["app"] = package
+
+def build_tiny_tokenizer():
+    """字节级 BPE 分词器（无合并规则），任意中英文文本都能编码，模板与 Llama-3 一致"""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, processors
+    from transformers import PreTrainedTokenizerFast
+
+    byte_chars = pre_tokenizers.ByteLevel.alphabet()
+    vocab = {token: i for i, token in enumerate(SPECIAL_TOKENS)}
+    for char in sorted(byte_chars):
+        vocab[char] = len(vocab)
+
+    tokenizer = Tokenizer(models.BPE(vocab=vocab, merges=[]))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="<|begin_of_text|> $A", special_tokens=[("<|begin_of_text|>", 0)]
+    )
+    tokenizer.add_special_tokens(SPECIAL_TOKENS)
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        bos_token="<|begin_of_text|>",
+        eos_token="<|eot_id|>",
+        pad_token="<|eot_id|>",
+    )
+
+def build_tiny_model(vocab_size, hidden_size=64, num_layers=2, seed=0):
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=vocab_size,
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=num_layers,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=4096,
+        bos_token_id=0,
+        eos_token_id=SPECIAL_TOKENS.index("<|eot_id|>"),
+        pad_token_id=SPECIAL_TOKENS.index("<|eot_id|>"),
+    )
+    return LlamaForCausalLM(config).eval()
+
+def build_tiny_checkpoint(root, hidden_size=64, num_layers=2):
+    """在 root 下保存小模型（base/）和随机初始化的 LoRA 适配器（lora/），返回两个路径"""
+    from peft import LoraConfig, get_peft_model
+
+    base_path = os.path.join(root, "base")
+    lora_path = os.path.join(root, "lora")
+    tokenizer = build_tiny_tokenizer()
+    model = build_tiny_model(len(tokenizer), hidden_size, num_layers)
+    model.save_pretrained(base_path)
+    tokenizer.save_pretrained(base_path)
+
+    lora_config = LoraConfig(
+        r=8,
+        lora_alpha=16,
+        target_modules=["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"],
+        init_lora_weights=False,
+    )
+    get_peft_model(model, lora_config).save_pretrained(lora_path)
+    return base_path, lora_path
+
+def percentiles(values_ms):
+    if not values_ms:
+        return None
+    values = np.asarray(values_ms, dtype=np.float64)
+    return {
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "mean": round(float(values.mean()), 3),
+    }
+
+def _current_rss_bytes():
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # 非 Linux 平台退回进程级峰值（单位 KB，macOS 为字节，这里只做粗略参考）
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class MemoryMonitor:
+    """
+    在代码块内统计峰值 RSS 与设备显存
+    RSS 由后台线程定时采样（进程级 ru_maxrss 无法按用例重置）
+    """
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_device = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, _current_rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+        self.peak_rss = _current_rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, _current_rss_bytes())
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+            self.peak_device = torch.cuda.max_memory_allocated()
+
+    def as_dict(self):
+        return {
+            "peak_rss_mb": round(self.peak_rss / 2 ** 20, 1),
+            "peak_device_mb": None if self.peak_device is None else round(self.peak_device / 2 ** 20, 1),
+        }
+
+def timed(fn, *args, **kwargs):
+    """返回 (结果, 耗时毫秒)"""
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return result, (time.perf_counter() - start) * 1000
+
+# 合成的 AdGen 属性输入，覆盖不同长度
+SAMPLE_CONTENTS = [
+    "类型#裤*版型#宽松*风格#性感*图案#线条*裤型#阔腿裤",
+    "类型#上衣*材质#牛仔布*颜色#白色*风格#简约*图案#刺绣*衣样式#外套*衣款式#破洞",
+    "类型#口红*质地#丝绒*功效#显白*场景#约会",
+    "类型#裙*材质#雪纺*颜色#淡紫色*风格#清新*图案#碎花*裙型#a字*裙长#连衣裙*裙袖长#短袖*裙领型#圆领",
+]
+
+def sample_inputs(n):
+    from process_data import parse_adgen_content
+    return [parse_adgen_content(SAMPLE_CONTENTS[i % len(SAMPLE_CONTENTS)]) for i in range(n)]
@@ -0,0 +1,153 @@
+# bench/reference_cleaning.py
+"""
+回复清理的参考实现：原 LoraChatModel 中逐条 re.sub 的清理方法，逐字保留（只去掉 self 与日志）
+
+黄金语料 bench/golden/response_cleaning.jsonl 由这里生成，app/response_cleaning.py 必须与之逐字一致。
+清理规则有意调整时，先改这里，再重新生成黄金语料。
+"""
+import re
+
+
+def extract_clean_response(full_response, prompt, current_question):
+    """专门为当前问题提取干净的回复"""
+    # 确保只提取当前问题的回答
+    if full_response.startswith(prompt):
+        response_content = full_response[len(prompt):].strip()
+    else:
+        # 如果格式不匹配，尝试其他提取方法
+        response_content = extract_by_current_question(full_response, current_question)
+
+    # 彻底清理回复 - 特别加强assistant开头的清理
+    clean_content = aggressive_clean(response_content)
+
+    # 新增：专门处理以assistant开头的情况
+    clean_content = remove_assistant_prefix(clean_content)
+
+    return clean_content
+
+
+def remove_assistant_prefix(text):
+    """专门移除assistant相关前缀"""
+    if not text:
+        return text
+
+    # 定义需要移除的assistant前缀模式
+    assistant_prefixes = [
+        r'^(assistant|Assistant|ASSISTANT)[:\s]*',
+        r'^(助手|AI助手|AI助理|机器人)[：:\s]*',
+        r'^(好的|明白了|根据您的问题|针对这个问题|关于这个问题)[，,\s]*',
+        r'^[Aa]ssistant\s+is\s+',
+        r'^[Aa]ssistant\s*[：:]\s*'
+    ]
+
+    for prefix in assistant_prefixes:
+        text = re.sub(prefix, '', text, flags=re.IGNORECASE)
+
+    return text.strip()
+
+
+def extract_by_current_question(text, current_question):
+    """根据当前问题特征提取回复"""
+    # 查找最后一个assistant标记后的内容
+    markers = [
+        "<|start_header_id|>assistant<|end_header_id|>",
+        "assistant:",
+        "Assistant:",
+        "助手:",
+        "助手："
+    ]
+
+    for marker in markers:
+        if marker in text:
+            parts = text.split(marker)
+            if len(parts) > 1:
+                # 取最后一个assistant标记后的内容
+                content = parts[-1].strip()
+                # 去除所有特殊标记
+                content = re.sub(r'<\|.*?\|>', '', content)
+                # 移除assistant前缀
+                content = remove_assistant_prefix(content)
+                return content
+
+    # 如果找不到标记，尝试基于问题内容提取
+    if current_question in text:
+        parts = text.split(current_question)
+        if len(parts) > 1:
+            content = parts[-1].strip()
+            content = remove_assistant_prefix(content)
+            return content
+
+    # 最终清理
+    content = text.strip()
+    content = remove_assistant_prefix(content)
+    return content
+
+
+def aggressive_clean(text):
+    """加强版的清理回复内容"""
+    if not text:
+        return text
+
+    # 首先移除assistant相关前缀
+    text = remove_assistant_prefix(text)
+
+    # 去除所有特殊标记
+    patterns_to_remove = [
+        r'<\|start_header_id\|>.*?<\|end_header_id\|>',
+        r'<\|eot_id\|>',
+        r'<\|.*?\|>',
+        r'\[.*?\]',
+        r'\(.*?\)'
+    ]
+
+    for pattern in patterns_to_remove:
+        text = re.sub(pattern, '', text, flags=re.DOTALL)
+
+    # 去除常见的不必要前缀
+    prefixes_to_remove = [
+        r'^(好的|根据|针对|关于|这件|这款|这是一个|首先|那么|另外)[，,]\s*',
+        r'^[\"\'「」【】\[\]\(\)]\s*',
+        r'^(嗯|啊|呃|那个|这个)[，,]\s*',
+        r'^(那么|接下来|此外|另外)[，,]\s*'
+    ]
+
+    for prefix in prefixes_to_remove:
+        text = re.sub(prefix, '', text, flags=re.IGNORECASE)
+
+    # 清理多余的空格和换行
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\n+', '\n', text)
+    text = text.strip()
+
+    # 确保不以标点符号开头
+    if text and text[0] in '，,.:：；;!！?？':
+        text = text[1:].strip()
+
+    return text
+
+
+def is_response_relevant(response, question):
+    """检查回复是否与当前问题相关"""
+    if not response or not question:
+        return False
+
+    # 简单的关键词匹配检查
+    question_keywords = extract_keywords(question)
+    response_keywords = extract_keywords(response)
+
+    # 如果有共同关键词，认为相关
+    common_keywords = set(question_keywords) & set(response_keywords)
+    return len(common_keywords) > 0 or len(response) > 10  # 或者回复长度大于10也认为相关
+
+
+def extract_keywords(text):
+    """提取文本中的关键词"""
+    if not text:
+        return []
+
+    # 简单的关键词提取
+    words = re.findall(r'[\u4e00-\u9fa5a-zA-Z0-9]+', text)
+    # 过滤掉常见虚词
+    stop_words = {'的', '了', '是', '在', '有', '和', '就', '都', '而', '及', '与', '这', '那', '你', '我', '他', '她', '它'}
+    keywords = [word for word in words if word not in stop_words and len(word) > 1]
+    return keywords
@@ -0,0 +1,158 @@
+# bench/run.py
+"""
+性能基准入口：在小型随机 Llama 上跑推理 / 训练 / 评测三组基准（另有 CPU 量化、投机解码、突发并发对比与不依赖模型的回复清理微基准），结果写成 JSON，可与基线对比
+
+用法:
+    python -m bench.run --output bench/results/latest.json
+    python -m bench.run --quick --compare bench/results/baseline.json --tolerance 0.2
+
+对比时以 (suite, case, batch_size, seq_len) 匹配用例，tokens_per_s / samples_per_s / requests_per_s 下降
+或 p95 延迟上升超过 tolerance 即视为回归，进程以非 0 状态退出，便于在 CI 中使用。
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.common import REPO_ROOT, build_tiny_checkpoint, setup_import_paths
+
+setup_import_paths()
+
+import torch  # noqa: E402
+import transformers  # noqa: E402
+
+SUITES = ("inference", "train", "eval", "cleaning", "quant", "speculative", "concurrency")
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _case_key(result):
+    return result["suite"], result["case"], result["batch_size"], result["seq_len"]
+
+def compare(results, baseline, tolerance):
+    """返回回归列表 [(用例, 指标, 基线值, 当前值)]"""
+    baseline_by_key = {_case_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        base = baseline_by_key.get(_case_key(result))
+        if base is None:
+            continue
+        for metric in ("tokens_per_s", "samples_per_s", "requests_per_s"):
+            if result.get(metric) and base.get(metric) and result[metric] < base[metric] * (1 - tolerance):
+                regressions.append((_case_key(result), metric, base[metric], result[metric]))
+        if result.get("latency_ms") and base.get("latency_ms"):
+            if result["latency_ms"]["p95"] > base["latency_ms"]["p95"] * (1 + tolerance):
+                regressions.append((_case_key(result), "latency_ms.p95", base["latency_ms"]["p95"], result["latency_ms"]["p95"]))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="训练 / 推理 / 评测性能基准")
+    parser.add_argument("--suites", type=str, default=",".join(SUITES), help="逗号分隔: inference,train,eval,cleaning,quant,speculative,concurrency")
+    parser.add_argument("--batch_sizes", type=str, default="1,4,8")
+    parser.add_argument("--seq_lens", type=str, default="256,512", help="prompt（推理）或样本（训练）长度")
+    parser.add_argument("--max_new_tokens", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=5, help="推理每个用例的重复次数 / 训练步数")
+    parser.add_argument("--hidden_size", type=int, default=64)
+    parser.add_argument("--num_layers", type=int, default=2)
+    parser.add_argument("--quick", action="store_true", help="缩小用例矩阵，适合 CI")
+    parser.add_argument("--output", type=str, default=os.path.join(REPO_ROOT, "bench", "results", "latest.json"))
+    parser.add_argument("--compare", type=str, default=None, help="基线 JSON，对比并在回归时返回非 0")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的相对退化比例")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("app").setLevel(logging.ERROR)  # 随机模型的回复必然"不相关"，屏蔽清理逻辑的告警
+    batch_sizes = [int(x) for x in args.batch_sizes.split(",")]
+    seq_lens = [int(x) for x in args.seq_lens.split(",")]
+    if args.quick:
+        batch_sizes, seq_lens, args.repeats = batch_sizes[:2], seq_lens[:1], min(args.repeats, 3)
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"未知的基准: {', '.join(sorted(unknown))}")
+
+    torch.set_num_threads(max(1, torch.get_num_threads()))
+    results = []
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as root:
+        if set(suites) & {"inference", "train", "eval", "quant", "speculative", "concurrency"}:
+            base_path, lora_path = build_tiny_checkpoint(root, args.hidden_size, args.num_layers)
+        if "inference" in suites:
+            from bench import bench_inference
+            print("🔄 推理基准 ...")
+            results += bench_inference.run(base_path, lora_path, batch_sizes, seq_lens, args.max_new_tokens, args.repeats)
+        if "train" in suites:
+            from bench import bench_train
+            print("🔄 训练基准 ...")
+            results += bench_train.run(base_path, batch_sizes, seq_lens, args.repeats)
+        if "eval" in suites:
+            from bench import bench_eval
+            print("🔄 评测基准 ...")
+            results += bench_eval.run(base_path, lora_path, batch_sizes, args.max_new_tokens)
+        if "cleaning" in suites:
+            from bench import bench_cleaning
+            print("🔄 回复清理基准 ...")
+            results += bench_cleaning.run(max(args.repeats, 10))
+        if "quant" in suites:
+            from bench import bench_quant
+            print("🔄 CPU 量化推理基准 ...")
+            results += bench_quant.run(base_path, lora_path, seq_lens[0], args.max_new_tokens, args.repeats)
+        if "speculative" in suites:
+            from bench import bench_speculative
+            print("🔄 投机解码基准 ...")
+            results += bench_speculative.run(base_path, lora_path, seq_lens[0], args.max_new_tokens, args.repeats)
+        if "concurrency" in suites:
+            from bench import bench_concurrency
+            print("🔄 突发并发基准 ...")
+            num_users = 20 if args.quick else 100
+            results += bench_concurrency.run(base_path, lora_path, num_users, max_new_tokens=min(args.max_new_tokens, 16))
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+            "device": torch.cuda.get_device_name(0) if torch.cuda.is_available() else platform.processor() or "cpu",
+            "num_threads": torch.get_num_threads(),
+            "model": {"hidden_size": args.hidden_size, "num_layers": args.num_layers},
+            "args": vars(args),
+            "elapsed_s": round(time.perf_counter() - start, 1),
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"{'suite':<13}{'case':<22}{'bs':>6}{'seq':>6}{'tok/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'rss MB':>9}")
+    for r in results:
+        latency = r.get("latency_ms") or r.get("hit_latency_ms") or {}
+        print(f"{r['suite']:<13}{r['case']:<22}{r['batch_size']:>6}{str(r['seq_len'] or '-'):>6}"
+              f"{r.get('tokens_per_s') or r.get('samples_per_s') or r.get('requests_per_s') or 0:>12.1f}"
+              f"{latency.get('p50', 0):>10.1f}{latency.get('p95', 0):>10.1f}{r['peak_rss_mb']:>9.1f}")
+    print(f"✅ 结果已保存: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for key, metric, base, current in regressions:
+            print(f"❌ 回归 {key} {metric}: {base} -> {current}")
+        if regressions:
+            return 1
+        print("✅ 未发现性能回归")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
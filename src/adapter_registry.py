@@ -0,0 +1,124 @@
+# app/adapter_registry.py
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from peft import PeftModel
+
+logger = logging.getLogger(__name__)
+
+
+class AdapterRegistry:
+    """多 LoRA 适配器注册表
+
+    多个适配器共享同一个基础模型，按名称加载到同一个 PeftModel 上：
+    - 常驻显存的适配器数量受 max_resident 限制，超出时按 LRU 卸载未在使用中的适配器；
+    - 每次生成前 acquire 所需适配器，生成结束后 release，使用中的适配器不会被卸载；
+    - register 可以在运行时新增或替换（热更新）适配器，替换成功后回调 on_replace(name)，
+      调用方据此丢弃按适配器区分的缓存（前缀 KV、回复缓存）。
+    """
+
+    def __init__(self, adapter_paths, max_resident=4):
+        self.adapter_paths = dict(adapter_paths)
+        self.max_resident = max(1, int(max_resident))
+        self.model = None
+        self._resident = OrderedDict()   # 已加载的适配器名称 -> 正在使用它的请求数
+        self._lock = threading.RLock()
+        self.on_replace = None
+
+    @property
+    def names(self):
+        return list(self.adapter_paths)
+
+    @property
+    def resident(self):
+        return list(self._resident)
+
+    def attach(self, base_model, default_name):
+        """在基础模型上加载默认适配器，返回 PeftModel"""
+        with self._lock:
+            self.model = PeftModel.from_pretrained(
+                base_model, self.adapter_paths[default_name], adapter_name=default_name
+            )
+            self.model.eval()
+            self._resident[default_name] = 0
+            logger.info(f"✅ LoRA适配器 [{default_name}] 加载成功")
+            return self.model
+
+    def register(self, name, path):
+        """注册或替换适配器；已加载的同名适配器立即换成新权重，加载失败时保持旧路径和旧权重不变"""
+        with self._lock:
+            replaced = name in self.adapter_paths and self.adapter_paths[name] != path
+            if replaced and self._resident.get(name, 0) > 0:
+                raise RuntimeError(f"适配器 [{name}] 正在使用中，无法替换")
+            if replaced and name in self._resident:
+                self._swap(name, path)
+            self.adapter_paths[name] = path
+            if replaced and self.on_replace is not None:
+                self.on_replace(name)
+            logger.info(f"注册LoRA适配器 [{name}]: {path}")
+
+    def _swap(self, name, path):
+        """
+        把已加载的适配器换成 path 的权重
+        先以临时名称加载新权重：加载失败时旧权重不受影响，且 PeftModel 始终至少保留一个适配器
+        （只常驻一个适配器时也能替换）；随后删除旧适配器、以原名称重新加载，再删除临时适配器。
+        """
+        staging = f"{name}__staging"
+        self.model.load_adapter(path, adapter_name=staging)
+        self.model.delete_adapter(name)
+        del self._resident[name]
+        self.model.load_adapter(path, adapter_name=name)
+        self._resident[name] = 0
+        self.model.delete_adapter(staging)
+        logger.info(f"替换LoRA适配器 [{name}]: {path}")
+
+    def _load(self, name):
+        if name not in self.adapter_paths:
+            raise KeyError(f"未注册的LoRA适配器: {name}")
+        logger.info(f"加载LoRA适配器 [{name}]...")
+        self.model.load_adapter(self.adapter_paths[name], adapter_name=name)
+        self._resident[name] = 0
+
+    def _unload(self, name):
+        # PeftModel 至少要保留一个适配器
+        if len(self._resident) <= 1:
+            return
+        self.model.delete_adapter(name)
+        del self._resident[name]
+        logger.info(f"卸载LoRA适配器 [{name}]")
+
+    def _evict(self):
+        """超出常驻上限时按 LRU 卸载空闲的适配器"""
+        for name in list(self._resident):
+            if len(self._resident) <= self.max_resident:
+                break
+            if self._resident[name] == 0:
+                self._unload(name)
+
+    def acquire(self, names):
+        """确保适配器已加载并标记为使用中"""
+        with self._lock:
+            for name in names:
+                if name not in self._resident:
+                    self._load(name)
+                self._resident[name] += 1
+                self._resident.move_to_end(name)
+            self._evict()
+
+    def release(self, names):
+        with self._lock:
+            for name in names:
+                if name in self._resident:
+                    self._resident[name] -= 1
+            self._evict()
+
+    @contextmanager
+    def using(self, names):
+        """with registry.using(names): 在代码块内保证这些适配器常驻"""
+        self.acquire(names)
+        try:
+            yield
+        finally:
+            self.release(names)
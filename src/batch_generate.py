@@ -0,0 +1,144 @@
+# app/batch_generate.py
+"""
+离线批量生成广告文案
+
+输入为 JSONL，每行一个 AdGen 属性串（如 {"content": "类型#裤*版型#宽松*风格#性感"}），
+按长度排序后分批生成，结果逐批追加写入输出 JSONL。
+中断后使用相同参数重新运行，会跳过输出文件中已完成的行继续生成。
+
+用法: python -m app.batch_generate --input ./data/skus.jsonl --output ./results/skus_copy.jsonl
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+from tqdm import tqdm
+
+from app.chat_model import LoraChatModel
+from app.process_data import SYSTEM_PROMPT, build_prompt, parse_adgen_content
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_inputs(input_path, field="content"):
+    """读取输入 JSONL，返回 [(行号, 原始属性串)]，无法解析的行跳过"""
+    items = []
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for index, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"第 {index} 行不是合法 JSON，已跳过")
+                continue
+            content = record if isinstance(record, str) else record.get(field, "")
+            if content:
+                items.append((index, content))
+    return items
+
+
+def load_completed(output_path):
+    """读取已完成的行号；末尾被中断写了一半的行会被截掉"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+
+    with open(output_path, 'rb+') as f:
+        data = f.read()
+        valid_end = data.rfind(b"\n") + 1
+        if valid_end < len(data):
+            f.truncate(valid_end)
+
+    for line in data[:valid_end].decode('utf-8').splitlines():
+        try:
+            completed.add(json.loads(line)["index"])
+        except (json.JSONDecodeError, KeyError):
+            continue
+    return completed
+
+
+def batch_generate(input_path, output_path, field="content", batch_size=16,
+                   temperature=0.7, max_new_tokens=256, adapter=None):
+    chat_model = LoraChatModel()
+    chat_model.load_model()
+    tokenizer = chat_model.tokenizer
+
+    items = load_inputs(input_path, field)
+    completed = load_completed(output_path)
+    pending = []
+    for index, content in items:
+        if index in completed:
+            continue
+        parsed_input = parse_adgen_content(content)
+        if not parsed_input:
+            continue
+        pending.append((index, content, parsed_input, build_prompt(SYSTEM_PROMPT, parsed_input)))
+
+    logger.info(f"共 {len(items)} 条输入，已完成 {len(completed)} 条，本次生成 {len(pending)} 条")
+    if not pending:
+        return
+
+    # 按 prompt 长度排序，同批样本长度接近，减少左填充浪费；长样本在前，显存不足会尽早暴露
+    lengths = [len(ids) for ids in tokenizer([item[3] for item in pending])["input_ids"]]
+    order = sorted(range(len(pending)), key=lambda i: lengths[i], reverse=True)
+    pending = [pending[i] for i in order]
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    total_samples, total_tokens = 0, 0
+    start = time.perf_counter()
+
+    with open(output_path, 'a', encoding='utf-8') as f, tqdm(total=len(pending), desc="Generating") as bar:
+        for i in range(0, len(pending), batch_size):
+            batch = pending[i:i + batch_size]
+            results = chat_model.generate_batch(
+                [item[3] for item in batch],
+                [item[2] for item in batch],
+                temperature=temperature,
+                max_new_tokens=max_new_tokens,
+                adapter=adapter
+            )
+
+            # tokens/s 按实际生成的 token 数统计，不再对清理后的文本重新分词
+            for (index, content, parsed_input, prompt), (text, generated) in zip(batch, results):
+                total_tokens += generated
+                record = {"index": index, "content": content, "input": parsed_input, "output": text}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+
+            total_samples += len(batch)
+            elapsed = time.perf_counter() - start
+            bar.update(len(batch))
+            bar.set_postfix(samples_s=f"{total_samples / elapsed:.2f}", tokens_s=f"{total_tokens / elapsed:.1f}")
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"✅ 生成完成: {total_samples} 条, 耗时 {elapsed:.1f}s, "
+        f"{total_samples / elapsed:.2f} samples/s, {total_tokens / elapsed:.1f} tokens/s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AdGen 属性批量生成广告文案")
+    parser.add_argument("--input", type=str, required=True, help="输入 JSONL 文件，每行一个属性串")
+    parser.add_argument("--output", type=str, required=True, help="输出 JSONL 文件，已存在时从断点继续")
+    parser.add_argument("--field", type=str, default="content", help="属性串所在字段")
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--max_new_tokens", type=int, default=256)
+    parser.add_argument("--adapter", type=str, default=None, help="使用的 LoRA 适配器名称")
+
+    args = parser.parse_args()
+    batch_generate(
+        args.input,
+        args.output,
+        field=args.field,
+        batch_size=args.batch_size,
+        temperature=args.temperature,
+        max_new_tokens=args.max_new_tokens,
+        adapter=args.adapter
+    )
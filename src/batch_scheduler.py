@@ -0,0 +1,128 @@
+# app/batch_scheduler.py
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class ChatRequest:
+    """一条待生成的请求"""
+
+    def __init__(self, prompt, temperature, max_new_tokens, adapter=None):
+        self.prompt = prompt
+        self.temperature = temperature
+        self.max_new_tokens = max_new_tokens
+        self.adapter = adapter
+        self.future = Future()
+
+
+class BatchScheduler:
+    """动态批处理调度器
+
+    在 max_wait_ms 时间窗口内收集并发请求，最多凑满 max_batch_size 条，
+    交给 generate_fn 一次性生成，再把每条结果分别回传给各自的调用方。
+
+    generate_fn(prompts, temperatures, max_new_tokens, adapters) -> List[str]
+    adapters 为每条请求指定的 LoRA 适配器名称（None 表示默认适配器），
+    不同适配器的请求也可以在同一批中一次前向完成。
+    """
+
+    def __init__(self, generate_fn, max_batch_size=8, max_wait_ms=10):
+        self.generate_fn = generate_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动后台调度线程（重复调用无副作用）"""
+        with self._lock:
+            self._stopped.clear()
+            self._start_locked()
+
+    def _start_locked(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._thread.start()
+        logger.info(f"批处理调度器已启动: max_batch_size={self.max_batch_size}, max_wait={self.max_wait * 1000:.0f}ms")
+
+    def stop(self):
+        """停止调度线程，未处理的请求以异常结束"""
+        # 持锁设置停止标志：此后 submit 不会再入队，下面清空队列时不会漏掉请求
+        with self._lock:
+            self._stopped.set()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            request.future.set_exception(RuntimeError("批处理调度器已停止"))
+
+    def submit(self, prompt, temperature, max_new_tokens, adapter=None):
+        """提交一条请求，返回 Future，结果为生成的文本"""
+        request = ChatRequest(prompt, temperature, max_new_tokens, adapter)
+        # 检查停止标志与入队在同一把锁内完成，避免 stop() 清空队列后才入队、Future 永远不返回
+        with self._lock:
+            if self._stopped.is_set():
+                raise RuntimeError("批处理调度器已停止")
+            self._start_locked()
+            self._queue.put(request)
+        return request.future
+
+    def _collect_batch(self):
+        """阻塞等待第一条请求，随后在等待窗口内尽量凑满一批"""
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        # 窗口结束后队列里已经到达的请求也一并带上，不再额外等待
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            logger.debug(f"合并 {len(batch)} 条请求进行批量生成")
+
+            try:
+                results = self.generate_fn(
+                    [r.prompt for r in batch],
+                    [r.temperature for r in batch],
+                    [r.max_new_tokens for r in batch],
+                    [r.adapter for r in batch]
+                )
+            except Exception as e:
+                logger.error(f"批量生成失败 (batch_size={len(batch)}): {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
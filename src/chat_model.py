@@ -1,23 +1,247 @@
 # app/chat_model.py
-import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 import torch
 from modelscope import AutoModelForCausalLM, AutoTokenizer
 from peft import PeftModel, PeftConfig
+from transformers import (
+    LogitsProcessor,
+    LogitsProcessorList,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextIteratorStreamer,
+    TopKLogitsWarper,
+    TopPLogitsWarper
+)
 import logging
 import os
 from app.config import Config
+from app.batch_scheduler import BatchScheduler
+from app.continuous_batching import ContinuousBatchingEngine
+from app.prefix_cache import PrefixKVCache
+from app.response_cache import ResponseCache, response_cache_key
+from app.model_cache import cached_model_dir, model_fingerprint, save_model_to_cache
+from app.adapter_registry import AdapterRegistry
+from app.weight_loader import ShardedWeightLoader, build_empty_model
+from app.quantization import prepare_quantized_model, quantize_model, save_quantized_model
+from app.speculative import DraftModel, PromptLookupDrafter, SpeculativeDecoder
+from app.metrics import RequestTrace
+from app.response_cleaning import (
+    aggressive_clean,
+    extract_by_current_question,
+    extract_clean_response,
+    extract_keywords,
+    is_response_relevant,
+    remove_assistant_prefix
+)
 
 logger = logging.getLogger(__name__)
 
+
+class _RowTemperatureWarper(LogitsProcessor):
+    """按行应用不同温度，使同一批内的请求各自保持自己的 temperature；温度 <= 0 的行只保留最大值，即贪心解码"""
+
+    def __init__(self, temperatures):
+        self.temperatures = temperatures
+
+    def __call__(self, input_ids, scores):
+        temperatures = torch.tensor(self.temperatures, dtype=scores.dtype, device=scores.device).unsqueeze(1)
+        greedy = temperatures <= 0
+        scores = scores / torch.where(greedy, torch.ones_like(temperatures), temperatures)
+        argmax_only = scores.masked_fill(scores < scores.max(dim=-1, keepdim=True).values, float("-inf"))
+        return torch.where(greedy, argmax_only, scores)
+
+
+class _RowMaxNewTokens(StoppingCriteria):
+    """按行判断是否达到各自的 max_new_tokens"""
+
+    def __init__(self, prompt_length, max_new_tokens):
+        self.prompt_length = prompt_length
+        self.max_new_tokens = max_new_tokens
+
+    def __call__(self, input_ids, scores, **kwargs):
+        limits = torch.tensor(self.max_new_tokens, device=input_ids.device)
+        return (input_ids.shape[1] - self.prompt_length) >= limits
+
+
+class _CancelGeneration(StoppingCriteria):
+    """cancel 事件被设置后在下一个 token 处停止生成（流式请求的客户端断开时使用）"""
+
+    def __init__(self, cancel):
+        self.cancel = cancel
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.cancel.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+class _FirstTokenTimer(LogitsProcessor):
+    """第一次被调用时即 prefill 完成、拿到第一个 token 的 logits，记下时间点以区分 prefill 与 decode"""
+
+    def __init__(self, trace):
+        self.trace = trace
+
+    def __call__(self, input_ids, scores):
+        self.trace.mark_first_token()
+        return scores
+
+
+class _StreamingCleaner:
+    """流式输出的增量清理
+
+    每收到一段新文本就对累计的原始回复重新清理，保证前缀移除等规则与非流式一致；
+    同时在开头可能仍是待移除前缀（如"助"、"好的"）时暂缓输出，
+    并隐藏尚未闭合的括号/特殊标记，避免界面上先显示再消失。
+    """
+
+    # 可能被清理掉的开头词，见 response_cleaning 中的 _ASSISTANT_PREFIX / _LEADING_FILLER
+    PREFIX_WORDS = (
+        "assistant", "助手", "ai助手", "ai助理", "机器人", "好的", "明白了",
+        "根据您的问题", "针对这个问题", "关于这个问题", "根据", "针对", "关于",
+        "这件", "这款", "这是一个", "首先", "那么", "另外", "嗯", "啊", "呃",
+        "那个", "这个", "接下来", "此外"
+    )
+
+    def __init__(self, chat_model):
+        self.chat_model = chat_model
+        self.raw = ""
+
+    def feed(self, delta):
+        """追加一段生成文本，返回当前可展示的清理结果；仍需等待时返回 None"""
+        self.raw += delta
+        # 先截掉未闭合的片段再清理：否则开头的 "[" 会被当作引导标点去掉，闭合后整段消失
+        text = self.clean(self._hide_unclosed(self.raw))
+        head = text.lower()
+        for word in self.PREFIX_WORDS:
+            # 清理后的开头还可能是前缀词（如"助手：好"之后的"好的"），或刚好是前缀词但后面的分隔符还没生成
+            if word.startswith(head) or (head.startswith(word) and len(head) <= len(word) + 1):
+                return None
+        return text
+
+    def clean(self, text):
+        return remove_assistant_prefix(aggressive_clean(text))
+
+    @staticmethod
+    def _hide_unclosed(text):
+        """截掉末尾未闭合的 ( [ <| 片段（包括可能是 "<|" 前半截的 "<"），它们闭合后会被整体清理"""
+        cut = len(text) - 1 if text.endswith("<") else len(text)
+        for opener, closer in (("(", ")"), ("[", "]"), ("<|", "|>")):
+            start = text.rfind(opener)
+            if start != -1 and text.find(closer, start + len(opener)) == -1:
+                cut = min(cut, start)
+        return text[:cut]
+
+
+class _LoadReport:
+    """启动各阶段耗时；阶段之间可能并行，总计为墙钟时间"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = []
+
+    def add(self, name, seconds, detail=""):
+        self.phases.append((name, seconds, detail))
+
+    @contextmanager
+    def phase(self, name):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - begin)
+
+    def timed(self, name, fn, *args):
+        with self.phase(name):
+            return fn(*args)
+
+    def as_dict(self):
+        report = {name: round(seconds, 3) for name, seconds, _ in self.phases}
+        report["总计"] = round(time.perf_counter() - self.start, 3)
+        return report
+
+    def log(self):
+        lines = [f"  {name:<16}{seconds:>8.2f}s  {detail}".rstrip() for name, seconds, detail in self.phases]
+        lines.append(f"  {'总计':<16}{time.perf_counter() - self.start:>8.2f}s")
+        logger.info("启动耗时（分词器、权重与适配器并行加载）:\n" + "\n".join(lines))
+        return self.as_dict()
+
+
 class LoraChatModel:
+    SYSTEM_PROMPT = """<|start_header_id|>system<|end_header_id|>\n\n
+你是一个有帮助的AI助手。请针对用户的最新问题进行直接回答，不要以"Assistant"、"助手"或任何类似前缀开头，直接给出答案内容。<|eot_id|>\n"""
+    
     def __init__(self):
         self.model = None
         self.tokenizer = None
         self.is_loaded = False
         self.config = Config
+        self._scheduler = None
+        self._scheduler_lock = threading.Lock()
+        self._system_prompt_ids = None
+        self.adapters = None
+        self.speculative = None
+        self.load_error = None
+        self.load_report = None
+        self._load_lock = threading.Lock()
+        self._load_state_lock = threading.Lock()
+        self._load_thread = None
+        self.prefix_cache = None
+        if self.config.ENABLE_PREFIX_CACHE:
+            self.prefix_cache = PrefixKVCache(self.config.PREFIX_CACHE_MAX_MB * 1024 * 1024)
+        self.response_cache = None
+        self._response_namespace = None
+        if self.config.ENABLE_RESPONSE_CACHE:
+            self.response_cache = ResponseCache(
+                max_entries=self.config.RESPONSE_CACHE_MAX_ENTRIES,
+                ttl_seconds=self.config.RESPONSE_CACHE_TTL_SECONDS,
+                num_variants=self.config.RESPONSE_CACHE_VARIANTS,
+                path=self.config.RESPONSE_CACHE_PATH
+            )
+    
+    def start_background_load(self):
+        """在后台线程加载模型（进程启动时调用）；已加载或正在加载时无操作"""
+        with self._load_state_lock:
+            if self.is_loaded or (self._load_thread is not None and self._load_thread.is_alive()):
+                return
+            self.load_error = None
+            self._load_thread = threading.Thread(target=self._background_load, name="model-loader", daemon=True)
+            self._load_thread.start()
+    
+    def _background_load(self):
+        try:
+            self.load_model()
+        except Exception as e:
+            self.load_error = e
+    
+    @property
+    def status(self):
+        """ready: 可以生成；warming: 正在加载；failed: 上次加载失败；idle: 尚未开始加载"""
+        if self.is_loaded:
+            return "ready"
+        if self._load_lock.locked():
+            return "warming"
+        if self.load_error is not None:
+            return "failed"
+        return "idle"
+    
+    def wait_until_loaded(self, timeout=None):
+        """等待后台加载结束（最多 timeout 秒），返回模型是否就绪"""
+        thread = self._load_thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.is_loaded
     
     def load_model(self):
-        """加载模型"""
+        """加载模型；后台加载进行中时等待其完成，不会重复加载"""
+        with self._load_lock:
+            if self.is_loaded:
+                return
+            self._load_model()
+    
+    def _load_model(self):
+        """加载模型：分词器、基础权重与 LoRA 适配器并行加载，结束后输出各阶段耗时"""
+        report = _LoadReport()
         try:
             logger.info("正在加载Meta-Llama-3-8B-Instruct模型...")
             
@@ -34,87 +258,661 @@ class LoraChatModel:
                 use_lora = True
                 logger.info("✅ 找到LoRA适配器")
             
-            # 1. 加载分词器
+            # 1. 分词器在单独线程中加载，与权重加载重叠
             logger.info("加载分词器...")
-            self.tokenizer = AutoTokenizer.from_pretrained(
-                base_model_path,
-                trust_remote_code=True,
-                local_files_only=True
-            )
+            tokenizer_loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tokenizer-loader")
+            tokenizer_future = tokenizer_loader.submit(report.timed, "分词器", self._load_tokenizer, base_model_path)
+            tokenizer_loader.shutdown(wait=False)
+            
+            # CPU 量化推理：合并默认适配器后做仅权重量化，量化结果缓存到磁盘
+            if self._on_cpu() and self.config.CPU_QUANTIZATION:
+                self.model = self._load_quantized_model(base_model_path, lora_path if use_lora else None, report)
+                self.adapters = None
+                self._finish_loading(tokenizer_future, report, f"CPU {self.config.CPU_QUANTIZATION}量化版")
+                return
             
-            if self.tokenizer.pad_token is None:
-                self.tokenizer.pad_token = self.tokenizer.eos_token
+            # 2. 合并模式：命中磁盘缓存时直接加载合并后的权重，完全跳过 PEFT
+            merged_cache_key = None
+            if use_lora and self.config.MERGE_LORA:
+                merged_cache_key = model_fingerprint(base_model_path, lora_path)
+                merged_path = cached_model_dir(self.config.MERGED_MODEL_CACHE_DIR, merged_cache_key)
+                if merged_path is not None:
+                    logger.info(f"加载已合并的LoRA模型缓存: {merged_path}")
+                    model, weight_loader = self._load_causal_lm(merged_path, report)
+                    self.model = self._join_weights(model, weight_loader, merged_path, report)
+                    self._finish_loading(tokenizer_future, report, "LoRA合并版")
+                    return
             
-            # 2. 加载基础模型
+            # 3. 加载基础模型（分片并行读取时在后台进行，返回的是尚未写入权重的模型骨架）
             logger.info("加载基础模型...")
-            self.model = AutoModelForCausalLM.from_pretrained(
-                base_model_path,
-                torch_dtype=torch.float16,
-                device_map="auto",
-                trust_remote_code=True,
-                local_files_only=True,
-                low_cpu_mem_usage=True
-            )
+            self.model, weight_loader = self._load_causal_lm(base_model_path, report)
             
-            # 3. 加载LoRA适配器
+            # 4. 加载LoRA适配器（多个适配器共享同一个基础模型，默认适配器先加载；与基础权重加载重叠）
             if use_lora:
+                use_lora = self._attach_adapters(lora_path, report)
+            
+            base_model = self._join_weights(self.model, weight_loader, base_model_path, report)
+            if base_model is not self.model:
+                # 并行加载失败，已退回 from_pretrained，需要在新的基础模型上重新挂载适配器
+                self.model = base_model
+                if use_lora:
+                    use_lora = self._attach_adapters(lora_path, report)
+            
+            # 5. 合并适配器权重，推理时不再有额外的 LoRA 矩阵乘（合并后只保留默认适配器）
+            if use_lora and merged_cache_key is not None:
+                logger.info("合并LoRA适配器到基础权重...")
+                with report.phase("合并LoRA"):
+                    self.model = self.model.merge_and_unload()
+                self.adapters = None
                 try:
-                    logger.info("加载LoRA适配器...")
-                    self.model = PeftModel.from_pretrained(self.model, lora_path)
-                    logger.info("✅ LoRA适配器加载成功")
+                    with report.phase("保存合并缓存"):
+                        save_model_to_cache(self.model, self.config.MERGED_MODEL_CACHE_DIR, merged_cache_key)
                 except Exception as e:
-                    logger.warning(f"LoRA适配器加载失败，使用原始模型: {e}")
-                    use_lora = False
+                    logger.warning(f"合并模型缓存保存失败，下次启动将重新合并: {e}")
             
-            self.is_loaded = True
             model_type = "LoRA微调版" if use_lora else "原始模型"
-            logger.info(f"✅ Meta-Llama-3-8B-Instruct {model_type}加载成功！")
+            if use_lora and merged_cache_key is not None:
+                model_type = "LoRA合并版"
+            self._finish_loading(tokenizer_future, report, model_type)
             
         except Exception as e:
             logger.error(f"❌ 模型加载失败: {e}")
             raise
     
-    def chat(self, message, history=None, temperature=0.7, max_length=1024):
-        """生成回复 - 修复对话历史处理问题"""
+    def _finish_loading(self, tokenizer_future, report, model_type):
+        self.tokenizer = tokenizer_future.result()
+        self.speculative = self._build_speculative_decoder(report)
+        if self.response_cache is not None:
+            self._response_namespace = report.timed("response_cache_namespace", self._build_response_namespace)
+        self.is_loaded = True
+        logger.info(f"✅ Meta-Llama-3-8B-Instruct {model_type}加载成功！")
+        self.load_report = report.log()
+    
+    def _build_speculative_decoder(self, report):
+        """按 Config.SPECULATIVE_DECODING 构建投机解码器；未开启或草稿模型不可用时返回 None"""
+        mode = self.config.SPECULATIVE_DECODING
+        if not mode:
+            return None
+        if mode == "prompt_lookup":
+            drafter = PromptLookupDrafter(max_ngram=self.config.PROMPT_LOOKUP_MAX_NGRAM)
+        elif mode == "draft_model":
+            draft_path = self.config.DRAFT_MODEL_PATH
+            if not draft_path or not os.path.exists(draft_path):
+                logger.warning(f"⚠️ 草稿模型路径不存在: {draft_path}，不启用投机解码")
+                return None
+            logger.info("加载草稿模型...")
+            with report.phase("草稿模型"):
+                draft_model = AutoModelForCausalLM.from_pretrained(
+                    draft_path,
+                    torch_dtype=self._torch_dtype(),
+                    trust_remote_code=True,
+                    local_files_only=True,
+                    low_cpu_mem_usage=True
+                ).to(self.model.device).eval()
+            draft_vocab = draft_model.get_output_embeddings().weight.shape[0]
+            target_vocab = self.model.get_output_embeddings().weight.shape[0]
+            if draft_vocab != target_vocab:
+                logger.warning(f"⚠️ 草稿模型词表大小 {draft_vocab} 与目标模型 {target_vocab} 不一致，不启用投机解码")
+                return None
+            drafter = DraftModel(draft_model)
+        else:
+            raise ValueError(f"未知的投机解码方式: {mode}，可选 prompt_lookup / draft_model")
+        
+        # 与 generate(do_sample=True) 的采样参数保持一致：top_k 取自模型的 generation_config，未设置时 generate 默认为 50
+        top_k = getattr(getattr(self.model, "generation_config", None), "top_k", None)
+        if top_k is None:
+            top_k = 50
+        logger.info(f"✅ 投机解码已启用: {mode}，每轮 {self.config.NUM_DRAFT_TOKENS} 个候选 token")
+        return SpeculativeDecoder(
+            self.model,
+            drafter,
+            self.tokenizer.eos_token_id,
+            num_draft_tokens=self.config.NUM_DRAFT_TOKENS,
+            top_p=0.9,
+            top_k=top_k,
+            repetition_penalty=1.1
+        )
+    
+    def _build_response_namespace(self):
+        """回复缓存的模型命名空间：基础模型、默认适配器、其余适配器路径、系统提示词与 CPU 量化方式变化后旧缓存自动失效"""
+        quantization = self.config.CPU_QUANTIZATION if self._on_cpu() else None
+        lora_path = self.config.LORA_CHECKPOINT_PATH if os.path.exists(self.config.LORA_CHECKPOINT_PATH) else None
+        if not os.path.isdir(self.config.BASE_MODEL_PATH):
+            # 模型库 ID：没有本地文件可以哈希，只按名称区分
+            return f"{self.config.BASE_MODEL_PATH}:{lora_path}"
+        return model_fingerprint(self.config.BASE_MODEL_PATH, lora_path, extra={
+            "adapters": self.config.LORA_ADAPTERS,
+            "system_prompt": self.SYSTEM_PROMPT,
+            "quantization": quantization,
+        })
+    
+    def _load_tokenizer(self, base_model_path):
+        tokenizer = AutoTokenizer.from_pretrained(
+            base_model_path,
+            trust_remote_code=True,
+            local_files_only=True
+        )
+        
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        return tokenizer
+    
+    def _attach_adapters(self, lora_path, report):
+        """在 self.model 上挂载 LoRA 适配器，失败时退回原始模型并返回 False"""
+        try:
+            logger.info("加载LoRA适配器...")
+            with report.phase("LoRA适配器"):
+                adapter_paths = {self.config.DEFAULT_ADAPTER: lora_path}
+                adapter_paths.update(self.config.LORA_ADAPTERS)
+                self.adapters = AdapterRegistry(adapter_paths, max_resident=self.config.MAX_RESIDENT_ADAPTERS)
+                self.adapters.on_replace = self._on_adapter_replaced
+                self.model = self.adapters.attach(self.model, self.config.DEFAULT_ADAPTER)
+            return True
+        except Exception as e:
+            logger.warning(f"LoRA适配器加载失败，使用原始模型: {e}")
+            self.adapters = None
+            return False
+    
+    def _on_adapter_replaced(self, name):
+        """适配器换了权重：丢弃该适配器的前缀 KV（回复缓存键含适配器路径，旧条目不会再命中）"""
+        if self.prefix_cache is not None:
+            self.prefix_cache.drop_namespace(name)
+        logger.info(f"🔄 适配器 [{name}] 已替换，清除其前缀缓存")
+    
+    def _on_cpu(self):
+        return self.config.INFERENCE_DEVICE == "cpu" or not torch.cuda.is_available()
+    
+    def _torch_dtype(self):
+        """GPU 上用 fp16；CPU 上 fp16 矩阵乘很慢，用 CPU_DTYPE（bf16 / fp32）"""
+        return getattr(torch, self.config.CPU_DTYPE) if self._on_cpu() else torch.float16
+    
+    def _load_quantized_model(self, base_model_path, lora_path, report):
+        """CPU 量化模型：命中缓存时直接加载量化权重，否则按原精度加载 → 合并 LoRA → 量化 → 写缓存"""
+        mode = self.config.CPU_QUANTIZATION
+        group_size = self.config.QUANT_GROUP_SIZE
+        dtype = self._torch_dtype()
+        if self.config.LORA_ADAPTERS:
+            logger.warning("⚠️ CPU 量化推理只合并默认适配器，LORA_ADAPTERS 中的其他适配器不可用")
+        
+        cache_key = model_fingerprint(
+            base_model_path, lora_path,
+            extra={"quantization": mode, "group_size": group_size, "dtype": self.config.CPU_DTYPE}
+        )
+        cache_path = cached_model_dir(self.config.QUANTIZED_MODEL_CACHE_DIR, cache_key)
+        if cache_path is not None:
+            logger.info(f"加载量化模型缓存: {cache_path}")
+            with report.phase("构建模型骨架"):
+                model, shards = build_empty_model(cache_path, dtype, device="cpu")
+                quantize_model(model, mode, group_size, dtype, empty=True)
+            weight_loader = ShardedWeightLoader(model, shards, self.config.WEIGHT_LOAD_WORKERS).start()
+            self._report_weights(report, weight_loader.join())
+            return prepare_quantized_model(model)
+        
+        logger.info("加载基础模型...")
+        model, weight_loader = self._load_causal_lm(base_model_path, report)
+        self.model = self._join_weights(model, weight_loader, base_model_path, report)
+        merged = lora_path is None
+        if lora_path is not None and self._attach_adapters(lora_path, report):
+            logger.info("合并LoRA适配器到基础权重...")
+            with report.phase("合并LoRA"):
+                self.model = self.model.merge_and_unload()
+            merged = True
+        
+        logger.info(f"{mode} 仅权重量化...")
+        with report.phase("量化"):
+            replaced = quantize_model(self.model, mode, group_size, dtype)
+        logger.info(f"✅ 已量化 {replaced} 个线性层")
+        if not merged:
+            # 缓存键包含 LoRA 路径，适配器加载失败时得到的是纯基础模型，不能以这个键写入缓存
+            logger.warning("⚠️ LoRA 适配器未合并，本次量化结果不写入缓存")
+            return prepare_quantized_model(self.model)
+        try:
+            with report.phase("保存量化缓存"):
+                save_quantized_model(self.model, self.config.QUANTIZED_MODEL_CACHE_DIR, cache_key, mode, group_size)
+        except Exception as e:
+            logger.warning(f"量化模型缓存保存失败，下次启动将重新量化: {e}")
+        return prepare_quantized_model(self.model)
+    
+    def _load_causal_lm(self, model_path, report):
+        """
+        从本地路径加载 CausalLM，返回 (model, weight_loader)
+        单卡/CPU 且为 safetensors 权重时先返回模型骨架，权重由 weight_loader 在后台并行写入，
+        调用方在使用模型前须调用 _join_weights；否则走 from_pretrained，weight_loader 为 None。
+        """
+        if self.config.FAST_WEIGHT_LOADING:
+            with report.phase("构建模型骨架"):
+                built = build_empty_model(model_path, self._torch_dtype(), device="cpu" if self._on_cpu() else None)
+            if built is not None:
+                model, shards = built
+                return model, ShardedWeightLoader(model, shards, self.config.WEIGHT_LOAD_WORKERS).start()
+        return self._from_pretrained(model_path, report), None
+    
+    def _from_pretrained(self, model_path, report):
+        with report.phase("权重(from_pretrained)"):
+            return AutoModelForCausalLM.from_pretrained(
+                model_path,
+                torch_dtype=self._torch_dtype(),
+                device_map="cpu" if self._on_cpu() else "auto",
+                trust_remote_code=True,
+                local_files_only=True,
+                low_cpu_mem_usage=True
+            )
+    
+    def _join_weights(self, model, weight_loader, model_path, report):
+        """等待并行权重加载完成；失败时退回 from_pretrained 并返回新加载的模型"""
+        if weight_loader is None:
+            return model
+        try:
+            weight_loader.join()
+        except Exception as e:
+            logger.warning(f"分片并行加载失败，改用 from_pretrained: {e}")
+            self.adapters = None
+            return self._from_pretrained(model_path, report)
+        self._report_weights(report, weight_loader)
+        return model
+    
+    def _report_weights(self, report, weight_loader):
+        report.add(
+            "权重",
+            weight_loader.elapsed,
+            f"{len(weight_loader.shards)} 个分片, {weight_loader.bytes_loaded / 1e9:.2f} GB, "
+            f"{weight_loader.throughput_gb_s:.2f} GB/s, {weight_loader.num_workers} 线程"
+        )
+    
+    def chat(self, message, history=None, temperature=0.7, max_length=1024, adapter=None):
+        """生成回复 - 修复对话历史处理问题；adapter 指定本次使用的 LoRA 适配器"""
         if not self.is_loaded:
             self.load_model()
         
+        trace = RequestTrace("chat")
         try:
             # 修复：确保每个问题独立处理
             clean_history = self._validate_and_clean_history(history or [])
             
             # 构建正确的对话提示
             prompt = self._build_correct_prompt(message, clean_history)
+            max_new_tokens = min(max_length, 500)
             
-            # 将输入移到GPU
-            inputs = self.tokenizer.encode(prompt, return_tensors="pt")
-            inputs = inputs.to(self.model.device)
+            cache_key = self._response_cache_key(message, clean_history, adapter, temperature, max_new_tokens)
+            if cache_key is not None:
+                cached = self.response_cache.lookup(cache_key, temperature)
+                trace.response_cache = "miss" if cached is None else "hit"
+                if cached is not None:
+                    trace.finish()
+                    return cached
             
-            # 生成回复
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    inputs,
-                    max_new_tokens=min(max_length, 500),
-                    temperature=temperature,
-                    top_p=0.9,
-                    do_sample=True,
-                    pad_token_id=self.tokenizer.eos_token_id,
-                    repetition_penalty=1.1,
-                    eos_token_id=self.tokenizer.eos_token_id
-                )
-            
-            # 解码回复
-            response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+            # 生成回复：开启批处理时交给调度器与其他并发请求合并生成
+            # （此时分阶段耗时由调度线程按批记录，本请求只记录排队+生成的总耗时）
+            if self.config.ENABLE_BATCHING:
+                with trace.span("batched_generate"):
+                    future = self._get_scheduler().submit(prompt, temperature, max_new_tokens, adapter)
+                    response = future.result()
+            else:
+                response = self._generate_batch([prompt], [temperature], [max_new_tokens], [adapter], trace=trace)[0]
             
             # 彻底清理回复内容 - 确保只返回当前问题的回答
-            clean_response = self._extract_clean_response_for_current_question(response, prompt, message)
+            with trace.span("cleanup"):
+                clean_response = self._extract_clean_response_for_current_question(response, prompt, message)
+            if cache_key is not None:
+                self.response_cache.store(cache_key, clean_response, temperature)
             
+            trace.finish()
             return clean_response
             
         except Exception as e:
+            trace.finish(status="error")
             logger.error(f"生成回复失败: {e}")
             return f"抱歉，生成回复时出现错误: {str(e)}"
     
+    def chat_stream(self, message, history=None, temperature=0.7, max_length=1024, adapter=None, cancel=None):
+        """
+        流式生成回复：每生成一段文本就 yield 一次当前清理后的完整回复
+        cancel 为可选的 threading.Event，由其他线程设置后 generate 在下一个 token 处停止，本生成器不再产出结果
+        """
+        if not self.is_loaded:
+            self.load_model()
+        
+        trace = RequestTrace("stream")
+        status = "ok"
+        try:
+            clean_history = self._validate_and_clean_history(history or [])
+            prompt = self._build_correct_prompt(message, clean_history)
+            max_new_tokens = min(max_length, 500)
+            
+            cache_key = self._response_cache_key(message, clean_history, adapter, temperature, max_new_tokens)
+            if cache_key is not None:
+                cached = self.response_cache.lookup(cache_key, temperature)
+                trace.response_cache = "miss" if cached is None else "hit"
+                if cached is not None:
+                    yield cached
+                    return
+            
+            adapter_names = self._resolve_adapters([adapter])
+            namespace = adapter_names[0] if adapter_names else None
+            with trace.span("tokenize"):
+                inputs, prompt_ids = self._prefix_cached_inputs(prompt, namespace)
+            if adapter_names:
+                inputs["adapter_names"] = adapter_names
+                self.adapters.acquire(adapter_names)
+            # 增量解码在 generate 线程的 streamer.put 中进行，计入 decode 阶段
+            streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+            # 调用方提前关闭本生成器（客户端断开）或从外部设置 cancel 时，generate 在下一个 token 处停止
+            if cancel is None:
+                cancel = threading.Event()
+            stopping_criteria = StoppingCriteriaList([_CancelGeneration(cancel)])
+            generate_kwargs = dict(
+                **inputs,
+                streamer=streamer,
+                logits_processor=LogitsProcessorList([_FirstTokenTimer(trace)]),
+                stopping_criteria=stopping_criteria,
+                return_dict_in_generate=True,
+                max_new_tokens=max_new_tokens,
+                temperature=temperature,
+                top_p=0.9,
+                do_sample=True,
+                pad_token_id=self.tokenizer.eos_token_id,
+                repetition_penalty=1.1,
+                eos_token_id=self.tokenizer.eos_token_id
+            )
+            if temperature <= 0:
+                self._use_greedy(generate_kwargs)
+            
+            # generate 在后台线程中运行，当前线程消费 streamer
+            result = {}
+            
+            def _generate():
+                start = time.perf_counter()
+                try:
+                    if self.speculative is not None:
+                        result["outputs"] = self._speculative_generate(
+                            inputs, temperature, generate_kwargs["max_new_tokens"], adapter_names, trace, streamer,
+                            stopping_criteria
+                        )
+                    else:
+                        with torch.no_grad():
+                            result["outputs"] = self.model.generate(**generate_kwargs)
+                except Exception as e:
+                    result["error"] = e
+                    streamer.end()
+                finally:
+                    self._record_generate_spans(trace, start, time.perf_counter())
+            
+            thread = threading.Thread(target=_generate, daemon=True)
+            try:
+                thread.start()
+                cleaner = _StreamingCleaner(self)
+                last = None
+                for delta in streamer:
+                    with trace.span("cleanup"):
+                        text = cleaner.feed(delta)
+                    if text is not None and text != last:
+                        last = text
+                        yield text
+                thread.join()
+            finally:
+                # 提前退出时先停止并等待 generate 线程，适配器在前向结束之后才能释放（否则可能被 LRU 卸载）
+                if thread.is_alive():
+                    cancel.set()
+                    thread.join()
+                if adapter_names:
+                    self.adapters.release(adapter_names)
+            
+            if cancel.is_set():
+                # 被中途取消的回复不完整，不写入前缀缓存和回复缓存
+                status = "cancelled"
+                return
+            if "error" in result:
+                raise result["error"]
+            sequences = result["outputs"].sequences
+            self._remember_prefixes(prompt_ids, result["outputs"].past_key_values, namespace)
+            trace.add_tokens(len(prompt_ids), self._count_generated(sequences, len(prompt_ids))[0])
+            
+            # 生成结束后按非流式路径做一次完整清理，保证最终结果与 chat 一致
+            with trace.span("detokenize"):
+                response = self.tokenizer.decode(sequences[0], skip_special_tokens=True)
+            with trace.span("cleanup"):
+                final = self._extract_clean_response_for_current_question(response, prompt, message)
+            if cache_key is not None:
+                self.response_cache.store(cache_key, final, temperature)
+            if final != last:
+                yield final
+            
+        except GeneratorExit:
+            # 客户端断开，调用方不再消费
+            status = "cancelled"
+            raise
+        except Exception as e:
+            status = "error"
+            logger.error(f"流式生成回复失败: {e}")
+            yield f"抱歉，生成回复时出现错误: {str(e)}"
+        finally:
+            trace.finish(status=status)
+    
+    def generate_batch(self, prompts, questions, temperature=0.7, max_new_tokens=256, adapter=None):
+        """离线批量生成：prompts 为完整的 prompt，questions 为各自的当前问题（用于提取回复）
+
+        不经过批处理调度器和回复缓存，整批一次 generate。
+        返回 [(清理后的回复, 生成 token 数)]，token 数按生成结果中的 id 统计（不含结束符与填充）。
+        """
+        if not self.is_loaded:
+            self.load_model()
+        
+        n = len(prompts)
+        texts, generated = self._generate_batch_counted(prompts, [temperature] * n, [max_new_tokens] * n, [adapter] * n)
+        return [
+            (self._extract_clean_response_for_current_question(text, prompt, question), count)
+            for text, prompt, question, count in zip(texts, prompts, questions, generated)
+        ]
+    
+    def _get_scheduler(self):
+        """懒加载批处理调度器"""
+        with self._scheduler_lock:
+            if self._scheduler is None and self.config.BATCHING_ENGINE == "continuous":
+                self._scheduler = ContinuousBatchingEngine(
+                    self.model,
+                    self.tokenizer,
+                    max_batch_size=self.config.BATCH_MAX_SIZE,
+                    adapter_registry=self.adapters,
+                    default_adapter=self.config.DEFAULT_ADAPTER
+                )
+            elif self._scheduler is None:
+                self._scheduler = BatchScheduler(
+                    self._generate_batch,
+                    max_batch_size=self.config.BATCH_MAX_SIZE,
+                    max_wait_ms=self.config.BATCH_MAX_WAIT_MS
+                )
+            return self._scheduler
+    
+    def _response_cache_key(self, message, history, adapter, temperature, max_new_tokens):
+        """无历史的单轮请求返回回复缓存键；未开启缓存或带有对话历史（回复依赖上下文）时返回 None"""
+        if self.response_cache is None or history:
+            return None
+        adapter = adapter or self.config.DEFAULT_ADAPTER
+        if self.adapters is not None:
+            # 键里带上适配器当前的路径：热替换适配器后旧回复不再命中
+            adapter = f"{adapter}@{self.adapters.adapter_paths.get(adapter)}"
+        return response_cache_key(self._response_namespace, message, adapter, temperature, max_new_tokens)
+    
+    def _resolve_adapters(self, adapters):
+        """把请求指定的适配器名称补全为默认适配器；未启用多适配器时返回 None"""
+        if self.adapters is None:
+            requested = [a for a in adapters if a is not None and a != self.config.DEFAULT_ADAPTER]
+            if requested:
+                raise ValueError(f"当前模型未启用多适配器，无法使用适配器: {requested[0]}")
+            return None
+        return [a or self.config.DEFAULT_ADAPTER for a in adapters]
+    
+    @staticmethod
+    def _use_greedy(generate_kwargs):
+        """温度 <= 0 按贪心解码处理，与连续批处理引擎和投机解码的约定一致"""
+        generate_kwargs["do_sample"] = False
+        generate_kwargs.pop("temperature", None)
+        generate_kwargs.pop("top_p", None)
+    
+    def _prefix_cached_inputs(self, prompt, namespace=None):
+        """编码单条 prompt，命中前缀缓存时附带 past_key_values，只需 prefill 未缓存部分"""
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        prompt_ids = inputs["input_ids"][0].tolist()
+        if self.prefix_cache is not None:
+            cached_length, past_key_values = self.prefix_cache.lookup(prompt_ids, namespace)
+            if past_key_values is not None:
+                logger.debug(f"前缀缓存命中: {cached_length}/{len(prompt_ids)} tokens")
+                inputs["past_key_values"] = past_key_values
+        return dict(inputs), prompt_ids
+    
+    def _remember_prefixes(self, prompt_ids, past_key_values, namespace=None):
+        """把系统提示词和本轮完整 prompt 的 KV 写入前缀缓存，供后续请求和下一轮对话复用"""
+        if self.prefix_cache is None or past_key_values is None:
+            return
+        if self._system_prompt_ids is None:
+            self._system_prompt_ids = self.tokenizer(self.SYSTEM_PROMPT)["input_ids"]
+        system_length = len(self._system_prompt_ids)
+        if prompt_ids[:system_length] == self._system_prompt_ids:
+            self.prefix_cache.store(prompt_ids, past_key_values, length=system_length, namespace=namespace)
+        self.prefix_cache.store(prompt_ids, past_key_values, length=len(prompt_ids), namespace=namespace)
+    
+    def _generate_batch(self, prompts, temperatures, max_new_tokens, adapters=None, trace=None):
+        """左填充后一次 generate 生成多条回复，返回每条的完整解码文本
+
+        adapters 为每条请求的 LoRA 适配器名称，不同适配器的请求通过 adapter_names 在同一次前向中完成。
+        trace 为调用方的 RequestTrace；批处理调度器调用时为 None，按批新建一条 kind="batch" 的记录。
+        """
+        return self._generate_batch_counted(prompts, temperatures, max_new_tokens, adapters, trace)[0]
+    
+    def _generate_batch_counted(self, prompts, temperatures, max_new_tokens, adapters=None, trace=None):
+        """同 _generate_batch，另外返回每条实际生成的 token 数"""
+        owns_trace = trace is None
+        if owns_trace:
+            trace = RequestTrace("batch")
+        try:
+            result = self._generate_batch_traced(prompts, temperatures, max_new_tokens, adapters, trace)
+        except Exception:
+            if owns_trace:
+                trace.finish(status="error")
+            raise
+        if owns_trace:
+            trace.finish()
+        return result
+    
+    def _generate_batch_traced(self, prompts, temperatures, max_new_tokens, adapters, trace):
+        adapter_names = self._resolve_adapters(adapters or [None] * len(prompts))
+        namespace = adapter_names[0] if adapter_names else None
+        prompt_ids = None
+        with trace.span("tokenize"):
+            if len(prompts) == 1 and self.prefix_cache is not None:
+                inputs, prompt_ids = self._prefix_cached_inputs(prompts[0], namespace)
+            else:
+                self.tokenizer.padding_side = "left"
+                inputs = self.tokenizer(prompts, return_tensors="pt", padding=True)
+                inputs = inputs.to(self.model.device)
+        prompt_length = inputs["input_ids"].shape[1]
+        # 单条请求且开启投机解码时由草稿器 + 目标模型验证生成（批量请求仍走 generate）
+        speculative = self.speculative is not None and len(prompts) == 1
+        
+        generate_kwargs = dict(
+            max_new_tokens=max(max_new_tokens),
+            top_p=0.9,
+            do_sample=True,
+            pad_token_id=self.tokenizer.eos_token_id,
+            repetition_penalty=1.1,
+            eos_token_id=self.tokenizer.eos_token_id
+        )
+        
+        # 温度一致时走原生采样；否则按行缩放 logits。原生路径的顺序是 温度 → top_k(50) → top_p，
+        # 这里关掉内置的 top_k / top_p 并按同样顺序自行应用，同一请求的采样分布与拼在哪个批里无关
+        logits_processor = LogitsProcessorList()
+        if len(set(temperatures)) == 1 and temperatures[0] <= 0:
+            self._use_greedy(generate_kwargs)
+        elif len(set(temperatures)) == 1:
+            generate_kwargs["temperature"] = temperatures[0]
+        else:
+            generate_kwargs["temperature"] = 1.0
+            generate_kwargs["top_k"] = 0
+            generate_kwargs["top_p"] = 1.0
+            logits_processor.extend([
+                _RowTemperatureWarper(temperatures),
+                TopKLogitsWarper(top_k=50),
+                TopPLogitsWarper(top_p=0.9)
+            ])
+        logits_processor.append(_FirstTokenTimer(trace))
+        generate_kwargs["logits_processor"] = logits_processor
+        
+        # 各请求的 max_new_tokens 不同时，先到上限的行提前结束
+        if len(set(max_new_tokens)) > 1:
+            generate_kwargs["stopping_criteria"] = StoppingCriteriaList([
+                _RowMaxNewTokens(prompt_length, max_new_tokens)
+            ])
+        
+        if prompt_ids is not None:
+            generate_kwargs["return_dict_in_generate"] = True
+        
+        generate_start = time.perf_counter()
+        try:
+            if speculative:
+                with self.adapters.using(adapter_names) if adapter_names else nullcontext():
+                    outputs = self._speculative_generate(
+                        inputs, temperatures[0], max_new_tokens[0], adapter_names, trace
+                    )
+            elif adapter_names:
+                generate_kwargs["adapter_names"] = adapter_names
+                with self.adapters.using(adapter_names), torch.no_grad():
+                    outputs = self.model.generate(**inputs, **generate_kwargs)
+            else:
+                with torch.no_grad():
+                    outputs = self.model.generate(**inputs, **generate_kwargs)
+        finally:
+            self._record_generate_spans(trace, generate_start, time.perf_counter())
+        
+        if prompt_ids is not None:
+            self._remember_prefixes(prompt_ids, outputs.past_key_values, namespace)
+        if prompt_ids is not None or speculative:
+            outputs = outputs.sequences
+        
+        prompt_tokens = inputs["attention_mask"].sum(dim=1).tolist()
+        generated = self._count_generated(outputs, prompt_length)
+        for n_prompt, n_completion in zip(prompt_tokens, generated):
+            trace.add_tokens(n_prompt, n_completion)
+        
+        # 左填充和提前结束后的填充都是特殊符号，解码时会被跳过
+        with trace.span("detokenize"):
+            return self.tokenizer.batch_decode(outputs, skip_special_tokens=True), generated
+    
+    def _speculative_generate(self, inputs, temperature, max_new_tokens, adapter_names, trace, streamer=None,
+                              stopping_criteria=None):
+        """投机解码生成一条回复，返回与 generate(return_dict_in_generate=True) 字段相同的输出，并记录接受率"""
+        outputs = self.speculative.generate(
+            inputs["input_ids"],
+            temperature,
+            max_new_tokens,
+            past_key_values=inputs.get("past_key_values"),
+            trace=trace,
+            streamer=streamer,
+            stopping_criteria=stopping_criteria,
+            model_kwargs={"adapter_names": adapter_names} if adapter_names else None
+        )
+        stats = outputs.stats
+        trace.add_speculative(
+            stats.drafted, stats.accepted, stats.target_steps, stats.tokens_per_step, stats.estimated_speedup
+        )
+        return outputs
+    
+    def _record_generate_spans(self, trace, start, end):
+        """以第一个 token 的 logits 产生时刻为界，把 generate 耗时拆成 prefill 与 decode"""
+        first = trace.first_token_at if trace.first_token_at is not None else end
+        first = min(max(first, start), end)
+        trace.add_span("prefill", first - start)
+        trace.add_span("decode", end - first)
+    
+    def _count_generated(self, sequences, prompt_length):
+        """每行实际生成的 token 数（不含结束符；pad 与 eos 相同，提前结束的行之后的填充也不计入）"""
+        generated = sequences[:, prompt_length:]
+        if generated.shape[1] == 0:
+            return [0] * sequences.shape[0]
+        is_eos = generated == self.tokenizer.eos_token_id
+        first_eos = is_eos.int().argmax(dim=1)
+        full = torch.full_like(first_eos, generated.shape[1])
+        return torch.where(is_eos.any(dim=1), first_eos, full).tolist()
+    
     def _validate_and_clean_history(self, history):
         """验证和清理历史记录，防止问题累积"""
         clean_history = []
@@ -142,10 +940,7 @@ class LoraChatModel:
     
     def _build_correct_prompt(self, current_message, history):
         """构建正确的提示词，明确指示回复格式"""
-        system_prompt = """<|start_header_id|>system<|end_header_id|>\n\n
-你是一个有帮助的AI助手。请针对用户的最新问题进行直接回答，不要以"Assistant"、"助手"或任何类似前缀开头，直接给出答案内容。<|eot_id|>\n"""
-        
-        conversation = system_prompt
+        conversation = self.SYSTEM_PROMPT
         
         # 添加历史对话（如果有）
         for i, (user_msg, assistant_msg) in enumerate(history):
@@ -159,149 +954,31 @@ class LoraChatModel:
         return conversation
     
     def _extract_clean_response_for_current_question(self, full_response, prompt, current_question):
-        """专门为当前问题提取干净的回复"""
-        # 确保只提取当前问题的回答
-        if full_response.startswith(prompt):
-            response_content = full_response[len(prompt):].strip()
-        else:
-            # 如果格式不匹配，尝试其他提取方法
-            response_content = self._extract_by_current_question(full_response, current_question)
-        
-        # 彻底清理回复 - 特别加强assistant开头的清理
-        clean_content = self._aggressive_clean_response(response_content)
-        
-        # 新增：专门处理以assistant开头的情况
-        clean_content = self._remove_assistant_prefix(clean_content)
+        """专门为当前问题提取干净的回复（规则见 app/response_cleaning.py）"""
+        clean_content = extract_clean_response(full_response, prompt, current_question)
         
         # 验证回复是否针对当前问题
-        if not self._is_response_relevant(clean_content, current_question):
+        if not is_response_relevant(clean_content, current_question):
             logger.warning(f"回复可能不相关。问题: {current_question}, 回复: {clean_content}")
         
         return clean_content
     
     def _remove_assistant_prefix(self, text):
         """专门移除assistant相关前缀"""
-        if not text:
-            return text
-        
-        # 定义需要移除的assistant前缀模式
-        assistant_prefixes = [
-            r'^(assistant|Assistant|ASSISTANT)[:\s]*',
-            r'^(助手|AI助手|AI助理|机器人)[：:\s]*',
-            r'^(好的|明白了|根据您的问题|针对这个问题|关于这个问题)[，,\s]*',
-            r'^[Aa]ssistant\s+is\s+',
-            r'^[Aa]ssistant\s*[：:]\s*'
-        ]
-        
-        for prefix in assistant_prefixes:
-            text = re.sub(prefix, '', text, flags=re.IGNORECASE)
-        
-        return text.strip()
+        return remove_assistant_prefix(text)
     
     def _extract_by_current_question(self, text, current_question):
         """根据当前问题特征提取回复"""
-        # 查找最后一个assistant标记后的内容
-        markers = [
-            "<|start_header_id|>assistant<|end_header_id|>",
-            "assistant:",
-            "Assistant:",
-            "助手:",
-            "助手："
-        ]
-        
-        for marker in markers:
-            if marker in text:
-                parts = text.split(marker)
-                if len(parts) > 1:
-                    # 取最后一个assistant标记后的内容
-                    content = parts[-1].strip()
-                    # 去除所有特殊标记
-                    content = re.sub(r'<\|.*?\|>', '', content)
-                    # 移除assistant前缀
-                    content = self._remove_assistant_prefix(content)
-                    return content
-        
-        # 如果找不到标记，尝试基于问题内容提取
-        if current_question in text:
-            parts = text.split(current_question)
-            if len(parts) > 1:
-                content = parts[-1].strip()
-                content = self._remove_assistant_prefix(content)
-                return content
-        
-        # 最终清理
-        content = text.strip()
-        content = self._remove_assistant_prefix(content)
-        return content
+        return extract_by_current_question(text, current_question)
     
     def _aggressive_clean_response(self, text):
         """加强版的清理回复内容"""
-        if not text:
-            return text
-        
-        # 首先移除assistant相关前缀
-        text = self._remove_assistant_prefix(text)
-        
-        # 去除所有特殊标记
-        patterns_to_remove = [
-            r'<\|start_header_id\|>.*?<\|end_header_id\|>',
-            r'<\|eot_id\|>',
-            r'<\|.*?\|>',
-            r'\[.*?\]',
-            r'\(.*?\)'
-        ]
-        
-        for pattern in patterns_to_remove:
-            text = re.sub(pattern, '', text, flags=re.DOTALL)
-        
-        # 去除常见的不必要前缀
-        prefixes_to_remove = [
-            r'^(好的|根据|针对|关于|这件|这款|这是一个|首先|那么|另外)[，,]\s*',
-            r'^[\"\'「」【】\[\]\(\)]\s*',
-            r'^(嗯|啊|呃|那个|这个)[，,]\s*',
-            r'^(那么|接下来|此外|另外)[，,]\s*'
-        ]
-        
-        for prefix in prefixes_to_remove:
-            text = re.sub(prefix, '', text, flags=re.IGNORECASE)
-        
-        # 清理多余的空格和换行
-        text = re.sub(r'\s+', ' ', text)
-        text = re.sub(r'\n+', '\n', text)
-        text = text.strip()
-        
-        # 确保不以标点符号开头
-        if text and text[0] in '，,.:：；;!！?？':
-            text = text[1:].strip()
-        
-        # 如果文本以"这款"开头，但前面没有内容，直接保留
-        if text.startswith('这款'):
-            # 检查是否只是单纯的"这款"开头，如果是商品描述，可以保留
-            pass
-        
-        return text
+        return aggressive_clean(text)
     
     def _is_response_relevant(self, response, question):
         """检查回复是否与当前问题相关"""
-        if not response or not question:
-            return False
-        
-        # 简单的关键词匹配检查
-        question_keywords = self._extract_keywords(question)
-        response_keywords = self._extract_keywords(response)
-        
-        # 如果有共同关键词，认为相关
-        common_keywords = set(question_keywords) & set(response_keywords)
-        return len(common_keywords) > 0 or len(response) > 10  # 或者回复长度大于10也认为相关
+        return is_response_relevant(response, question)
     
     def _extract_keywords(self, text):
         """提取文本中的关键词"""
-        if not text:
-            return []
-        
-        # 简单的关键词提取
-        words = re.findall(r'[\u4e00-\u9fa5a-zA-Z0-9]+', text)
-        # 过滤掉常见虚词
-        stop_words = {'的', '了', '是', '在', '有', '和', '就', '都', '而', '及', '与', '这', '那', '你', '我', '他', '她', '它'}
-        keywords = [word for word in words if word not in stop_words and len(word) > 1]
-        return keywords
\ No newline at end of file
+        return extract_keywords(text)
@@ -13,14 +13,76 @@ class Config:
     BASE_MODEL_PATH = os.path.join(PROJECT_ROOT, "models", "LLM-Research", "Meta-Llama-3-8B-Instruct")
     LORA_CHECKPOINT_PATH = os.path.join(PROJECT_ROOT, "sft", "checkpoint-590")
     
+    # 多适配器服务：LORA_CHECKPOINT_PATH 注册为默认适配器，其余适配器按名称注册，
+    # 例如 {"cosmetics": ".../sft/cosmetics", "brand_a": ".../sft/brand_a"}
+    DEFAULT_ADAPTER = "default"
+    LORA_ADAPTERS = {}
+    MAX_RESIDENT_ADAPTERS = 4   # 同时常驻的适配器数量上限，超出后按 LRU 卸载
+    
+    # 推理时把 LoRA 合并进基础权重，并把合并结果缓存到磁盘（按基础模型+适配器哈希区分）
+    MERGE_LORA = False
+    MERGED_MODEL_CACHE_DIR = os.path.join(PROJECT_ROOT, "cache", "merged")
+    
+    # 启动加载：进程启动即在后台加载模型，界面先接受请求并显示预热状态；
+    # 单卡/CPU 时 safetensors 分片并行内存映射读取，分词器与适配器加载同时进行
+    PRELOAD_ON_BOOT = True
+    FAST_WEIGHT_LOADING = True
+    WEIGHT_LOAD_WORKERS = None  # 读取分片的线程数，None 表示每个分片一个线程
+    
+    # CPU 推理（没有 GPU 或 INFERENCE_DEVICE = "cpu" 时生效）：按 CPU_DTYPE 加载，
+    # 开启 CPU_QUANTIZATION 时合并 LoRA 后把投影层做仅权重量化，量化结果按基础模型 + 适配器 + 量化参数缓存到磁盘
+    INFERENCE_DEVICE = "auto"   # auto: 有 GPU 时用 GPU；cpu: 强制 CPU
+    CPU_DTYPE = "bfloat16"      # 激活与未量化层的精度：bfloat16 / float32
+    CPU_QUANTIZATION = None     # None: 不量化（默认）；int8: 逐通道量化；int4: 按组量化，会引入少量量化误差
+    QUANT_GROUP_SIZE = 128      # int4 每组的输入维度数
+    QUANTIZED_MODEL_CACHE_DIR = os.path.join(PROJECT_ROOT, "cache", "quantized")
+    
     # 应用配置
     SERVER_HOST = "0.0.0.0"
     SERVER_PORT = 7860
     
+    # 并发控制：所有会话的生成请求进入同一个 asyncio 队列，同时生成的请求数不超过 MAX_CONCURRENT_GENERATIONS，
+    # 其余按到达顺序排队并显示排队位置；排队数达到 MAX_QUEUE_SIZE 后新请求直接提示繁忙
+    MAX_CONCURRENT_GENERATIONS = 2
+    MAX_QUEUE_SIZE = 100
+    QUEUE_OVERFLOW = "queue"        # queue: 没有空闲名额时排队；reject: 没有空闲名额立即拒绝
+    GRADIO_DEFAULT_CONCURRENCY = 4  # 清空对话、状态查询等轻量事件的并发数
+    GRADIO_QUEUE_MAX_SIZE = 256     # Gradio 事件队列上限（最外层保护）
+    
+    # 监控指标：在单独端口以 Prometheus 文本格式暴露 /metrics（各阶段耗时直方图、token 数）
+    ENABLE_METRICS = True
+    METRICS_PORT = 7861
+    
     # 模型参数
     DEFAULT_TEMPERATURE = 0.7
     DEFAULT_MAX_LENGTH = 1024
     
+    # 投机解码：草稿器每轮提出若干候选 token，目标模型一次前向验证，采样分布与逐 token 生成完全相同
+    # （只作用于单条请求的生成；开启动态批处理时批量请求仍逐 token 生成）
+    SPECULATIVE_DECODING = None     # None: 关闭；prompt_lookup: 从 prompt 中查找 n-gram；draft_model: 小模型草稿
+    DRAFT_MODEL_PATH = None         # draft_model 模式的小模型路径，须与基础模型共用分词器（如 Llama-3.2-1B-Instruct）
+    NUM_DRAFT_TOKENS = 4            # 每轮候选 token 数
+    PROMPT_LOOKUP_MAX_NGRAM = 3     # prompt_lookup 匹配的最长 n-gram
+    
+    # 动态批处理配置（并发请求合并为一次 generate）
+    ENABLE_BATCHING = False
+    BATCHING_ENGINE = "static"  # static: 凑批后一次 generate；continuous: 迭代级批处理，逐 token 进出
+    BATCH_MAX_SIZE = 8          # 单批最多合并的请求数
+    BATCH_MAX_WAIT_MS = 10      # 凑批最长等待时间（毫秒）
+    
+    # 前缀 KV 缓存（系统提示词和历史对话只 prefill 一次）
+    ENABLE_PREFIX_CACHE = True
+    PREFIX_CACHE_MAX_MB = 1024  # 缓存占用上限，超出后按 LRU 淘汰
+    
+    # 回复缓存：属性组合相同（与顺序无关）、适配器与采样参数相同的单轮请求直接返回缓存的回复；
+    # temperature > 0 时每个键保留多条回复轮流返回，设置 RESPONSE_CACHE_PATH 后存入 SQLite，重启后仍然有效
+    # 默认关闭：开启后交互界面中重复提问会直接拿到之前的回复，适合批量生成或固定 SKU 的场景
+    ENABLE_RESPONSE_CACHE = False
+    RESPONSE_CACHE_MAX_ENTRIES = 10000      # 条目数上限，超出后按 LRU 淘汰
+    RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 3600
+    RESPONSE_CACHE_VARIANTS = 3             # temperature > 0 时每个键轮换的回复数
+    RESPONSE_CACHE_PATH = None              # 例如 os.path.join(PROJECT_ROOT, "cache", "responses.sqlite3")
+    
     @classmethod
     def create_dirs(cls):
         """创建必要的目录 - 现在只创建确实需要的目录"""
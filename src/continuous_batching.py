@@ -0,0 +1,345 @@
+# app/continuous_batching.py
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+import torch
+import torch.nn.functional as F
+from transformers import RepetitionPenaltyLogitsProcessor, TopKLogitsWarper, TopPLogitsWarper
+
+from app.kv_utils import cache_to_tensors, tensors_to_cache
+
+logger = logging.getLogger(__name__)
+
+
+class _Sequence:
+    """解码集合中的一条序列"""
+
+    def __init__(self, prompt_ids, temperature, max_new_tokens, adapter=None):
+        self.prompt_ids = prompt_ids
+        self.temperature = temperature
+        self.max_new_tokens = max_new_tokens
+        self.adapter = adapter
+        self.generated = []
+        self.future = Future()
+
+
+class ContinuousBatchingEngine:
+    """迭代级（continuous）批处理解码引擎
+
+    每一步对当前活跃序列集合只解码一个 token：
+    - 生成 EOS 或达到 max_new_tokens 的序列立即移出集合，不再占用算力；
+    - 队列里等待的请求在两步之间完成 prefill 并加入集合。
+
+    KV Cache 按批维度拼接并统一左填充，attention_mask 标记有效位置，
+    position_ids 按每条序列的真实长度计算，因此各序列互不影响。
+    对外接口与 BatchScheduler 一致：submit(prompt, temperature, max_new_tokens, adapter) -> Future。
+    传入 adapter_registry 时，每条序列使用自己的 LoRA 适配器，混合适配器的批次仍是一次前向。
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=8, top_p=0.9, top_k=50, repetition_penalty=1.1,
+                 adapter_registry=None, default_adapter=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.adapter_registry = adapter_registry
+        self.default_adapter = default_adapter
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.eos_token_id = tokenizer.eos_token_id
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        # 与 generate 的处理顺序一致：重复惩罚 → 温度 → top_k → top_p
+        self.top_k_warper = TopKLogitsWarper(top_k=top_k) if top_k else None
+        self.top_p_warper = TopPLogitsWarper(top_p=top_p)
+        self.repetition_processor = RepetitionPenaltyLogitsProcessor(penalty=repetition_penalty)
+
+        # 活跃序列及其批量化的 KV Cache / attention_mask（行顺序与 self.active 一致）
+        self.active = []
+        self._kv = None
+        self._attention_mask = None
+        # 重复惩罚用的 token 历史 [B, 容量] 与每行的有效长度 [B]；空位填该行的首个 token，
+        # 重复 token 不影响 gather/scatter 结果，每步只写入新 token，容量不足时成倍扩展
+        self._history = None
+        self._history_len = None
+        # 本次 step 已从队列取出、尚未并入活跃集合的新请求（失败时也要以异常结束）
+        self._pending = []
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def device(self):
+        return self.model.device
+
+    def start(self):
+        """启动后台解码线程（重复调用无副作用）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="continuous-batching", daemon=True)
+            self._thread.start()
+            logger.info(f"连续批处理引擎已启动: max_batch_size={self.max_batch_size}")
+
+    def stop(self):
+        """停止解码线程，未完成的请求以异常结束"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        error = RuntimeError("连续批处理引擎已停止")
+        for seq in self.active:
+            seq.future.set_exception(error)
+        self._release(self.active)
+        self._reset_batch()
+        while True:
+            try:
+                self._queue.get_nowait().future.set_exception(error)
+            except queue.Empty:
+                break
+
+    def submit(self, prompt, temperature, max_new_tokens, adapter=None):
+        """提交一条请求，返回 Future，结果为 prompt + 回复的完整解码文本"""
+        if self._stopped.is_set():
+            raise RuntimeError("连续批处理引擎已停止")
+        seq = self.add_request(prompt, temperature, max_new_tokens, adapter)
+        self.start()
+        return seq.future
+
+    def add_request(self, prompt, temperature, max_new_tokens, adapter=None):
+        """只入队不启动线程，便于配合 step() 同步驱动"""
+        prompt_ids = self.tokenizer(prompt)["input_ids"]
+        if self.adapter_registry is not None:
+            adapter = adapter or self.default_adapter
+        elif adapter is not None:
+            raise ValueError(f"当前模型未启用多适配器，无法使用适配器: {adapter}")
+        seq = _Sequence(prompt_ids, temperature, max_new_tokens, adapter)
+        self._queue.put(seq)
+        return seq
+
+    def has_pending(self):
+        return bool(self.active) or not self._queue.empty()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            first = None
+            if not self.active:
+                # 没有活跃序列时阻塞等待新请求
+                try:
+                    first = self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            try:
+                self.step(first)
+            except Exception as e:
+                # step 内已让受影响的请求以异常结束，引擎继续服务后续请求
+                logger.error(f"连续批处理解码失败: {e}")
+
+    @torch.no_grad()
+    def step(self, first=None):
+        """执行一次迭代：接纳新请求 -> 活跃序列解码一个 token -> 移出已完成序列"""
+        newcomers = [first] if first is not None else []
+        while len(self.active) + len(newcomers) < self.max_batch_size:
+            try:
+                newcomers.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        self._pending = newcomers
+        try:
+            decoding = list(self.active)
+            if decoding:
+                self._decode_step(decoding)
+            if newcomers:
+                self._prefill(newcomers)
+            self._pending = []
+            self._evict_finished()
+        except Exception as e:
+            self._fail(e)
+            raise
+
+    def _fail(self, error):
+        """前向失败：活跃序列与本步取出的新请求全部以异常结束，释放适配器并清空批次状态"""
+        for seq in self.active + self._pending:
+            if not seq.future.done():
+                seq.future.set_exception(error)
+        self._release(self.active)
+        self._reset_batch()
+        self._pending = []
+
+    def _reset_batch(self):
+        self.active, self._kv, self._attention_mask = [], None, None
+        self._history, self._history_len = None, None
+
+    def _adapter_kwargs(self, seqs):
+        if self.adapter_registry is None:
+            return {}
+        return {"adapter_names": [seq.adapter for seq in seqs]}
+
+    def _release(self, seqs):
+        if self.adapter_registry is not None and seqs:
+            self.adapter_registry.release([seq.adapter for seq in seqs])
+
+    def _prefill(self, newcomers):
+        """新请求左填充后一起 prefill，采样出首个 token 后并入活跃集合"""
+        if self.adapter_registry is not None:
+            try:
+                self.adapter_registry.acquire([seq.adapter for seq in newcomers])
+            except Exception as e:
+                for seq in newcomers:
+                    seq.future.set_exception(e)
+                return
+        try:
+            self._prefill_acquired(newcomers)
+        except Exception:
+            # 新请求尚未并入活跃集合，_fail 不会释放它们的适配器
+            self._release(newcomers)
+            raise
+
+    def _prefill_acquired(self, newcomers):
+        max_len = max(len(seq.prompt_ids) for seq in newcomers)
+        input_ids = torch.full((len(newcomers), max_len), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(newcomers), max_len), dtype=torch.long)
+        for i, seq in enumerate(newcomers):
+            input_ids[i, max_len - len(seq.prompt_ids):] = torch.tensor(seq.prompt_ids)
+            attention_mask[i, max_len - len(seq.prompt_ids):] = 1
+        input_ids = input_ids.to(self.device)
+        attention_mask = attention_mask.to(self.device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            use_cache=True,
+            **self._adapter_kwargs(newcomers)
+        )
+        history, history_len = self._new_history(newcomers)
+        history, history_len = self._sample(newcomers, outputs.logits[:, -1, :], history, history_len)
+        self._merge(newcomers, cache_to_tensors(outputs.past_key_values), attention_mask, history, history_len)
+
+    def _decode_step(self, decoding):
+        """对所有活跃序列各解码一个 token"""
+        input_ids = torch.tensor([[seq.generated[-1]] for seq in decoding], device=self.device)
+        position_ids = self._attention_mask.sum(-1, keepdim=True)
+        attention_mask = torch.cat([self._attention_mask, self._attention_mask.new_ones((len(decoding), 1))], dim=-1)
+
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=tensors_to_cache(self._kv),
+            use_cache=True,
+            **self._adapter_kwargs(decoding)
+        )
+        self._kv = cache_to_tensors(outputs.past_key_values)
+        self._attention_mask = attention_mask
+        self._history, self._history_len = self._sample(
+            decoding, outputs.logits[:, -1, :], self._history, self._history_len
+        )
+
+    def _new_history(self, seqs):
+        """新请求的 token 历史：只在 prefill 时由 prompt 构造一次"""
+        width = max(len(seq.prompt_ids) for seq in seqs)
+        history = torch.tensor(
+            [seq.prompt_ids + [seq.prompt_ids[0]] * (width - len(seq.prompt_ids)) for seq in seqs], device=self.device
+        )
+        history_len = torch.tensor([len(seq.prompt_ids) for seq in seqs], device=self.device)
+        return history, history_len
+
+    @staticmethod
+    def _append_history(history, history_len, tokens):
+        """在每行的有效长度处写入新 token，容量不足时成倍扩展（新列填该行的首个 token）"""
+        if int(history_len.max()) >= history.shape[1]:
+            grow = history[:, :1].expand(-1, max(history.shape[1], 16))
+            history = torch.cat([history, grow], dim=1)
+        history.scatter_(1, history_len.unsqueeze(1), tokens.unsqueeze(1))
+        return history, history_len + 1
+
+    def _sample(self, seqs, logits, history, history_len):
+        """按每条序列自己的重复惩罚、温度、top_k 和 top_p 采样下一个 token，返回更新后的历史"""
+        logits = logits.float()
+        logits = self.repetition_processor(history, logits)
+
+        temperatures = torch.tensor([seq.temperature for seq in seqs], dtype=logits.dtype, device=logits.device)
+        greedy = temperatures <= 0
+        logits = logits / torch.where(greedy, torch.ones_like(temperatures), temperatures).unsqueeze(1)
+        if self.top_k_warper is not None:
+            logits = self.top_k_warper(history, logits)
+        logits = self.top_p_warper(history, logits)
+
+        sampled = torch.multinomial(F.softmax(logits, dim=-1), num_samples=1).squeeze(1)
+        next_tokens = torch.where(greedy, logits.argmax(dim=-1), sampled)
+        for seq, token in zip(seqs, next_tokens.tolist()):
+            seq.generated.append(token)
+        return self._append_history(history, history_len, next_tokens.to(history.device))
+
+    def _merge(self, newcomers, new_kv, new_mask, new_history, new_history_len):
+        """把新序列的 KV Cache 左填充到相同长度后拼入活跃批次，token 历史右侧补齐后按行拼接"""
+        if not self.active:
+            self.active, self._kv, self._attention_mask = list(newcomers), new_kv, new_mask
+            self._history, self._history_len = new_history, new_history_len
+            return
+
+        old_len, new_len = self._attention_mask.shape[1], new_mask.shape[1]
+        target = max(old_len, new_len)
+
+        def left_pad(tensor, length, dim):
+            if tensor.shape[dim] == length:
+                return tensor
+            pad_shape = list(tensor.shape)
+            pad_shape[dim] = length - tensor.shape[dim]
+            return torch.cat([tensor.new_zeros(pad_shape), tensor], dim=dim)
+
+        self._kv = [
+            (torch.cat([left_pad(k_old, target, 2), left_pad(k_new, target, 2)], dim=0),
+             torch.cat([left_pad(v_old, target, 2), left_pad(v_new, target, 2)], dim=0))
+            for (k_old, v_old), (k_new, v_new) in zip(self._kv, new_kv)
+        ]
+        self._attention_mask = torch.cat(
+            [left_pad(self._attention_mask, target, 1), left_pad(new_mask, target, 1)], dim=0
+        )
+
+        def right_fill(history, width):
+            if history.shape[1] == width:
+                return history
+            return torch.cat([history, history[:, :1].expand(-1, width - history.shape[1])], dim=1)
+
+        width = max(self._history.shape[1], new_history.shape[1])
+        self._history = torch.cat([right_fill(self._history, width), right_fill(new_history, width)], dim=0)
+        self._history_len = torch.cat([self._history_len, new_history_len])
+        self.active.extend(newcomers)
+
+    def _is_finished(self, seq):
+        return seq.generated[-1] == self.eos_token_id or len(seq.generated) >= seq.max_new_tokens
+
+    def _evict_finished(self):
+        """立即移出已完成序列，并裁掉所有剩余行都是填充的左侧列"""
+        keep, finished = [], []
+        for i, seq in enumerate(self.active):
+            if self._is_finished(seq):
+                text = self.tokenizer.decode(seq.prompt_ids + seq.generated, skip_special_tokens=True)
+                seq.future.set_result(text)
+                finished.append(seq)
+            else:
+                keep.append(i)
+        self._release(finished)
+
+        if len(keep) == len(self.active):
+            return
+        if not keep:
+            self._reset_batch()
+            return
+
+        index = torch.tensor(keep, device=self._attention_mask.device)
+        self.active = [self.active[i] for i in keep]
+        self._history = self._history.index_select(0, index)
+        self._history_len = self._history_len.index_select(0, index)
+        attention_mask = self._attention_mask.index_select(0, index)
+        start = int((attention_mask.sum(0) > 0).nonzero()[0])
+        self._attention_mask = attention_mask[:, start:]
+        self._kv = [
+            (k.index_select(0, index)[:, :, start:], v.index_select(0, index)[:, :, start:])
+            for k, v in self._kv
+        ]
@@ -1,24 +1,61 @@
 # src/evaluate.py
+import argparse
 import torch
 from peft import PeftModel
 from transformers import AutoModelForCausalLM, AutoTokenizer
-from nltk.translate.bleu_score import sentence_bleu
-from rouge import Rouge
 import json
+from tqdm import tqdm
+from scoring import score_corpus
 
-def evaluate():
-    # 路径配置
-    base_model_path = "meta-llama/Meta-Llama-3-8B-Instruct"
-    adapter_path = "./model/lora_adapter"
-    test_data_path = "./data/adgen_dev.json"
+def build_eval_prompt(input_text):
+    """构造评测用 Prompt"""
+    return f"<|begin_of_text|><|start_header_id|>user<|end_header_id|>\n\n{input_text}<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n"
 
+def length_buckets(lengths, batch_size):
+    """按长度排序后切分成若干桶，同一桶内 prompt 长度接近，左填充很少"""
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+def generate_predictions(model, tokenizer, inputs_text, batch_size=16, max_new_tokens=256):
+    """按长度分桶批量生成，返回与 inputs_text 顺序一致的预测文本"""
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+
+    prompts = [build_eval_prompt(text) for text in inputs_text]
+    lengths = [len(ids) for ids in tokenizer(prompts)["input_ids"]]
+    predictions = [None] * len(prompts)
+
+    for bucket in tqdm(length_buckets(lengths, batch_size), desc="Generating"):
+        batch = tokenizer([prompts[i] for i in bucket], return_tensors="pt", padding=True).to(model.device)
+        with torch.no_grad():
+            outputs = model.generate(
+                **batch,
+                max_new_tokens=max_new_tokens,
+                pad_token_id=tokenizer.pad_token_id
+            )
+        # 左填充后所有 prompt 对齐到同一长度，之后的部分就是生成内容
+        generated = outputs[:, batch["input_ids"].shape[1]:]
+        for i, text in zip(bucket, tokenizer.batch_decode(generated, skip_special_tokens=True)):
+            predictions[i] = text.strip()
+
+    return predictions
+
+def compute_scores(predictions, references, num_workers=None):
+    """生成全部结束后统一计算指标，返回各指标的平均值"""
+    averages, _ = score_corpus(predictions, references, num_workers=num_workers)
+    return averages
+
+def evaluate(base_model_path="meta-llama/Meta-Llama-3-8B-Instruct", adapter_path="./model/lora_adapter",
+             test_data_path="./data/adgen_dev.json", batch_size=16, max_new_tokens=256, limit=None,
+             output_path="./results/eval_scores.json", num_workers=None):
     # 加载模型
     print("Loading models...")
     tokenizer = AutoTokenizer.from_pretrained(base_model_path)
     base_model = AutoModelForCausalLM.from_pretrained(
-        base_model_path, 
-        device_map="auto", 
-        torch_dtype=torch.float16
+        base_model_path,
+        device_map="auto",
+        torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
     )
     # 加载 LoRA 权重
     model = PeftModel.from_pretrained(base_model, adapter_path)
@@ -26,40 +63,49 @@ def evaluate():
 
     # 加载测试数据
     with open(test_data_path, 'r', encoding='utf-8') as f:
-        test_data = json.load(f)[:50] # 仅测试前50条用于演示
+        if test_data_path.endswith(".jsonl"):
+            # process_data.py --streaming 输出的 JSONL
+            test_data = [json.loads(line) for line in f if line.strip()]
+        else:
+            test_data = json.load(f)
+    if limit:
+        test_data = test_data[:limit]
 
-    rouge = Rouge()
-    scores = {'rouge-1': [], 'rouge-l': [], 'bleu-4': []}
-
-    print("Starting evaluation...")
-    for item in test_data:
-        input_text = item['input']
-        reference = item['output']
-        
-        # 构造 Prompt
-        prompt = f"<|begin_of_text|><|start_header_id|>user<|end_header_id|>\n\n{input_text}<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n"
-        inputs = tokenizer(prompt, return_tensors="pt").to("cuda")
-
-        # 推理
-        with torch.no_grad():
-            outputs = model.generate(**inputs, max_new_tokens=256)
-            generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True).split("assistant")[-1].strip()
-
-      
-        try:
-            r_score = rouge.get_scores(" ".join(generated_text), " ".join(reference))
-            scores['rouge-1'].append(r_score[0]['rouge-1']['f'])
-            scores['rouge-l'].append(r_score[0]['rouge-l']['f'])
-        except:
-            pass # 防止空字符串报错
+    print(f"Starting evaluation on {len(test_data)} examples...")
+    predictions = generate_predictions(
+        model,
+        tokenizer,
+        [item['input'] for item in test_data],
+        batch_size=batch_size,
+        max_new_tokens=max_new_tokens
+    )
+    scores = compute_scores(predictions, [item['output'] for item in test_data], num_workers=num_workers)
+    results = {name.upper(): value for name, value in scores.items()}
+    print("Evaluation Result: " + ", ".join(f"{name}: {value:.4f}" for name, value in results.items()))
 
-    # 计算平均分
-    avg_rouge1 = sum(scores['rouge-1']) / len(scores['rouge-1'])
-    print(f"Evaluation Result: ROUGE-1: {avg_rouge1:.4f}")
-    
     # 保存结果
-    with open("./results/eval_scores.json", "w") as f:
-        json.dump({"ROUGE-1": avg_rouge1}, f)
+    with open(output_path, "w") as f:
+        json.dump(results, f)
 
 if __name__ == "__main__":
-    evaluate()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="AdGen 批量评测脚本")
+    parser.add_argument("--base_model", type=str, default="meta-llama/Meta-Llama-3-8B-Instruct")
+    parser.add_argument("--adapter", type=str, default="./model/lora_adapter")
+    parser.add_argument("--data", type=str, default="./data/adgen_dev.json")
+    parser.add_argument("--batch_size", type=int, default=16, help="每个长度桶的样本数")
+    parser.add_argument("--max_new_tokens", type=int, default=256)
+    parser.add_argument("--limit", type=int, default=None, help="只评测前 N 条，默认评测全部")
+    parser.add_argument("--output", type=str, default="./results/eval_scores.json")
+    parser.add_argument("--num_workers", type=int, default=None, help="打分进程数，默认使用全部 CPU")
+
+    args = parser.parse_args()
+    evaluate(
+        base_model_path=args.base_model,
+        adapter_path=args.adapter,
+        test_data_path=args.data,
+        batch_size=args.batch_size,
+        max_new_tokens=args.max_new_tokens,
+        limit=args.limit,
+        output_path=args.output,
+        num_workers=args.num_workers
+    )
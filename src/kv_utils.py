@@ -0,0 +1,46 @@
+# app/kv_utils.py
+"""past_key_values 的通用操作
+
+transformers 不同版本的 KV Cache 结构不同（legacy tuple / DynamicCache 的
+key_cache 列表 / DynamicCache.layers），这里统一转换成 [(key, value), ...]，
+每层张量形状为 [batch, num_kv_heads, seq_len, head_dim]。
+"""
+from transformers import DynamicCache
+
+
+def cache_to_tensors(cache):
+    """把任意格式的 KV Cache 转成每层 (key, value) 的列表"""
+    if cache is None:
+        return []
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    if hasattr(cache, "key_cache"):
+        return list(zip(cache.key_cache, cache.value_cache))
+    return [(kv[0], kv[1]) for kv in cache]
+
+
+def tensors_to_cache(kv_tensors):
+    """把每层 (key, value) 的列表转回模型可以直接使用的 DynamicCache"""
+    kv_tensors = [(k, v) for k, v in kv_tensors]
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(tuple(kv_tensors))
+    return DynamicCache(ddp_cache_data=kv_tensors)
+
+
+def cache_nbytes(cache):
+    """估算 KV Cache 占用的字节数"""
+    return sum(
+        k.numel() * k.element_size() + v.numel() * v.element_size()
+        for k, v in cache_to_tensors(cache)
+    )
+
+
+def crop_cache(cache, length):
+    """只保留前 length 个位置的 KV（投机解码回退被拒绝的草稿 token 时使用）"""
+    return tensors_to_cache([(k[:, :, :length], v[:, :, :length]) for k, v in cache_to_tensors(cache)])
+
+
+def cache_length(cache):
+    """KV Cache 中已有的位置数"""
+    kv = cache_to_tensors(cache)
+    return kv[0][0].shape[2] if kv else 0
@@ -0,0 +1,62 @@
+# src/losses.py
+"""
+分块的 lm_head + 交叉熵
+
+Llama-3 词表有 128256 个 token，[N, vocab] 的 float32 logits 往往是一个训练 step 里最大的单次分配
+（再加上 softmax 的梯度，同样大小还要再来一份）。这里把 lm_head 投影和交叉熵合并，
+按 chunk_size 个位置一块计算：前向时每块算完 loss 立即算出该块对 hidden / weight 的梯度，
+logits 用完即丢，峰值只有 [chunk_size, vocab]。反向时只需把保存的梯度乘上 grad_output。
+
+代价是梯度在前向阶段就算好并保存到反向：grad_hidden 与 hidden_states 同样大小（[N, hidden]），
+grad_weight 为 float32 的 [vocab, hidden]（只在 weight 需要梯度时分配，LoRA 训练中 lm_head 冻结时没有）。
+N 只包含有 label 的位置，这两份都远小于 [N, vocab] 的 logits；hidden_states 不需要梯度时不分配 grad_hidden。
+"""
+import torch
+
+class _ChunkedLinearCrossEntropy(torch.autograd.Function):
+
+    @staticmethod
+    def forward(ctx, hidden_states, weight, labels, chunk_size):
+        grad_hidden = torch.empty_like(hidden_states) if ctx.needs_input_grad[0] else None
+        grad_weight = torch.zeros_like(weight, dtype=torch.float32) if ctx.needs_input_grad[1] else None
+        loss = torch.zeros((), dtype=torch.float32, device=hidden_states.device)
+        w = weight if weight.dtype == hidden_states.dtype else weight.to(hidden_states.dtype)
+
+        for start in range(0, hidden_states.shape[0], chunk_size):
+            h = hidden_states[start:start + chunk_size]
+            y = labels[start:start + chunk_size]
+            rows = torch.arange(h.shape[0], device=h.device)
+
+            logits = (h @ w.t()).float()
+            lse = torch.logsumexp(logits, dim=-1)
+            loss += (lse - logits[rows, y]).sum()
+
+            # d(loss)/d(logits) = softmax - one_hot，原地复用 logits 的显存
+            grad_logits = logits.sub_(lse.unsqueeze(-1)).exp_()
+            grad_logits[rows, y] -= 1
+            if grad_hidden is not None:
+                grad_hidden[start:start + chunk_size] = grad_logits.to(h.dtype) @ w
+            if grad_weight is not None:
+                grad_weight += grad_logits.t() @ h.float()
+
+        ctx.save_for_backward(grad_hidden, grad_weight)
+        ctx.weight_dtype = weight.dtype
+        return loss
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        grad_hidden, grad_weight = ctx.saved_tensors
+        if grad_hidden is not None:
+            grad_hidden = grad_hidden * grad_output.to(grad_hidden.dtype)
+        if grad_weight is not None:
+            grad_weight = (grad_weight * grad_output).to(ctx.weight_dtype)
+        return grad_hidden, grad_weight, None, None
+
+def chunked_cross_entropy(hidden_states, weight, labels, chunk_size=1024):
+    """
+    等价于 F.cross_entropy(hidden_states @ weight.T, labels, reduction="sum")，但不生成完整 logits
+    hidden_states: [N, hidden]，只包含需要计算 loss 的位置；labels: [N]
+    """
+    if hidden_states.shape[0] == 0:
+        return hidden_states.sum() * 0.0
+    return _ChunkedLinearCrossEntropy.apply(hidden_states, weight, labels, chunk_size)
@@ -1,9 +1,13 @@
 # app/main.py
+import asyncio
 import gradio as gr
 import logging
 import os
+import threading
 from app.chat_model import LoraChatModel
 from app.config import Config
+from app.metrics import start_metrics_server
+from app.request_queue import GenerationQueue, QueueFullError, iterate_in_thread
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -12,13 +16,23 @@ logger = logging.getLogger(__name__)
 def create_chat_interface():
     """创建优化布局的聊天界面"""
     
-    # 初始化模型
+    # 初始化模型（启动即在后台加载权重）
     chat_model = LoraChatModel()
+    if Config.PRELOAD_ON_BOOT:
+        chat_model.start_background_load()
     
-    def respond(message, chat_history, temperature, max_length):
+    # 所有会话共用一个生成队列：限制同时生成的请求数，其余请求排队并显示位置
+    generation_queue = GenerationQueue(
+        max_concurrency=Config.MAX_CONCURRENT_GENERATIONS,
+        max_queue_size=Config.MAX_QUEUE_SIZE,
+        overflow=Config.QUEUE_OVERFLOW
+    )
+    
+    async def respond(message, chat_history, temperature, max_length):
         try:
             if not message.strip():
-                return "", chat_history, "就绪"
+                yield "", chat_history, "就绪"
+                return
             
             # 转换历史记录格式
             history_for_model = []
@@ -29,35 +43,75 @@ def create_chat_interface():
                     elif msg['role'] == 'assistant':
                         history_for_model.append((human_msg, msg['content']))
             
-            # 生成回复
-            response = chat_model.chat(
+            # 先展示用户消息和空的助手消息，随后流式填充回复
+            chat_history.append({"role": "user", "content": message})
+            chat_history.append({"role": "assistant", "content": ""})
+            yield "", chat_history, "正在生成..."
+            
+            # 模型仍在后台预热时先接受请求，显示等待状态，加载完成后继续生成（等待不占用生成名额）
+            if not chat_model.is_loaded:
+                chat_model.start_background_load()
+                waited = 0
+                while not await asyncio.to_thread(chat_model.wait_until_loaded, 1.0):
+                    if chat_model.status == "failed":
+                        raise RuntimeError(f"模型加载失败: {chat_model.load_error}")
+                    waited += 1
+                    yield "", chat_history, f"⏳ 模型预热中，已等待 {waited}s..."
+            
+            # 客户端断开时 respond 在 yield 处被关闭，内层的异步生成器要显式 aclose，
+            # 才能立即退出队列 / 停止生成，而不是等到垃圾回收
+            admission = generation_queue.admit()
+            try:
+                async for position in admission:
+                    yield "", chat_history, f"⏳ 排队中，前面还有 {position - 1} 个请求..."
+            except QueueFullError as e:
+                logger.warning(f"⚠️ 拒绝请求: {e}")
+                chat_history[-1]["content"] = "当前使用人数较多，请稍后再试。"
+                yield "", chat_history, "❌ 服务繁忙，请稍后再试"
+                return
+            finally:
+                await admission.aclose()
+            
+            # chat_stream 在工作线程中运行，事件循环只转发文本，不阻塞其他会话。
+            # 断开时 aclose 设置 cancel：generate 在下一个 token 处停止，工作线程结束后 aclose 才返回，
+            # 之后再归还名额，同时进行的生成数不会超过上限
+            cancel = threading.Event()
+            stream = iterate_in_thread(
+                chat_model.chat_stream,
+                stop=cancel,
                 message=message,
                 history=history_for_model,
                 temperature=temperature,
-                max_length=max_length
+                max_length=max_length,
+                cancel=cancel
             )
+            try:
+                yield "", chat_history, "正在生成..."
+                async for partial in stream:
+                    chat_history[-1]["content"] = partial
+                    yield "", chat_history, "正在生成..."
+            finally:
+                await stream.aclose()
+                generation_queue.release()
             
-            # 更新历史记录
-            chat_history.append({"role": "user", "content": message})
-            chat_history.append({"role": "assistant", "content": response})
-            
-            return "", chat_history, "回复生成成功"
+            yield "", chat_history, "回复生成成功"
             
         except Exception as e:
             error_msg = f"生成失败: {str(e)}"
             logger.error(error_msg)
-            return "", chat_history, f"❌ {error_msg}"
+            yield "", chat_history, f"❌ {error_msg}"
     
     def clear_chat():
         return [], "对话已清空"
     
     def initialize_model():
-        """初始化模型"""
-        try:
-            chat_model.load_model()
+        """初始化模型：只触发后台加载并返回当前状态，不阻塞页面"""
+        chat_model.start_background_load()
+        if chat_model.status == "ready":
             return "模型就绪"
-        except Exception as e:
-            return f"❌ 加载失败: {str(e)}"
+        if chat_model.status == "failed":
+            return f"❌ 加载失败: {str(chat_model.load_error)}"
+        return "⏳ 模型预热中，可以先输入问题..."
     
     # 创建优化布局的界面
     with gr.Blocks(
@@ -493,9 +547,13 @@ def create_chat_interface():
                     )
         
         
-        # 事件绑定
-        msg.submit(respond, [msg, chatbot, temperature, max_length], [msg, chatbot, status])
-        send_btn.click(respond, [msg, chatbot, temperature, max_length], [msg, chatbot, status])
+        # 事件绑定：respond 是异步函数，排队与并发上限由 generation_queue 控制，
+        # Gradio 层的并发上限放宽到 生成名额 + 排队名额，保证排队中的请求也能收到位置提示
+        respond_limit = Config.MAX_CONCURRENT_GENERATIONS + Config.MAX_QUEUE_SIZE
+        msg.submit(respond, [msg, chatbot, temperature, max_length], [msg, chatbot, status],
+                   concurrency_limit=respond_limit)
+        send_btn.click(respond, [msg, chatbot, temperature, max_length], [msg, chatbot, status],
+                       concurrency_limit=respond_limit)
         clear_btn.click(clear_chat, outputs=[chatbot, status])
         
         # 页面加载时初始化模型
@@ -506,9 +564,16 @@ def create_chat_interface():
 if __name__ == "__main__":
     print("启动广告生成助手...")
     print(f"服务地址: http://{Config.SERVER_HOST}:{Config.SERVER_PORT}")
+    if Config.ENABLE_METRICS:
+        start_metrics_server(Config.SERVER_HOST, Config.METRICS_PORT)
+        print(f"监控指标: http://{Config.SERVER_HOST}:{Config.METRICS_PORT}/metrics")
     
-    # 创建并启动界面
+    # 创建并启动界面：Gradio 队列只作为最外层的保护，超过 GRADIO_QUEUE_MAX_SIZE 的事件直接拒绝
     demo = create_chat_interface()
+    demo.queue(
+        default_concurrency_limit=Config.GRADIO_DEFAULT_CONCURRENCY,
+        max_size=Config.GRADIO_QUEUE_MAX_SIZE
+    )
     demo.launch(
         server_name=Config.SERVER_HOST,
         server_port=Config.SERVER_PORT,
@@ -0,0 +1,297 @@
+# app/metrics.py
+"""
+进程内指标注册表 + Prometheus 文本格式导出
+
+LoraChatModel 对每个请求记录一条 RequestTrace：tokenize / prefill / decode / detokenize / cleanup
+等阶段耗时，以及输入、输出 token 数。请求结束时写入 REGISTRY 中的直方图，
+由 start_metrics_server 在 Gradio 旁边单独开一个端口，以 /metrics 暴露给 Prometheus 抓取。
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# 秒级耗时分桶：覆盖几毫秒的分词到几十秒的长回复
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+SPEEDUP_BUCKETS = (0.5, 0.75, 1.0, 1.25, 1.5, 2.0, 2.5, 3.0, 4.0, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 的标签应为 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @property
+    def exposed_name(self):
+        """导出时的指标名，HELP / TYPE 行与样本行使用同一个名字"""
+        return self.name
+
+    def render(self):
+        lines = [f"# HELP {self.exposed_name} {self.help}", f"# TYPE {self.exposed_name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+
+class Counter(_Metric):
+    """单调递增计数器，按 Prometheus 约定以 `<name>_total` 导出"""
+    type_name = "counter"
+
+    @property
+    def exposed_name(self):
+        return self.name if self.name.endswith("_total") else f"{self.name}_total"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self, items):
+        for key, value in items:
+            yield f"{self.exposed_name}{_format_labels(list(zip(self.labelnames, key)))} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """固定分桶直方图，导出 _bucket（累计）/ _sum / _count"""
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self, **labels):
+        """返回 (count, sum)，未观测过时为 (0, 0.0)"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return (state[2], state[1]) if state else (0, 0.0)
+
+    def _render_samples(self, items):
+        for key, (counts, total, count) in items:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield f"{self.name}_bucket{_format_labels(pairs + [('le', _format_value(bound))])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(pairs)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(pairs)} {count}"
+
+
+class MetricsRegistry:
+    """按名称注册指标；重复注册同名同类型指标时返回已有实例"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"指标 {name} 已注册为 {metric.type_name}")
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render(self):
+        """Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class RequestTrace:
+    """
+    一次生成的结构化耗时记录
+    kind 区分调用入口：chat / stream / batch（静态批处理调度器中的一次合并生成）。
+    同名阶段多次进入时耗时累加；finish() 把阶段耗时、总耗时和 token 数写入注册表。
+    """
+
+    def __init__(self, kind, registry=REGISTRY):
+        self.kind = kind
+        self.registry = registry
+        self.start = time.perf_counter()
+        self.spans = {}
+        self.token_counts = []
+        self.first_token_at = None
+        self.speculative = None
+        self.response_cache = None      # 查询了回复缓存时为 "hit" / "miss"
+        self._finished = False
+
+    @contextmanager
+    def span(self, stage):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(stage, time.perf_counter() - begin)
+
+    def add_span(self, stage, seconds):
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    def add_tokens(self, prompt_tokens, completion_tokens):
+        """记录一条序列的输入 / 输出 token 数（批量生成时每行调用一次）"""
+        self.token_counts.append((int(prompt_tokens), int(completion_tokens)))
+
+    def add_speculative(self, drafted, accepted, target_steps, tokens_per_step, speedup):
+        """记录一次投机解码的草稿数、接受数、目标前向次数、每次前向产出的 token 数与估算加速比"""
+        self.speculative = (int(drafted), int(accepted), int(target_steps), tokens_per_step, speedup)
+
+    def mark_first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def finish(self, status="ok"):
+        if self._finished:
+            return
+        self._finished = True
+        elapsed = time.perf_counter() - self.start
+        registry = self.registry
+
+        registry.counter("adgen_requests", "生成请求数", ("kind", "status")).inc(kind=self.kind, status=status)
+        registry.histogram(
+            "adgen_request_duration_seconds", "单次生成的端到端耗时", ("kind",)
+        ).observe(elapsed, kind=self.kind)
+        stage_hist = registry.histogram(
+            "adgen_stage_duration_seconds", "生成各阶段耗时", ("kind", "stage")
+        )
+        for stage, seconds in self.spans.items():
+            stage_hist.observe(seconds, kind=self.kind, stage=stage)
+        if self.first_token_at is not None:
+            registry.histogram(
+                "adgen_time_to_first_token_seconds", "从收到请求到第一个 token 的耗时", ("kind",)
+            ).observe(self.first_token_at - self.start, kind=self.kind)
+
+        prompt_hist = registry.histogram(
+            "adgen_prompt_tokens", "每条序列的输入 token 数", ("kind",), buckets=TOKEN_BUCKETS
+        )
+        completion_hist = registry.histogram(
+            "adgen_completion_tokens", "每条序列的输出 token 数", ("kind",), buckets=TOKEN_BUCKETS
+        )
+        for prompt_tokens, completion_tokens in self.token_counts:
+            prompt_hist.observe(prompt_tokens, kind=self.kind)
+            completion_hist.observe(completion_tokens, kind=self.kind)
+
+        if self.response_cache is not None:
+            registry.counter(
+                "adgen_response_cache_lookups", "回复缓存查询次数", ("kind", "result")
+            ).inc(kind=self.kind, result=self.response_cache)
+
+        if self.speculative is not None:
+            drafted, accepted, target_steps, tokens_per_step, speedup = self.speculative
+            registry.counter(
+                "adgen_speculative_draft_tokens", "投机解码草稿器提出的 token 数", ("kind",)
+            ).inc(drafted, kind=self.kind)
+            registry.counter(
+                "adgen_speculative_accepted_tokens", "被目标模型接受的草稿 token 数", ("kind",)
+            ).inc(accepted, kind=self.kind)
+            registry.counter(
+                "adgen_speculative_target_steps", "投机解码中目标模型的前向次数", ("kind",)
+            ).inc(target_steps, kind=self.kind)
+            if drafted:
+                registry.histogram(
+                    "adgen_speculative_acceptance_rate", "每次生成的草稿接受率", ("kind",), buckets=RATIO_BUCKETS
+                ).observe(accepted / drafted, kind=self.kind)
+            registry.histogram(
+                "adgen_speculative_tokens_per_step", "每次目标前向产出的 token 数", ("kind",), buckets=SPEEDUP_BUCKETS
+            ).observe(tokens_per_step, kind=self.kind)
+            registry.histogram(
+                "adgen_speculative_speedup", "解码阶段相对逐 token 解码的估算加速比", ("kind",), buckets=SPEEDUP_BUCKETS
+            ).observe(speedup, kind=self.kind)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            spans = ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in self.spans.items())
+            logger.debug(f"[{self.kind}] {status} total={elapsed * 1000:.1f}ms {spans} tokens={self.token_counts}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host, port, registry=REGISTRY):
+    """在后台线程启动 /metrics 端点，返回 HTTPServer（调用 shutdown() 停止）"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    logger.info(f"✅ 指标端点已启动: http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,78 @@
+# app/model_cache.py
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+logger = logging.getLogger(__name__)
+
+# 基础模型只对这些小文件做内容哈希，权重分片按文件名、大小和修改时间计入，避免每次启动读取 16GB 权重
+_BASE_MODEL_META_FILES = ("config.json", "generation_config.json", "model.safetensors.index.json")
+_ADAPTER_FILES = ("adapter_config.json", "adapter_model.safetensors", "adapter_model.bin")
+
+
+def _hash_file(hasher, path, chunk_size=1 << 20):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+
+
+def model_fingerprint(base_model_path, lora_path=None, extra=None):
+    """基础模型 + LoRA 适配器（+ 额外参数）的指纹，用作磁盘缓存的键"""
+    hasher = hashlib.sha256()
+
+    for name in _BASE_MODEL_META_FILES:
+        path = os.path.join(base_model_path, name)
+        if os.path.exists(path):
+            hasher.update(name.encode())
+            _hash_file(hasher, path)
+    for name in sorted(os.listdir(base_model_path)):
+        if name.endswith((".safetensors", ".bin")):
+            # 大小相同的重新导出分片也会改变修改时间
+            stat = os.stat(os.path.join(base_model_path, name))
+            hasher.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+    if lora_path is not None:
+        for name in _ADAPTER_FILES:
+            path = os.path.join(lora_path, name)
+            if os.path.exists(path):
+                hasher.update(name.encode())
+                _hash_file(hasher, path)
+
+    if extra:
+        hasher.update(json.dumps(extra, sort_keys=True).encode())
+
+    return hasher.hexdigest()[:16]
+
+
+def cached_model_dir(cache_root, fingerprint):
+    """缓存目录存在且写入完整时返回其路径，否则返回 None"""
+    path = os.path.join(cache_root, fingerprint)
+    if os.path.exists(os.path.join(path, "config.json")):
+        return path
+    return None
+
+
+def save_model_to_cache(model, cache_root, fingerprint):
+    """以 safetensors 格式保存到缓存目录，先写临时目录再改名，避免中断后留下半成品"""
+    path = os.path.join(cache_root, fingerprint)
+    tmp_path = path + ".tmp"
+    old_path = path + ".old"
+    for stale in (tmp_path, old_path):
+        if os.path.exists(stale):
+            shutil.rmtree(stale)
+    os.makedirs(cache_root, exist_ok=True)
+
+    try:
+        model.save_pretrained(tmp_path, safe_serialization=True)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    # 旧缓存先整体改名再删除：任何时刻中断，path 要么不存在，要么是一份完整的缓存
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    logger.info(f"✅ 模型已缓存到: {path}")
+    return path
@@ -0,0 +1,98 @@
+# app/prefix_cache.py
+import logging
+import threading
+from collections import OrderedDict
+
+from app.kv_utils import cache_to_tensors, tensors_to_cache
+
+logger = logging.getLogger(__name__)
+
+
+class PrefixKVCache:
+    """按 token ID 前缀缓存 past_key_values
+
+    固定的系统提示词和多轮对话中已经出现过的前缀只需 prefill 一次，
+    之后的请求命中最长的已缓存前缀，只对新增部分做 prefill。
+    条目按 LRU 淘汰，总占用不超过 max_bytes。
+    namespace 用于区分不同的 LoRA 适配器，同一前缀在不同适配器下的 KV 不能混用。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()   # (namespace, tuple(token_ids)) -> ([(key, value), ...], nbytes)
+        self._lengths = {}              # 前缀长度 -> 该长度的条目数
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, input_ids, namespace=None):
+        """返回 (命中长度, 可直接传给 generate 的 past_key_values)，未命中返回 (0, None)
+
+        命中长度至少比 input_ids 少一个 token，保证 generate 仍有输入可以 prefill。
+        """
+        with self._lock:
+            for length in sorted(self._lengths, reverse=True):
+                if length >= len(input_ids):
+                    continue
+                key = (namespace, tuple(input_ids[:length]))
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    kv, _ = self._entries[key]
+                    # 每次返回新的 Cache 对象，generate 追加时不会修改缓存里的张量
+                    return length, tensors_to_cache(kv)
+            self.misses += 1
+            return 0, None
+
+    def store(self, input_ids, past_key_values, length=None, namespace=None):
+        """缓存 input_ids[:length] 对应的 KV（past_key_values 可以比 length 更长）"""
+        length = len(input_ids) if length is None else length
+        key = (namespace, tuple(input_ids[:length]))
+        if length == 0:
+            return
+
+        kv = [
+            (k[:, :, :length].clone(), v[:, :, :length].clone())
+            for k, v in cache_to_tensors(past_key_values)
+        ]
+        nbytes = sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in kv)
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = (kv, nbytes)
+            self._lengths[length] = self._lengths.get(length, 0) + 1
+            self.total_bytes += nbytes
+
+            while self.total_bytes > self.max_bytes:
+                evicted_key, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_bytes
+                evicted_length = len(evicted_key[1])
+                self._lengths[evicted_length] -= 1
+                if self._lengths[evicted_length] == 0:
+                    del self._lengths[evicted_length]
+                logger.debug(f"前缀缓存淘汰 {evicted_length} tokens 条目")
+
+    def drop_namespace(self, namespace):
+        """丢弃某个命名空间（适配器）下的全部条目，适配器权重替换后调用"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == namespace]:
+                _, nbytes = self._entries.pop(key)
+                self.total_bytes -= nbytes
+                length = len(key[1])
+                self._lengths[length] -= 1
+                if self._lengths[length] == 0:
+                    del self._lengths[length]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._lengths.clear()
+            self.total_bytes = 0
@@ -1,11 +1,30 @@
+import hashlib
 import json
 import os
-import random
 import argparse
+import shutil
+from multiprocessing import Pool
 from tqdm import tqdm
+# 分词相关的依赖（transformers、token_dataset）在用到的函数内导入：
+# 服务侧的 app.batch_generate 只需要模板和属性解析函数，导入本模块时不应依赖训练侧代码
 
-# 配置随机种子，保证复现性
-random.seed(42)
+# 训练与推理共用的 System Prompt
+SYSTEM_PROMPT = "你是一个专业的电商文案策划师，请根据以下商品属性，撰写一段吸引人的营销文案。"
+
+# 回复结束标记，训练样本 = prompt + output + EOT
+EOT_TOKEN = "<|eot_id|>"
+
+# 分词缓存格式版本，清洗或 label 构造逻辑变化时递增，使旧缓存失效
+TOKENIZED_CACHE_VERSION = 3
+
+# 每个分片处理的原始数据字节数上限，控制单个 worker 的内存占用
+SHARD_BYTES = 64 * 1024 * 1024
+
+def build_prompt(instruction, input_text):
+    """
+    构建 Llama-3 对话模板，以 assistant 头结尾，后面直接接回复内容
+    """
+    return f"<|begin_of_text|><|start_header_id|>system<|end_header_id|>\n\n{instruction}<|eot_id|><|start_header_id|>user<|end_header_id|>\n\n{input_text}<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n"
 
 def parse_adgen_content(content_str):
     """
@@ -31,6 +50,73 @@ def parse_adgen_content(content_str):
                 
     return "; ".join(parsed_props)
 
+def clean_record(line, system_prompt=SYSTEM_PROMPT):
+    """
+    清洗一行原始数据并转换为 Alpaca 格式，不合格的样本返回 None
+    """
+    try:
+        item = json.loads(line.strip())
+    except json.JSONDecodeError:
+        return None
+
+    raw_content = item.get('content', '')
+    summary = item.get('summary', '')
+
+    # --- 数据清洗逻辑 ---
+    # 1. 过滤掉 summary 太短的样本 (可能是脏数据)
+    if len(summary) < 10:
+        return None
+
+    # 2. 解析 Input
+    parsed_input = parse_adgen_content(raw_content)
+
+    if not parsed_input:
+        return None
+
+    # 3. 简单的文本清洗 (去除可能的 HTML 标签或乱码)
+    summary = summary.replace("&nbsp;", " ").strip()
+
+    # --- 构建 Alpaca 格式 ---
+    return {
+        "instruction": system_prompt,
+        "input": parsed_input,
+        "output": summary
+    }
+
+def is_train_sample(entry, split_ratio=0.99):
+    """
+    按样本内容的哈希值确定性地划分训练/验证集，无需全局 shuffle；
+    内容相同的样本总会落在同一侧，避免重复样本泄漏到验证集
+    """
+    key = (entry["input"] + "\x00" + entry["output"]).encode('utf-8')
+    bucket = int.from_bytes(hashlib.md5(key).digest()[:8], 'big') / 2 ** 64
+    return bucket < split_ratio
+
+def write_dataset_info(output_dir, train_file="adgen_train.json", dev_file="adgen_dev.json"):
+    """
+    生成 dataset_info.json (LLaMA-Factory 需要，虽然你现在用自定义脚本，但保留这个是个好习惯)
+    """
+    dataset_info = {
+        "adgen_train": {
+            "file_name": train_file,
+            "columns": {
+                "prompt": "instruction",
+                "query": "input",
+                "response": "output"
+            }
+        },
+        "adgen_dev": {
+            "file_name": dev_file,
+            "columns": {
+                "prompt": "instruction",
+                "query": "input",
+                "response": "output"
+            }
+        }
+    }
+    with open(os.path.join(output_dir, "dataset_info.json"), 'w', encoding='utf-8') as f:
+        json.dump(dataset_info, f, ensure_ascii=False, indent=2)
+
 def format_data(raw_file_path, output_dir, split_ratio=0.99):
     """
     读取原始数据，清洗、格式化并划分数据集
@@ -46,7 +132,7 @@ def format_data(raw_file_path, output_dir, split_ratio=0.99):
         
     
     # 定义 System Prompt
-    system_prompt = "你是一个专业的电商文案策划师，请根据以下商品属性，撰写一段吸引人的营销文案。"
+    system_prompt = SYSTEM_PROMPT
     
     # 统计变量
     total_tokens = 0
@@ -54,54 +140,23 @@ def format_data(raw_file_path, output_dir, split_ratio=0.99):
     skipped_count = 0
     
     for line in tqdm(lines, desc="Processing"):
-        try:
-            item = json.loads(line.strip())
-            
-            raw_content = item.get('content', '')
-            summary = item.get('summary', '')
-            
-            # --- 数据清洗逻辑 ---
-            # 1. 过滤掉 summary 太短的样本 (可能是脏数据)
-            if len(summary) < 10:
-                skipped_count += 1
-                continue
-                
-            # 2. 解析 Input
-            parsed_input = parse_adgen_content(raw_content)
-            
-            if not parsed_input:
-                skipped_count += 1
-                continue
+        entry = clean_record(line, system_prompt)
+        if entry is None:
+            skipped_count += 1
+            continue
 
-            # 3. 简单的文本清洗 (去除可能的 HTML 标签或乱码)
-            summary = summary.replace("&nbsp;", " ").strip()
+        # 简单的长度统计 (按字符估算)
+        cur_len = len(entry["input"]) + len(entry["output"])
+        total_tokens += cur_len
+        if cur_len > max_len:
+            max_len = cur_len
 
-            # --- 构建 Alpaca 格式 ---
-            entry = {
-                "instruction": system_prompt,
-                "input": parsed_input,
-                "output": summary
-            }
-            
-            # 简单的长度统计 (按字符估算)
-            cur_len = len(parsed_input) + len(summary)
-            total_tokens += cur_len
-            if cur_len > max_len:
-                max_len = cur_len
-                
-            data_list.append(entry)
-            
-        except json.JSONDecodeError:
-            continue
+        data_list.append(entry)
 
-   
-    
     # --- 数据集划分 ---
-    random.shuffle(data_list)
-    split_idx = int(len(data_list) * split_ratio)
-    
-    train_data = data_list[:split_idx]
-    dev_data = data_list[split_idx:]
+    # 与流式处理和训练时的分词缓存使用同一哈希规则，验证集不会混入训练样本
+    train_data = [entry for entry in data_list if is_train_sample(entry, split_ratio)]
+    dev_data = [entry for entry in data_list if not is_train_sample(entry, split_ratio)]
     
     # --- 确保输出目录存在 ---
     os.makedirs(output_dir, exist_ok=True)
@@ -118,32 +173,231 @@ def format_data(raw_file_path, output_dir, split_ratio=0.99):
         
 
     
-    # 生成 dataset_info.json (LLaMA-Factory 需要，虽然你现在用自定义脚本，但保留这个是个好习惯)
-    dataset_info = {
-        "adgen_train": {
-            "file_name": "adgen_train.json",
-            "columns": {
-                "prompt": "instruction",
-                "query": "input",
-                "response": "output"
-            }
-        },
-        "adgen_dev": {
-            "file_name": "adgen_dev.json",
-            "columns": {
-                "prompt": "instruction",
-                "query": "input",
-                "response": "output"
-            }
-        }
+    write_dataset_info(output_dir)
+
+def format_data_streaming(raw_file_path, output_dir, split_ratio=0.99):
+    """
+    流式处理原始数据：逐行读取、按哈希划分、逐行写出 JSONL，内存占用不随数据量增长
+    """
+    print(f"🔄 正在流式处理原始数据: {raw_file_path} ...")
+
+    os.makedirs(output_dir, exist_ok=True)
+    train_path = os.path.join(output_dir, "adgen_train.jsonl")
+    dev_path = os.path.join(output_dir, "adgen_dev.jsonl")
+
+    train_count, dev_count, skipped_count = 0, 0, 0
+    with open(raw_file_path, 'r', encoding='utf-8') as f_in, \
+            open(train_path, 'w', encoding='utf-8') as f_train, \
+            open(dev_path, 'w', encoding='utf-8') as f_dev:
+        for line in tqdm(f_in, desc="Processing"):
+            entry = clean_record(line, SYSTEM_PROMPT)
+            if entry is None:
+                skipped_count += 1
+                continue
+
+            record = json.dumps(entry, ensure_ascii=False) + "\n"
+            if is_train_sample(entry, split_ratio):
+                f_train.write(record)
+                train_count += 1
+            else:
+                f_dev.write(record)
+                dev_count += 1
+
+    write_dataset_info(output_dir, "adgen_train.jsonl", "adgen_dev.jsonl")
+    print(f"✅ 处理完成: 训练集 {train_count} 条, 验证集 {dev_count} 条, 跳过 {skipped_count} 条")
+
+def tokenizer_fingerprint(tokenizer):
+    """
+    分词器指纹：词表/合并规则与特殊 token 任一变化都会改变指纹
+    """
+    h = hashlib.sha256(type(tokenizer).__name__.encode('utf-8'))
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        h.update(backend.to_str().encode('utf-8'))
+    else:
+        h.update(json.dumps(sorted(tokenizer.get_vocab().items()), ensure_ascii=False).encode('utf-8'))
+    h.update(json.dumps(tokenizer.special_tokens_map, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return h.hexdigest()
+
+def template_fingerprint():
+    """
+    模板指纹：System Prompt 或 Llama-3 模板变化时缓存需要重建
+    """
+    template = build_prompt(SYSTEM_PROMPT, "{input}") + "{output}" + EOT_TOKEN
+    return hashlib.sha256(template.encode('utf-8')).hexdigest()
+
+def tokenized_cache_key(raw_file_path, tokenizer, split_ratio, mask_prompt=True):
+    stat = os.stat(raw_file_path)
+    parts = [
+        str(TOKENIZED_CACHE_VERSION),
+        os.path.abspath(raw_file_path), str(stat.st_size), str(int(stat.st_mtime)),
+        str(split_ratio),
+        str(mask_prompt),
+        tokenizer_fingerprint(tokenizer),
+        template_fingerprint(),
+    ]
+    return hashlib.sha256("\n".join(parts).encode('utf-8')).hexdigest()[:16]
+
+def _line_aligned_shards(raw_file_path, shard_bytes=SHARD_BYTES, min_shards=1):
+    """
+    按字节把原始 JSONL 切成若干 [start, end) 区间，每个区间都从行首开始
+    """
+    size = os.path.getsize(raw_file_path)
+    num_shards = max(min_shards, (size + shard_bytes - 1) // shard_bytes, 1)
+    step = max(1, size // num_shards)
+    bounds = [0]
+    with open(raw_file_path, 'rb') as f:
+        for i in range(1, num_shards):
+            f.seek(max(i * step, bounds[-1]))
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+_worker_tokenizer = None
+
+def _init_tokenize_worker(tokenizer_path):
+    from transformers import AutoTokenizer
+
+    global _worker_tokenizer
+    _worker_tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+
+def tokenize_texts(tokenizer, prompts, responses, mask_prompt=True):
+    """
+    批量分词，返回 [(input_ids, label_start)]
+    prompt 与回复分开分词再拼接，边界与推理时（先编码 prompt 再续写）一致；
+    mask_prompt 为 True 时只对回复计算 loss（assistant 头及之前的 label 为 -100），否则 label_start 为 0
+    """
+    prompt_ids = tokenizer(prompts)["input_ids"]
+    response_ids = tokenizer(responses, add_special_tokens=False)["input_ids"]
+    return [
+        (p + r, len(p) if mask_prompt else 0)
+        for p, r in zip(prompt_ids, response_ids)
+    ]
+
+def _tokenize_shard(task):
+    """
+    worker：清洗 + 解析属性 + 套模板 + 批量分词，训练样本写成分片 token 文件，验证样本写成 JSONL
+    """
+    from token_dataset import TokenFileWriter
+
+    raw_file_path, start, end, shard_dir, split_ratio, batch_size, mask_prompt = task
+    writer = TokenFileWriter(shard_dir)
+    prompts, responses = [], []
+    skipped, dev_count = 0, 0
+
+    def flush():
+        for input_ids, label_start in tokenize_texts(_worker_tokenizer, prompts, responses, mask_prompt):
+            writer.add(input_ids, label_start)
+        prompts.clear()
+        responses.clear()
+
+    with open(raw_file_path, 'rb') as f, writer, \
+            open(os.path.join(shard_dir, "dev.jsonl"), 'w', encoding='utf-8') as f_dev:
+        f.seek(start)
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            entry = clean_record(line.decode('utf-8', errors='ignore'), SYSTEM_PROMPT)
+            if entry is None:
+                skipped += 1
+                continue
+            if not is_train_sample(entry, split_ratio):
+                f_dev.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                dev_count += 1
+                continue
+            prompts.append(build_prompt(entry["instruction"], entry["input"]))
+            responses.append(entry["output"] + EOT_TOKEN)
+            if len(prompts) >= batch_size:
+                flush()
+        if prompts:
+            flush()
+
+    return len(writer), dev_count, skipped
+
+def build_tokenized_dataset(raw_file_path, tokenizer_path, cache_root="./data/tokenized",
+                            split_ratio=0.99, num_proc=None, batch_size=1000, mask_prompt=True):
+    """
+    多进程单遍预处理：原始 JSONL 按行对齐分片，各 worker 独立完成清洗、模板构造和分词。
+    结果缓存在 cache_root/<key>/，key 由原始文件、分词器和模板共同决定，命中时直接返回。
+    返回缓存目录，训练集为其中的内存映射 token 文件（load_tokenized_dataset 读取），验证集为 adgen_dev.jsonl。
+    """
+    from transformers import AutoTokenizer
+    from token_dataset import merge_token_dirs
+
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+    cache_dir = os.path.join(cache_root, tokenized_cache_key(raw_file_path, tokenizer, split_ratio, mask_prompt))
+    if os.path.exists(os.path.join(cache_dir, "meta.json")):
+        print(f"✅ 命中分词缓存: {cache_dir}")
+        return cache_dir
+
+    num_proc = num_proc or os.cpu_count() or 1
+    shards = _line_aligned_shards(raw_file_path, min_shards=num_proc)
+    tmp_dir = cache_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tasks = []
+    for i, (start, end) in enumerate(shards):
+        shard_dir = os.path.join(tmp_dir, f"shard_{i:05d}")
+        os.makedirs(shard_dir)
+        tasks.append((raw_file_path, start, end, shard_dir, split_ratio, batch_size, mask_prompt))
+
+    print(f"🔄 正在分词: {raw_file_path}，{len(shards)} 个分片，{num_proc} 个进程 ...")
+    with Pool(min(num_proc, len(tasks)), initializer=_init_tokenize_worker, initargs=(tokenizer_path,)) as pool:
+        stats = list(tqdm(pool.imap(_tokenize_shard, tasks), total=len(tasks), desc="Tokenizing"))
+
+    # 按分片顺序合并验证集，保证输出与进程调度无关
+    with open(os.path.join(tmp_dir, "adgen_dev.jsonl"), 'w', encoding='utf-8') as f_dev:
+        for task in tasks:
+            dev_path = os.path.join(task[3], "dev.jsonl")
+            with open(dev_path, 'r', encoding='utf-8') as f_shard:
+                shutil.copyfileobj(f_shard, f_dev)
+            os.remove(dev_path)
+
+    # 分片合并为一份 tokens.bin + offsets.npy + label_starts.npy
+    train_count = merge_token_dirs([task[3] for task in tasks], tmp_dir)
+    for task in tasks:
+        shutil.rmtree(task[3])
+
+    dev_count = sum(s[1] for s in stats)
+    skipped_count = sum(s[2] for s in stats)
+    meta = {
+        "raw_file": os.path.abspath(raw_file_path),
+        "tokenizer": tokenizer_path,
+        "mask_prompt": mask_prompt,
+        "train": train_count,
+        "dev": dev_count,
+        "skipped": skipped_count,
     }
-    with open(os.path.join(output_dir, "dataset_info.json"), 'w', encoding='utf-8') as f:
-        json.dump(dataset_info, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(tmp_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+    print(f"✅ 分词完成: 训练集 {train_count} 条, 验证集 {dev_count} 条, 跳过 {skipped_count} 条 -> {cache_dir}")
+    return cache_dir
+
+def load_tokenized_dataset(cache_dir):
+    """
+    读取 build_tokenized_dataset 生成的训练集（内存映射，启动时不读取数据）
+    """
+    from token_dataset import MemmapTokenDataset
+
+    return MemmapTokenDataset(cache_dir)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="AdGen 数据预处理脚本")
     parser.add_argument("--raw_file", type=str, default="./data/raw_data.json", help="原始 AdGen 数据文件路径 (JSONL格式)")
     parser.add_argument("--output_dir", type=str, default="./data", help="处理后数据的保存目录")
+    parser.add_argument("--streaming", action="store_true", help="流式处理并输出 JSONL，适合大规模原始数据")
+    parser.add_argument("--tokenizer", type=str, default=None, help="指定分词器后直接多进程生成训练用的分词缓存")
+    parser.add_argument("--cache_dir", type=str, default="./data/tokenized", help="分词缓存根目录")
+    parser.add_argument("--num_proc", type=int, default=None, help="分词进程数，默认使用全部 CPU")
     
     args = parser.parse_args()
     
@@ -151,5 +405,9 @@ if __name__ == "__main__":
     if not os.path.exists(args.raw_file):
         print(f"❌ 错误: 找不到原始文件 {args.raw_file}")
         print("请下载 AdGen 数据集 (train.json) 并放置在 data 目录下，或使用 --raw_file 指定路径。")
+    elif args.tokenizer:
+        build_tokenized_dataset(args.raw_file, args.tokenizer, cache_root=args.cache_dir, num_proc=args.num_proc)
+    elif args.streaming:
+        format_data_streaming(args.raw_file, args.output_dir)
     else:
         format_data(args.raw_file, args.output_dir)
\ No newline at end of file
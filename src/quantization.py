@@ -0,0 +1,232 @@
+# app/quantization.py
+"""
+CPU 推理的仅权重量化（weight-only）：线性层权重存为 int8 / int4，激活仍为 bf16 / fp32
+
+- int8：逐输出通道对称量化，scale = max|w| / 127；
+- int4：按输入维度分组（默认每组 128 个）对称量化，scale = max|w| / 7，两个 4bit 值打包进一个字节。
+
+量化在合并 LoRA 之后进行，只替换 Llama 解码层中的 q/k/v/o/gate/up/down 投影，
+embedding 与 lm_head 保持原精度。解码（每次只有几行输入）时调用 PyTorch 的 CPU 低比特矩阵乘内核，
+直接读取量化后的权重，内存带宽约为 bf16 的 1/2（int8）或 1/4（int4）；
+prefill 等行数较多的输入改为反量化后走 F.linear，避免低比特内核在大矩阵上慢于 bf16 的 GEMM。
+
+磁盘缓存保存与 PyTorch 版本、CPU 指令集无关的格式（int4 为低 4 位在前的简单打包），
+加载后由 prepare_quantized_model 转成当前机器上内核需要的布局。
+"""
+import json
+import logging
+import os
+import shutil
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from safetensors.torch import save_model
+
+logger = logging.getLogger(__name__)
+
+QUANT_MODES = ("int8", "int4")
+QUANTIZABLE_MODULES = ("q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj")
+QUANT_CONFIG_FILE = "quantization.json"
+
+# 输入行数（batch × 新 token 数）不超过该值时使用低比特内核，否则反量化后走 F.linear
+KERNEL_MAX_ROWS = 16
+
+_HAS_INT8_KERNEL = hasattr(torch, "_weight_int8pack_mm")
+_HAS_INT4_KERNEL = (
+    hasattr(torch.ops.aten, "_weight_int4pack_mm_for_cpu")
+    and hasattr(torch.ops.aten, "_convert_weight_to_int4pack_for_cpu")
+)
+# int4 内核只接受这几种分组大小，其他分组大小走反量化路径
+_INT4_KERNEL_GROUP_SIZES = (32, 64, 128, 256)
+
+
+class Int8Linear(nn.Module):
+    """int8 权重 + 逐输出通道 scale 的线性层"""
+
+    def __init__(self, in_features, out_features, bias=False, dtype=torch.bfloat16):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.register_buffer("qweight", torch.empty(out_features, in_features, dtype=torch.int8))
+        self.register_buffer("scales", torch.empty(out_features, dtype=dtype))
+        self.register_buffer("bias", torch.empty(out_features, dtype=dtype) if bias else None)
+
+    @classmethod
+    def from_linear(cls, linear, dtype):
+        weight = linear.weight.detach().float()
+        module = cls(linear.in_features, linear.out_features, linear.bias is not None, dtype)
+        scales = weight.abs().amax(dim=1).clamp(min=1e-8) / 127
+        module.qweight.copy_(torch.round(weight / scales[:, None]).clamp(-128, 127))
+        module.scales.copy_(scales)
+        if linear.bias is not None:
+            module.bias.copy_(linear.bias.detach())
+        return module
+
+    def forward(self, x):
+        rows = x.reshape(-1, self.in_features)
+        if _HAS_INT8_KERNEL and rows.shape[0] <= KERNEL_MAX_ROWS:
+            output = torch._weight_int8pack_mm(rows.contiguous(), self.qweight, self.scales.to(x.dtype))
+        else:
+            output = F.linear(rows, self.qweight.to(x.dtype)) * self.scales.to(x.dtype)
+        if self.bias is not None:
+            output = output + self.bias.to(x.dtype)
+        return output.view(*x.shape[:-1], self.out_features)
+
+    def extra_repr(self):
+        return f"in_features={self.in_features}, out_features={self.out_features}, bits=8"
+
+
+class Int4Linear(nn.Module):
+    """int4 权重 + 按组 scale 的线性层；qweight 每个字节的低 4 位为偶数列、高 4 位为奇数列，数值偏移 8 存为 0~15"""
+
+    def __init__(self, in_features, out_features, group_size, bias=False, dtype=torch.bfloat16):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.group_size = group_size
+        self.register_buffer("qweight", torch.empty(out_features, in_features // 2, dtype=torch.uint8))
+        self.register_buffer("scales", torch.empty(out_features, in_features // group_size, dtype=dtype))
+        self.register_buffer("bias", torch.empty(out_features, dtype=dtype) if bias else None)
+        # prepare() 之后为内核布局的 (权重, scale_and_zeros)
+        self._kernel_weight = None
+
+    @staticmethod
+    def supports(linear, group_size):
+        return linear.in_features % group_size == 0 and group_size % 2 == 0
+
+    @classmethod
+    def from_linear(cls, linear, group_size, dtype):
+        weight = linear.weight.detach().float()
+        module = cls(linear.in_features, linear.out_features, group_size, linear.bias is not None, dtype)
+        groups = weight.view(linear.out_features, -1, group_size)
+        scales = groups.abs().amax(dim=-1).clamp(min=1e-8) / 7
+        values = (torch.round(groups / scales[..., None]).clamp(-8, 7) + 8).to(torch.uint8)
+        values = values.view(linear.out_features, linear.in_features)
+        module.qweight.copy_(values[:, ::2] | (values[:, 1::2] << 4))
+        module.scales.copy_(scales)
+        if linear.bias is not None:
+            module.bias.copy_(linear.bias.detach())
+        return module
+
+    def _unpack(self):
+        """返回 0~15 的 int32 矩阵 [out, in]"""
+        values = torch.stack([self.qweight & 0x0F, self.qweight >> 4], dim=-1)
+        return values.view(self.out_features, self.in_features).to(torch.int32)
+
+    def dequantize(self, dtype):
+        values = self._unpack().view(self.out_features, -1, self.group_size) - 8
+        return (values.to(dtype) * self.scales.to(dtype)[..., None]).view(self.out_features, self.in_features)
+
+    def prepare(self):
+        """转换为当前 PyTorch 内核的布局并释放原始打包权重（之后不能再保存）；内核不可用时保持反量化路径"""
+        if not _HAS_INT4_KERNEL or self._kernel_weight is not None or self.group_size not in _INT4_KERNEL_GROUP_SIZES:
+            return
+        try:
+            packed = torch.ops.aten._convert_weight_to_int4pack_for_cpu(self._unpack(), 1)
+        except RuntimeError as e:
+            logger.warning(f"int4 内核不支持该形状 [{self.out_features}, {self.in_features}]，改用反量化: {e}")
+            return
+        scales = self.scales.t().contiguous()
+        scale_and_zeros = torch.stack([scales, torch.zeros_like(scales)], dim=-1).contiguous()
+        self._kernel_weight = (packed, scale_and_zeros)
+        self.qweight = None
+
+    def forward(self, x):
+        rows = x.reshape(-1, self.in_features)
+        if self._kernel_weight is not None:
+            packed, scale_and_zeros = self._kernel_weight
+            output = torch.ops.aten._weight_int4pack_mm_for_cpu(
+                rows.contiguous(), packed, self.group_size, scale_and_zeros.to(x.dtype)
+            )
+        else:
+            output = F.linear(rows, self.dequantize(x.dtype))
+        if self.bias is not None:
+            output = output + self.bias.to(x.dtype)
+        return output.view(*x.shape[:-1], self.out_features)
+
+    def extra_repr(self):
+        return f"in_features={self.in_features}, out_features={self.out_features}, bits=4, group_size={self.group_size}"
+
+
+def quantize_model(model, mode, group_size=128, dtype=torch.bfloat16, empty=False):
+    """
+    把模型中的投影层原地替换为量化线性层，返回替换的层数
+    empty=True 时只按形状创建未写入的量化层（从缓存加载前构建骨架用），两种情况下替换规则一致。
+    """
+    if mode not in QUANT_MODES:
+        raise ValueError(f"不支持的量化方式: {mode}，可选 {QUANT_MODES}")
+
+    # 只记录名称，逐层替换后原线性层即可释放，峰值内存不会同时容纳两份完整权重
+    names = [
+        name for name, module in model.named_modules()
+        if isinstance(module, nn.Linear) and name.rsplit(".", 1)[-1] in QUANTIZABLE_MODULES
+    ]
+    replaced = 0
+    for name in names:
+        linear = model.get_submodule(name)
+        if mode == "int4" and not Int4Linear.supports(linear, group_size):
+            logger.warning(f"⚠️ {name} 输入维度 {linear.in_features} 不能被分组大小 {group_size} 整除，保持原精度")
+            continue
+        if empty:
+            has_bias = linear.bias is not None
+            if mode == "int8":
+                quantized = Int8Linear(linear.in_features, linear.out_features, has_bias, dtype)
+            else:
+                quantized = Int4Linear(linear.in_features, linear.out_features, group_size, has_bias, dtype)
+        elif mode == "int8":
+            quantized = Int8Linear.from_linear(linear, dtype)
+        else:
+            quantized = Int4Linear.from_linear(linear, group_size, dtype)
+
+        parent_name, _, child_name = name.rpartition(".")
+        setattr(model.get_submodule(parent_name), child_name, quantized)
+        del linear
+        replaced += 1
+    return replaced
+
+
+def prepare_quantized_model(model):
+    """权重写入完成后调用：int4 层转换为内核布局"""
+    for module in model.modules():
+        if isinstance(module, Int4Linear):
+            module.prepare()
+    return model
+
+
+def read_quant_config(path):
+    with open(os.path.join(path, QUANT_CONFIG_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_quantized_model(model, cache_root, fingerprint, mode, group_size):
+    """保存量化模型（config + 单个 safetensors + 量化参数），先写临时目录再改名；须在 prepare 之前调用"""
+    path = os.path.join(cache_root, fingerprint)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    save_model(model, os.path.join(tmp_path, "model.safetensors"), metadata={"format": "pt"})
+    with open(os.path.join(tmp_path, QUANT_CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump({"mode": mode, "group_size": group_size}, f)
+    if model.generation_config is not None:
+        model.generation_config.save_pretrained(tmp_path)
+    # config.json 最后写入，cached_model_dir 以它判断缓存是否完整
+    model.config.save_pretrained(tmp_path)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    logger.info(f"✅ 量化模型已缓存到: {path}")
+    return path
+
+
+def quantized_size_bytes(model):
+    """模型参数与缓冲区（含量化权重与内核布局权重）占用的字节数"""
+    total = sum(t.numel() * t.element_size() for t in model.parameters())
+    total += sum(t.numel() * t.element_size() for t in model.buffers())
+    for module in model.modules():
+        if isinstance(module, Int4Linear) and module._kernel_weight is not None:
+            total += sum(t.numel() * t.element_size() for t in module._kernel_weight)
+    return total
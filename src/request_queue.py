@@ -0,0 +1,141 @@
+# app/request_queue.py
+"""
+界面请求的并发控制：asyncio 排队 + 并发上限 + 背压
+
+Gradio 的异步事件处理函数都运行在同一个事件循环上。同步的 chat_stream 放在工作线程中执行，
+事件循环只负责转发生成的文本，不会因为一次生成占住一个 worker；
+GenerationQueue 限制同时生成的请求数，其余请求按到达顺序排队并可以拿到排队位置，
+排队人数达到上限（或 overflow="reject" 时没有空闲名额）的请求直接被拒绝，避免请求无限堆积。
+
+GenerationQueue 的方法只能在事件循环线程中调用，不需要额外加锁。
+"""
+import asyncio
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class QueueFullError(RuntimeError):
+    """没有空闲名额且不能继续排队"""
+
+
+class GenerationQueue:
+    """同时最多 max_concurrency 个请求在生成，最多 max_queue_size 个请求排队"""
+
+    def __init__(self, max_concurrency=2, max_queue_size=100, overflow="queue"):
+        if overflow not in ("queue", "reject"):
+            raise ValueError(f"不支持的排队策略: {overflow}，可选 queue / reject")
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_size = max_queue_size
+        self.overflow = overflow
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters = deque()    # 排队中的 asyncio.Future，轮到时 set_result
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    async def admit(self, poll_interval=1.0):
+        """
+        异步生成器：排队期间每当位置变化时 yield 当前位置（1 表示下一个），拿到名额后结束；
+        不能排队时抛出 QueueFullError。正常结束后调用方负责 release()；
+        排队中途被取消（客户端断开）时自动退出队列，已经分到的名额也会归还。
+        """
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if self.overflow == "reject" or len(self._waiters) >= self.max_queue_size:
+            self.rejected += 1
+            raise QueueFullError(f"服务繁忙：{self.active} 个请求生成中，{len(self._waiters)} 个请求排队")
+
+        ticket = asyncio.get_running_loop().create_future()
+        self._waiters.append(ticket)
+        try:
+            last = None
+            while not ticket.done():
+                position = self._waiters.index(ticket) + 1
+                if position != last:
+                    last = position
+                    yield position
+                try:
+                    await asyncio.wait_for(asyncio.shield(ticket), poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            if ticket.done():
+                self.release()
+            else:
+                self._waiters.remove(ticket)
+            raise
+        self.admitted += 1
+
+    def release(self):
+        """生成结束：名额直接交给排在最前面的请求，没有排队请求时空出名额"""
+        if self._waiters:
+            self._waiters.popleft().set_result(None)
+        else:
+            self.active -= 1
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+async def iterate_in_thread(generator_fn, *args, stop=None, **kwargs):
+    """
+    在工作线程中运行同步生成器，产出的每一项通过事件循环异步返回
+    调用方提前退出（客户端断开、任务取消）时设置 stop，工作线程在取下一项之前停止并关闭生成器，
+    生成器内的 GeneratorExit 清理逻辑照常执行；aclose() 等工作线程结束后才返回。
+    生成器可能长时间阻塞在取下一项上（例如等待模型产出 token），把同一个 stop 传给生成器函数
+    （如 chat_stream 的 cancel 参数），它才能在阻塞中及时结束。
+    """
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    if stop is None:
+        stop = threading.Event()
+
+    def _put(item, error=None):
+        try:
+            loop.call_soon_threadsafe(items.put_nowait, (item, error))
+        except RuntimeError:
+            pass  # 事件循环已关闭
+
+    def _produce():
+        generator = generator_fn(*args, **kwargs)
+        error = None
+        try:
+            for item in generator:
+                if stop.is_set():
+                    break
+                _put(item)
+        except Exception as e:
+            error = e
+        finally:
+            generator.close()
+            _put(_DONE, error)
+
+    worker = threading.Thread(target=_produce, name="stream-worker", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item, error = await items.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        # 等工作线程关闭生成器后再返回，调用方随后释放的生成名额不会与仍在进行的生成重叠
+        await asyncio.to_thread(worker.join)
@@ -0,0 +1,233 @@
+# app/response_cache.py
+"""
+回复缓存：同一组商品属性反复生成（例如同一 SKU 在不同渠道各生成一次）时直接返回缓存的回复
+
+- 键由规范化后的属性串 + 适配器 + 采样参数 + 模型命名空间组成。属性串按 `*` 拆分、去重、排序，
+  `类型#裤*版型#宽松` 与 `版型#宽松*类型#裤` 命中同一条目，训练数据里的 `类型: 裤; 版型: 宽松` 写法也归一到同一形式；
+  非属性串的输入只做空白归一化；
+- temperature > 0 时每个键最多保留 num_variants 条回复，凑齐之前按未命中处理（继续生成新回复），
+  凑齐后轮流返回，重复请求不会每次得到一模一样的文案；greedy 只保留一条；
+- 条目超过 ttl_seconds 后失效，条目数超过 max_entries 时按最近最少使用淘汰；
+- 指定 path 时存入 SQLite 文件，进程重启后仍然有效。
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_ATTRIBUTE_SEPARATOR = re.compile(r"[*＊;；]")
+_KEY_VALUE_SEPARATOR = re.compile(r"[#＃:：]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def canonicalize_message(message):
+    """属性串（每段都是 `键#值` 或 `键: 值`）规范化为排序去重后的 `键#值*键#值`，其余输入只合并空白"""
+    text = message.strip()
+    parts = [p.strip() for p in _ATTRIBUTE_SEPARATOR.split(text) if p.strip()]
+    if parts and all(_KEY_VALUE_SEPARATOR.search(p) for p in parts):
+        pairs = set()
+        for part in parts:
+            key, value = _KEY_VALUE_SEPARATOR.split(part, maxsplit=1)
+            pairs.add((key.strip(), value.strip()))
+        return "*".join(f"{key}#{value}" for key, value in sorted(pairs))
+    return _WHITESPACE.sub(" ", text)
+
+
+def response_cache_key(namespace, message, adapter, temperature, max_new_tokens):
+    payload = [namespace, canonicalize_message(message), adapter, round(float(temperature), 4), int(max_new_tokens)]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class _MemoryStore:
+    """条目保存在进程内存中：key -> (variants, cursor, created)，OrderedDict 顺序即 LRU 顺序"""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, variants, cursor, created):
+        self._entries[key] = (variants, cursor, created)
+        self._entries.move_to_end(key)
+
+    def touch(self, key, cursor):
+        """命中后更新轮换游标（get 已经刷新了 LRU 顺序）"""
+        variants, _, created = self._entries[key]
+        self._entries[key] = (variants, cursor, created)
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def evict(self, max_entries, expire_before):
+        """过期条目在 lookup 时惰性删除，这里只按条目数淘汰"""
+        evicted = 0
+        while len(self._entries) > max_entries:
+            self._entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def clear(self):
+        self._entries.clear()
+
+
+class _SQLiteStore:
+    """
+    条目保存在 SQLite 文件中，last_access 记录最近访问时间用于 LRU 淘汰
+    命中只更新轮换游标和 last_access，这些写入先记在内存里，攒够 flush_every 条或距上次提交超过
+    flush_seconds 时再一次性提交，其他写操作也会顺带提交；读多写少时不会每次命中都提交一次事务。
+    进程异常退出最多丢失最近一批游标 / 访问时间更新，缓存内容本身不受影响。
+    """
+
+    def __init__(self, path, flush_every=100, flush_seconds=5.0):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, variants TEXT NOT NULL, cursor INTEGER NOT NULL, "
+            "created REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self._touched = {}    # key -> (cursor, last_access)，尚未写入数据库的命中
+        self._last_flush = time.monotonic()
+
+    def _write_touched(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE responses SET cursor = ?, last_access = ? WHERE key = ?",
+                [(cursor, last_access, key) for key, (cursor, last_access) in self._touched.items()]
+            )
+            self._touched.clear()
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        """把内存中的命中记录写入数据库并提交"""
+        self._write_touched()
+        self._conn.commit()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        row = self._conn.execute(
+            "SELECT variants, cursor, created FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        cursor = self._touched[key][0] if key in self._touched else row[1]
+        return json.loads(row[0]), cursor, row[2]
+
+    def put(self, key, variants, cursor, created):
+        self._touched.pop(key, None)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, variants, cursor, created, last_access) VALUES (?, ?, ?, ?, ?)",
+            (key, json.dumps(variants, ensure_ascii=False), cursor, created, time.time())
+        )
+        self.flush()
+
+    def touch(self, key, cursor):
+        self._touched[key] = (cursor, time.time())
+        if len(self._touched) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def delete(self, key):
+        self._touched.pop(key, None)
+        self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self.flush()
+
+    def evict(self, max_entries, expire_before):
+        """删除过期条目，再按 last_access 删除超出上限的条目"""
+        self._write_touched()
+        evicted = self._conn.execute("DELETE FROM responses WHERE created < ?", (expire_before,)).rowcount
+        excess = len(self) - max_entries
+        if excess > 0:
+            evicted += self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access LIMIT ?)", (excess,)
+            ).rowcount
+        self._conn.commit()
+        return evicted
+
+    def clear(self):
+        self._touched.clear()
+        self._conn.execute("DELETE FROM responses")
+        self._conn.commit()
+
+
+class ResponseCache:
+    """按规范化属性串缓存生成结果，支持 TTL、LRU 与多版本轮换；path 为 None 时只存在内存中"""
+
+    def __init__(self, max_entries=10000, ttl_seconds=7 * 24 * 3600, num_variants=3, path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.num_variants = max(1, num_variants)
+        self.path = path
+        self._store = _SQLiteStore(path) if path else _MemoryStore()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path:
+            with self._lock:
+                evicted = self._store.evict(self.max_entries, time.time() - self.ttl_seconds)
+            logger.info(f"✅ 回复缓存已打开: {path}（{len(self)} 条，清理过期 {evicted} 条）")
+
+    def __len__(self):
+        return len(self._store)
+
+    def _variants_for(self, temperature):
+        return 1 if temperature <= 0 else self.num_variants
+
+    def _expired(self, created):
+        return time.time() - created > self.ttl_seconds
+
+    def lookup(self, key, temperature):
+        """命中且版本已凑齐时返回一条缓存回复（多版本轮流返回），否则返回 None"""
+        with self._lock:
+            entry = self._store.get(key)
+            if entry is not None and self._expired(entry[2]):
+                self._store.delete(key)
+                entry = None
+            if entry is None or len(entry[0]) < self._variants_for(temperature):
+                self.misses += 1
+                return None
+            variants, cursor, created = entry
+            self._store.touch(key, cursor + 1)
+            self.hits += 1
+            return variants[cursor % len(variants)]
+
+    def store(self, key, response, temperature):
+        """记录一次新生成的回复，版本已满时不追加（重复的回复也占一个版本，否则低温度下可能永远凑不齐）"""
+        if not response:
+            return
+        with self._lock:
+            entry = self._store.get(key)
+            if entry is None or self._expired(entry[2]):
+                variants, cursor, created = [], 0, time.time()
+            else:
+                variants, cursor, created = entry
+            if len(variants) < self._variants_for(temperature):
+                variants = variants + [response]
+            self._store.put(key, variants, cursor, created)
+            self._store.evict(self.max_entries, time.time() - self.ttl_seconds)
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
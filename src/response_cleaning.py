@@ -0,0 +1,131 @@
+# app/response_cleaning.py
+"""
+回复后处理：从解码文本中取出当前问题的回答，去掉角色前缀、特殊标记、括号注释与多余空白
+
+输出与原先逐条 re.sub 的实现逐字一致（对拍语料见 bench/golden/response_cleaning.jsonl）：
+- 所有正则在导入时预编译；
+- 只在开头匹配的前缀规则按原先的先后顺序串成一个由可选分组组成的正则，一次 match 完成
+  （每条规则匹配时都非空、其后的分组都可以为空，因此与逐条替换等价）；
+- 全局删除的标记/括号规则之间有先后依赖，不能合并成一个交替式，
+  改为先用 `in` 检查触发字符，绝大多数回复不含 "<|" "[" "(" 时整段跳过；
+- 空白规整用 str.split / join 完成（\\s 与 str.isspace 的字符集相同）；
+- 相关性检查先看长度，足够长时不再提取关键词。
+"""
+import re
+
+# 角色前缀：assistant / 助手 / 好的 ... 依次最多各去掉一次
+_ASSISTANT_PREFIX = re.compile(
+    r'(?:(?:assistant|Assistant|ASSISTANT)[:\s]*)?'
+    r'(?:(?:助手|AI助手|AI助理|机器人)[：:\s]*)?'
+    r'(?:(?:好的|明白了|根据您的问题|针对这个问题|关于这个问题)[，,\s]*)?'
+    r'(?:[Aa]ssistant\s+is\s+)?'
+    r'(?:[Aa]ssistant\s*[：:]\s*)?',
+    re.IGNORECASE
+)
+
+# 开头的口头语、引号与括号
+_LEADING_FILLER = re.compile(
+    r'(?:(?:好的|根据|针对|关于|这件|这款|这是一个|首先|那么|另外)[，,]\s*)?'
+    r'(?:[\"\'「」【】\[\]\(\)]\s*)?'
+    r'(?:(?:嗯|啊|呃|那个|这个)[，,]\s*)?'
+    r'(?:(?:那么|接下来|此外|另外)[，,]\s*)?',
+    re.IGNORECASE
+)
+
+_HEADER_BLOCK = re.compile(r'<\|start_header_id\|>.*?<\|end_header_id\|>', re.DOTALL)
+_EOT = re.compile(r'<\|eot_id\|>')
+_SPECIAL_TOKEN = re.compile(r'<\|.*?\|>', re.DOTALL)
+_SPECIAL_TOKEN_SINGLE_LINE = re.compile(r'<\|.*?\|>')
+_BRACKETS = re.compile(r'\[.*?\]', re.DOTALL)
+_PARENS = re.compile(r'\(.*?\)', re.DOTALL)
+_KEYWORD = re.compile(r'[\u4e00-\u9fa5a-zA-Z0-9]+')
+
+_LEADING_PUNCTUATION = '，,.:：；;!！?？'
+
+# 按顺序查找，取最后一个标记之后的内容
+_ASSISTANT_MARKERS = (
+    "<|start_header_id|>assistant<|end_header_id|>",
+    "assistant:",
+    "Assistant:",
+    "助手:",
+    "助手："
+)
+
+
+def remove_assistant_prefix(text):
+    """专门移除assistant相关前缀"""
+    if not text:
+        return text
+    return text[_ASSISTANT_PREFIX.match(text).end():].strip()
+
+
+def aggressive_clean(text):
+    """加强版的清理回复内容"""
+    if not text:
+        return text
+
+    text = remove_assistant_prefix(text)
+
+    # 去除特殊标记、方括号与圆括号内容（删除只会减少字符，后续的触发字符检查仍然成立）
+    if '<|' in text:
+        text = _HEADER_BLOCK.sub('', text)
+        text = _EOT.sub('', text)
+        text = _SPECIAL_TOKEN.sub('', text)
+    if '[' in text:
+        text = _BRACKETS.sub('', text)
+    if '(' in text:
+        text = _PARENS.sub('', text)
+
+    text = text[_LEADING_FILLER.match(text).end():]
+
+    # 连续空白（含换行）合并为一个空格并去掉首尾空白
+    text = ' '.join(text.split())
+
+    # 确保不以标点符号开头
+    if text and text[0] in _LEADING_PUNCTUATION:
+        text = text[1:].strip()
+
+    return text
+
+
+def extract_by_current_question(text, current_question):
+    """根据当前问题特征提取回复"""
+    # 查找最后一个assistant标记后的内容
+    for marker in _ASSISTANT_MARKERS:
+        if marker in text:
+            content = text.rsplit(marker, 1)[-1].strip()
+            if '<|' in content:
+                content = _SPECIAL_TOKEN_SINGLE_LINE.sub('', content)
+            return remove_assistant_prefix(content)
+
+    # 如果找不到标记，尝试基于问题内容提取
+    if current_question in text:
+        content = text.rsplit(current_question, 1)[-1].strip()
+        return remove_assistant_prefix(content)
+
+    return remove_assistant_prefix(text.strip())
+
+
+def extract_clean_response(full_response, prompt, current_question):
+    """从完整解码文本中提取当前问题的干净回复"""
+    if full_response.startswith(prompt):
+        content = full_response[len(prompt):].strip()
+    else:
+        content = extract_by_current_question(full_response, current_question)
+    return remove_assistant_prefix(aggressive_clean(content))
+
+
+def extract_keywords(text):
+    """提取文本中的关键词（长度大于 1 的中文/字母数字串；单字虚词因此自然被排除）"""
+    if not text:
+        return []
+    return [word for word in _KEYWORD.findall(text) if len(word) > 1]
+
+
+def is_response_relevant(response, question):
+    """检查回复是否与当前问题相关：有共同关键词，或回复长度大于 10"""
+    if not response or not question:
+        return False
+    if len(response) > 10:
+        return True
+    return bool(set(extract_keywords(question)) & set(extract_keywords(response)))
@@ -0,0 +1,187 @@
+# src/scoring.py
+"""
+字符级 ROUGE-1/2/L 与 BLEU-4 批量评分
+
+口径与原评测脚本一致：
+- ROUGE: 等价于 rouge.Rouge().get_scores(" ".join(pred), " ".join(ref))（exclusive=True，
+  n-gram 按集合计数，ROUGE-L 为 summary-level union LCS）
+- BLEU-4: 等价于 nltk sentence_bleu([list(ref)], list(pred), smoothing_function=SmoothingFunction().method3)
+
+与逐条调用参考库相比：n-gram 用字符串切片 + Counter/set 统计，LCS 用迭代 DP 回溯（不会因递归过深报错），
+整个语料分块后多进程并行计算。空预测计 0 分而不是被静默丢弃。
+
+自检: python src/scoring.py --verify  （需要安装 rouge 与 nltk）
+"""
+import argparse
+import math
+import os
+from collections import Counter
+from multiprocessing import Pool
+
+METRICS = ('rouge-1', 'rouge-2', 'rouge-l', 'bleu-4')
+
+def _rouge_sentences(text):
+    """复现 Rouge.get_scores 对 " ".join(text) 的预处理：按 "." 分句并规整空白"""
+    joined = " ".join(text)
+    return [" ".join(s.split()) for s in joined.split(".") if len(s) > 0]
+
+def _f_score(overlap, hyp_count, ref_count):
+    precision = overlap / hyp_count if hyp_count else 0.0
+    recall = overlap / ref_count if ref_count else 0.0
+    return 2.0 * ((precision * recall) / (precision + recall + 1e-8))
+
+def _ngram_set(words, n):
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+def _lcs_tokens(x, y):
+    """LCS 回溯得到的 token 集合，平局时的走向与 rouge 库的 _recon_lcs 相同"""
+    n, m = len(x), len(y)
+    table = [[0] * (m + 1)]
+    for i in range(1, n + 1):
+        prev = table[i - 1]
+        row = [0] * (m + 1)
+        xi = x[i - 1]
+        for j in range(1, m + 1):
+            if xi == y[j - 1]:
+                row[j] = prev[j - 1] + 1
+            else:
+                up, left = prev[j], row[j - 1]
+                row[j] = up if up > left else left
+        table.append(row)
+
+    tokens = set()
+    i, j = n, m
+    while i > 0 and j > 0:
+        if x[i - 1] == y[j - 1]:
+            tokens.add(x[i - 1])
+            i -= 1
+            j -= 1
+        elif table[i - 1][j] > table[i][j - 1]:
+            i -= 1
+        else:
+            j -= 1
+    return tokens
+
+def rouge_scores(prediction, reference):
+    """单条样本的 ROUGE-1/2/L F 值"""
+    hyp_sents = _rouge_sentences(prediction)
+    ref_sents = _rouge_sentences(reference)
+    if not hyp_sents or not ref_sents:
+        return {'rouge-1': 0.0, 'rouge-2': 0.0, 'rouge-l': 0.0}
+
+    hyp_split = [s.split(" ") for s in hyp_sents]
+    ref_split = [s.split(" ") for s in ref_sents]
+    hyp_words = [w for s in hyp_split for w in s]
+    ref_words = [w for s in ref_split for w in s]
+
+    scores = {}
+    for n in (1, 2):
+        hyp_ngrams = _ngram_set(hyp_words, n)
+        ref_ngrams = _ngram_set(ref_words, n)
+        scores[f'rouge-{n}'] = _f_score(len(hyp_ngrams & ref_ngrams), len(hyp_ngrams), len(ref_ngrams))
+
+    union = set()
+    for ref_s in ref_split:
+        for hyp_s in hyp_split:
+            union |= _lcs_tokens(ref_s, hyp_s)
+    scores['rouge-l'] = _f_score(len(union), len(set(hyp_words)), len(set(ref_words)))
+    return scores
+
+def bleu4_score(prediction, reference):
+    """单条样本的字符级 BLEU-4（NIST 几何序列平滑，即 nltk method3）"""
+    hyp_len, ref_len = len(prediction), len(reference)
+    numerators, denominators = [], []
+    for n in range(1, 5):
+        hyp_counts = Counter(prediction[i:i + n] for i in range(hyp_len - n + 1))
+        ref_counts = Counter(reference[i:i + n] for i in range(ref_len - n + 1))
+        numerators.append(sum(min(c, ref_counts[g]) for g, c in hyp_counts.items()))
+        denominators.append(max(1, sum(hyp_counts.values())))
+
+    if numerators[0] == 0:
+        return 0.0
+
+    log_sum = []
+    k = 1
+    for num, den in zip(numerators, denominators):
+        if num == 0:
+            p = 1 / (2 ** k * den)
+            k += 1
+        else:
+            p = num / den
+        if p > 0:
+            log_sum.append(0.25 * math.log(p))
+
+    if hyp_len > ref_len:
+        bp = 1
+    else:
+        bp = math.exp(1 - ref_len / hyp_len)
+    return bp * math.exp(math.fsum(log_sum))
+
+def score_pair(prediction, reference):
+    scores = rouge_scores(prediction, reference)
+    scores['bleu-4'] = bleu4_score(prediction, reference)
+    return scores
+
+def _score_chunk(pairs):
+    return [score_pair(p, r) for p, r in pairs]
+
+def score_corpus(predictions, references, num_workers=None, chunk_size=256):
+    """对整个语料打分，返回 (各指标平均值, 逐条得分列表)"""
+    assert len(predictions) == len(references), "预测与参考数量不一致"
+    pairs = list(zip(predictions, references))
+    if not pairs:
+        return {m: 0.0 for m in METRICS}, []
+
+    num_workers = num_workers or os.cpu_count() or 1
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+    if num_workers > 1 and len(chunks) > 1:
+        with Pool(min(num_workers, len(chunks))) as pool:
+            results = pool.map(_score_chunk, chunks)
+    else:
+        results = [_score_chunk(chunk) for chunk in chunks]
+
+    per_sample = [s for chunk in results for s in chunk]
+    averages = {m: sum(s[m] for s in per_sample) / len(per_sample) for m in METRICS}
+    return averages, per_sample
+
+# 与参考库对拍的样例：中文文案、英文句点分句、重复字、空白、极短文本
+_FIXTURE = [
+    ("这款裤子采用宽松版型，穿着舒适又显瘦。", "宽松的阔腿裤版型，穿上显瘦又舒适，性感的线条更显气质。"),
+    ("一抹丝绒哑光，高级感扑面而来。超级显白的色调，让你在约会时刻气场全开！", "丝绒质地的口红，颜色很显白，非常适合约会时使用。"),
+    ("简约的白色上衣搭配破洞牛仔，刺绣细节. 外套款式很百搭.", "白色牛仔外套，破洞设计. 刺绣图案，简约又百搭。"),
+    ("好好好好好看", "好看的裙子好看"),
+    ("a b c d. e f", "a c e. b d f"),
+    ("降噪耳机", "这款游戏耳机拥有出色的降噪效果，让你沉浸在游戏世界中。"),
+    ("雪纺连衣裙..淡紫色", "淡紫色雪纺连衣裙，正式场合也能穿。"),
+    ("裙", "裙"),
+    ("这是一款非常非常非常好看的裙子", "裙子"),
+]
+
+def verify_against_reference(fixture=_FIXTURE, tolerance=1e-9):
+    """与 rouge / nltk 逐条对拍，返回各指标的最大绝对误差"""
+    from rouge import Rouge
+    from nltk.translate.bleu_score import SmoothingFunction, sentence_bleu
+
+    rouge = Rouge()
+    smoothing = SmoothingFunction().method3
+    max_diff = {m: 0.0 for m in METRICS}
+    for prediction, reference in fixture:
+        ours = score_pair(prediction, reference)
+        ref_scores = rouge.get_scores(" ".join(prediction), " ".join(reference))[0]
+        expected = {m: ref_scores[m]['f'] for m in ('rouge-1', 'rouge-2', 'rouge-l')}
+        expected['bleu-4'] = sentence_bleu([list(reference)], list(prediction), smoothing_function=smoothing)
+        for m in METRICS:
+            max_diff[m] = max(max_diff[m], abs(ours[m] - expected[m]))
+    ok = all(d <= tolerance for d in max_diff.values())
+    return ok, max_diff
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="字符级 ROUGE/BLEU 评分")
+    parser.add_argument("--verify", action="store_true", help="与 rouge/nltk 参考实现对拍")
+    args = parser.parse_args()
+
+    if args.verify:
+        ok, max_diff = verify_against_reference()
+        print("Max abs diff:", {m: f"{d:.2e}" for m, d in max_diff.items()})
+        print("✅ 与参考实现一致" if ok else "❌ 与参考实现不一致")
+        raise SystemExit(0 if ok else 1)
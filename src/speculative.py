@@ -0,0 +1,323 @@
+# app/speculative.py
+"""
+投机解码（speculative decoding）
+
+草稿器每轮提出 k 个候选 token，目标模型（LoRA 微调后的 8B）一次前向同时算出这 k 个位置
+以及其后一个位置的分布，再按投机采样规则逐个接受：
+- 候选 x 以 min(1, p(x) / q(x)) 的概率被接受（p 为目标分布，q 为草稿分布）；
+- 第一个被拒绝的位置从归一化的 max(0, p - q) 中重新采样，本轮结束；
+- 全部接受时再从第 k+1 个位置的目标分布采样一个 token。
+这样每个 token 的分布与直接从目标模型采样完全相同（Leviathan et al. 2023 / Chen et al. 2023），
+只是一次目标前向平均能产出多个 token。
+
+目标分布 p 按 generate(do_sample=True) 的顺序处理 logits：重复惩罚 → 温度 → top_k → top_p，
+与 LoraChatModel 原来的采样参数一致。草稿器有两种：
+- DraftModel：与目标模型共用分词器的小模型，同样按上面的流程采样，q 为其处理后的分布；
+- PromptLookupDrafter：在 prompt 与已生成内容中查找与末尾 n-gram 相同的片段，把其后的 token
+  作为候选（q 为单点分布）。广告文案经常原样复述属性值，命中率较高，且不需要额外模型。
+"""
+import inspect
+import logging
+import time
+
+import torch
+import torch.nn.functional as F
+from transformers import (
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper
+)
+
+from app.kv_utils import cache_length, crop_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _logits_kwargs(model):
+    """prefill 只需要最后一个位置的 logits；模型支持时避免为整段 prompt 计算 [L, vocab] 的 logits"""
+    base = model.get_base_model() if hasattr(model, "get_base_model") else model
+    parameters = inspect.signature(base.forward).parameters
+    for name in ("logits_to_keep", "num_logits_to_keep"):
+        if name in parameters:
+            return {name: 1}
+    return {}
+
+
+class TokenSampler:
+    """与 generate(do_sample=True) 相同的 logits 处理顺序：重复惩罚 → 温度 → top_k → top_p；temperature <= 0 时为贪心"""
+
+    def __init__(self, temperature, top_p=0.9, top_k=None, repetition_penalty=1.1):
+        self.greedy = temperature <= 0
+        self.processors = []
+        if repetition_penalty is not None and repetition_penalty != 1.0:
+            self.processors.append(RepetitionPenaltyLogitsProcessor(penalty=repetition_penalty))
+        if not self.greedy:
+            if temperature != 1.0:
+                self.processors.append(TemperatureLogitsWarper(temperature))
+            if top_k:
+                self.processors.append(TopKLogitsWarper(top_k=top_k))
+            if top_p is not None and top_p < 1.0:
+                self.processors.append(TopPLogitsWarper(top_p=top_p))
+
+    def probs(self, histories, logits):
+        """histories[i] 为第 i 行 logits 之前的全部 token，返回每行的采样分布 [rows, vocab]（float32）"""
+        logits = logits.float()
+        # 用各行自己的首个 token 补齐历史，重复 token 不影响重复惩罚的 gather/scatter 结果
+        width = max(len(h) for h in histories)
+        history_ids = torch.tensor([h + [h[0]] * (width - len(h)) for h in histories], device=logits.device)
+        for processor in self.processors:
+            logits = processor(history_ids, logits)
+        if self.greedy:
+            return F.one_hot(logits.argmax(dim=-1), logits.shape[-1]).float()
+        return F.softmax(logits, dim=-1)
+
+    @staticmethod
+    def sample(probs):
+        return int(torch.multinomial(probs, num_samples=1))
+
+
+class SpeculativeStats:
+    """一次生成的草稿统计"""
+
+    def __init__(self):
+        self.drafted = 0        # 草稿器提出的 token 数
+        self.accepted = 0       # 被目标模型接受的草稿 token 数
+        self.target_steps = 0   # 目标模型前向次数（含 prefill）
+        self.generated = 0      # 最终生成的 token 数
+        self.draft_seconds = 0.0
+        self.verify_seconds = 0.0   # prefill 之后目标模型验证前向的耗时
+
+    @property
+    def acceptance_rate(self):
+        return self.accepted / self.drafted if self.drafted else 0.0
+
+    @property
+    def tokens_per_step(self):
+        """平均每次目标前向产出的 token 数，即相对逐 token 解码减少的目标前向倍数"""
+        return self.generated / self.target_steps if self.target_steps else 0.0
+
+    @property
+    def estimated_speedup(self):
+        """
+        解码阶段的估算加速比：逐 token 解码所需时间（prefill 之后的 token 数 × 平均每次目标前向耗时）/ 实际耗时
+        验证 k+1 个 token 的前向略慢于单 token 前向，因此这是略偏乐观的估计；实测加速比见 bench/bench_speculative.py
+        """
+        verify_steps = self.target_steps - 1
+        spent = self.verify_seconds + self.draft_seconds
+        if verify_steps <= 0 or spent <= 0:
+            return 1.0
+        return (self.generated - 1) * (self.verify_seconds / verify_steps) / spent
+
+
+class SpeculativeOutput:
+    """与 generate(return_dict_in_generate=True) 的返回值保持相同的字段"""
+
+    def __init__(self, sequences, past_key_values, stats):
+        self.sequences = sequences
+        self.past_key_values = past_key_values
+        self.stats = stats
+
+
+class PromptLookupDrafter:
+    """prompt 查表草稿器：找到与上下文末尾 n-gram（从长到短）最近一次相同的位置，取其后的 token 作为候选"""
+
+    name = "prompt_lookup"
+
+    def __init__(self, max_ngram=3, min_ngram=1):
+        self.max_ngram = max_ngram
+        self.min_ngram = min_ngram
+
+    def session(self):
+        return self
+
+    def propose(self, context, k, sampler):
+        """返回 (候选 token 列表, None)；None 表示单点分布"""
+        if k <= 0:
+            return [], None
+        for n in range(min(self.max_ngram, len(context) - 1), self.min_ngram - 1, -1):
+            tail = context[-n:]
+            # 从后往前找，最近的重复最可能延续
+            for start in range(len(context) - n - 1, -1, -1):
+                if context[start:start + n] == tail:
+                    candidates = context[start + n:start + n + k]
+                    if candidates:
+                        return candidates, None
+        return [], None
+
+    def accept(self, context):
+        pass
+
+
+class DraftModel:
+    """小模型草稿器（须与目标模型共用分词器）；每个请求使用独立的 session 保存自己的 KV Cache"""
+
+    name = "draft_model"
+
+    def __init__(self, model):
+        self.model = model
+        self.logits_kwargs = _logits_kwargs(model)
+
+    def session(self):
+        return _DraftModelSession(self)
+
+
+class _DraftModelSession:
+
+    def __init__(self, drafter):
+        self.model = drafter.model
+        self.logits_kwargs = drafter.logits_kwargs
+        self.cache = None
+        self.cached_ids = []   # KV Cache 中的 token
+
+    def _forward(self, ids):
+        device = self.model.device
+        outputs = self.model(
+            input_ids=torch.tensor([ids], device=device),
+            past_key_values=self.cache,
+            use_cache=True,
+            **self.logits_kwargs
+        )
+        self.cache = outputs.past_key_values
+        self.cached_ids.extend(ids)
+        return outputs.logits[:, -1, :]
+
+    def propose(self, context, k, sampler):
+        """自回归采样 k 个候选，返回 (候选 token 列表, 每个候选位置的草稿分布 [k, vocab])"""
+        if k <= 0:
+            return [], None
+        logits = self._forward(context[len(self.cached_ids):])
+        history = list(context)
+        tokens, probs = [], []
+        for i in range(k):
+            q = sampler.probs([history], logits)[0]
+            token = sampler.sample(q)
+            tokens.append(token)
+            probs.append(q)
+            history.append(token)
+            if i < k - 1:
+                logits = self._forward([token])
+        return tokens, torch.stack(probs)
+
+    def accept(self, context):
+        """只保留与新上下文一致的前缀（且至少留出最后一个 token 作为下一轮输入）"""
+        keep = 0
+        limit = min(len(self.cached_ids), len(context) - 1)
+        while keep < limit and self.cached_ids[keep] == context[keep]:
+            keep += 1
+        if keep < len(self.cached_ids):
+            self.cache = crop_cache(self.cache, keep)
+            self.cached_ids = self.cached_ids[:keep]
+
+
+class SpeculativeDecoder:
+    """
+    单条序列的投机解码：drafter 为 DraftModel 或 PromptLookupDrafter，num_draft_tokens 为每轮候选数 k
+    generate() 的参数与返回值对齐 LoraChatModel 里 generate 的用法：传入 input_ids（可附带前缀缓存），
+    返回含 sequences / past_key_values 的输出，另带 SpeculativeStats。
+    """
+
+    def __init__(self, model, drafter, eos_token_id, num_draft_tokens=4, top_p=0.9, top_k=None,
+                 repetition_penalty=1.1):
+        self.model = model
+        self.drafter = drafter
+        self.eos_token_id = eos_token_id
+        self.num_draft_tokens = max(1, int(num_draft_tokens))
+        self.top_p = top_p
+        self.top_k = top_k
+        self.repetition_penalty = repetition_penalty
+        self.logits_kwargs = _logits_kwargs(model)
+
+    def _verify(self, ids, cache, model_kwargs):
+        outputs = self.model(
+            input_ids=torch.tensor([ids], device=self.model.device),
+            past_key_values=cache,
+            use_cache=True,
+            **model_kwargs
+        )
+        return outputs.logits[0], outputs.past_key_values
+
+    @torch.no_grad()
+    def generate(self, input_ids, temperature, max_new_tokens, past_key_values=None, trace=None, streamer=None,
+                 model_kwargs=None, stopping_criteria=None):
+        """
+        input_ids: [1, L] 的 prompt；past_key_values 为前缀缓存（覆盖 prompt 的前若干个 token）
+        model_kwargs: 目标模型前向的额外参数（如多适配器的 adapter_names）
+        streamer: 与 generate 相同的接口，先 put 整段 prompt，之后每轮 put 新接受的 token
+        stopping_criteria: 与 generate 相同的 StoppingCriteriaList，每轮验证之后检查一次
+        """
+        model_kwargs = model_kwargs or {}
+        sampler = TokenSampler(temperature, self.top_p, self.top_k, self.repetition_penalty)
+        drafter = self.drafter.session()
+        stats = SpeculativeStats()
+        prompt_ids = input_ids[0].tolist()
+        if streamer is not None:
+            streamer.put(input_ids.cpu())
+
+        # prefill：目标模型处理 prompt 中未缓存的部分，采样第一个 token
+        cached = cache_length(past_key_values) if past_key_values is not None else 0
+        logits, cache = self._verify(prompt_ids[cached:], past_key_values, {**model_kwargs, **self.logits_kwargs})
+        stats.target_steps += 1
+        if trace is not None:
+            trace.mark_first_token()
+        token = sampler.sample(sampler.probs([prompt_ids], logits[-1:])[0])
+        context = prompt_ids + [token]
+        generated = [token]
+        if streamer is not None:
+            streamer.put(torch.tensor([token]))
+
+        # 目标模型的 KV Cache 始终覆盖 context[:-1]，context 的最后一个 token 是下一轮的输入
+        while len(generated) < max_new_tokens and generated[-1] != self.eos_token_id:
+            if stopping_criteria is not None and bool(stopping_criteria(torch.tensor([context]), None).all()):
+                break
+            k = min(self.num_draft_tokens, max_new_tokens - len(generated) - 1)
+            start = time.perf_counter()
+            drafts, draft_probs = drafter.propose(context, k, sampler)
+            drafted_at = time.perf_counter()
+            logits, cache = self._verify([context[-1]] + drafts, cache, model_kwargs)
+            stats.draft_seconds += drafted_at - start
+            stats.verify_seconds += time.perf_counter() - drafted_at
+            stats.target_steps += 1
+            stats.drafted += len(drafts)
+            target_probs = sampler.probs([context + drafts[:i] for i in range(len(drafts) + 1)], logits)
+
+            new_tokens, accepted = [], 0
+            for i, draft in enumerate(drafts):
+                p = target_probs[i]
+                q_draft = 1.0 if draft_probs is None else float(draft_probs[i, draft])
+                # 以 min(1, p/q) 的概率接受；写成乘法避免除零
+                if float(torch.rand(())) * q_draft < float(p[draft]):
+                    new_tokens.append(draft)
+                    accepted += 1
+                    if draft == self.eos_token_id:
+                        break
+                    continue
+                if draft_probs is None:
+                    residual = p.clone()
+                    residual[draft] = 0
+                else:
+                    residual = (p - draft_probs[i]).clamp(min=0)
+                if float(residual.sum()) <= 0:
+                    residual = p
+                new_tokens.append(sampler.sample(residual / residual.sum()))
+                break
+            else:
+                new_tokens.append(sampler.sample(target_probs[len(drafts)]))
+            stats.accepted += accepted
+
+            # 保留 context[-1] 与被接受的草稿 token 的 KV，丢弃被拒绝的部分
+            cache = crop_cache(cache, len(context) + len(new_tokens) - 1)
+            context += new_tokens
+            generated += new_tokens
+            drafter.accept(context)
+            if streamer is not None:
+                streamer.put(torch.tensor(new_tokens))
+
+        if streamer is not None:
+            streamer.end()
+        if trace is not None:
+            trace.add_span("draft", stats.draft_seconds)
+            trace.add_span("verify", stats.verify_seconds)
+        stats.generated = len(generated)
+        sequences = torch.tensor([context], device=input_ids.device)
+        return SpeculativeOutput(sequences, cache, stats)
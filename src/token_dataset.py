@@ -0,0 +1,328 @@
+# src/token_dataset.py
+"""
+紧凑的内存映射 token 数据集格式
+
+一个数据目录包含三个文件：
+- tokens.bin:        所有样本的 token 依次拼接，uint32（Llama-3 词表 128256 超出 uint16）
+- offsets.npy:       int64，长度 N+1，第 i 个样本为 tokens[offsets[i]:offsets[i+1]]
+- label_starts.npy:  int32，长度 N，第 i 个样本从该位置开始计算 loss，之前的 label 为 -100
+
+读取时只做 np.memmap，启动几乎不耗时；每条样本按切片读取，页面由操作系统按需换入，
+DataLoader 的多个 worker 共享同一份页缓存，常驻内存很小。
+"""
+import os
+import shutil
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+TOKEN_DTYPE = np.uint32
+TOKENS_FILE = "tokens.bin"
+OFFSETS_FILE = "offsets.npy"
+LABEL_STARTS_FILE = "label_starts.npy"
+IGNORE_INDEX = -100
+
+class TokenFileWriter:
+    """逐条追加样本，close 时写出索引"""
+
+    def __init__(self, data_dir):
+        os.makedirs(data_dir, exist_ok=True)
+        self.data_dir = data_dir
+        self._f = open(os.path.join(data_dir, TOKENS_FILE), 'wb')
+        self._lengths = []
+        self._label_starts = []
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, input_ids, label_start=0):
+        np.asarray(input_ids, dtype=TOKEN_DTYPE).tofile(self._f)
+        self._lengths.append(len(input_ids))
+        self._label_starts.append(label_start)
+
+    def close(self):
+        self._f.close()
+        offsets = np.zeros(len(self._lengths) + 1, dtype=np.int64)
+        np.cumsum(self._lengths, out=offsets[1:])
+        np.save(os.path.join(self.data_dir, OFFSETS_FILE), offsets)
+        np.save(os.path.join(self.data_dir, LABEL_STARTS_FILE), np.asarray(self._label_starts, dtype=np.int32))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def merge_token_dirs(shard_dirs, out_dir):
+    """按顺序把多个分片目录合并成一个数据目录，返回样本总数"""
+    os.makedirs(out_dir, exist_ok=True)
+    offsets = [np.zeros(1, dtype=np.int64)]
+    label_starts = []
+    base = 0
+    with open(os.path.join(out_dir, TOKENS_FILE), 'wb') as f_out:
+        for shard_dir in shard_dirs:
+            with open(os.path.join(shard_dir, TOKENS_FILE), 'rb') as f_in:
+                shutil.copyfileobj(f_in, f_out)
+            shard_offsets = np.load(os.path.join(shard_dir, OFFSETS_FILE))
+            offsets.append(shard_offsets[1:] + base)
+            base += int(shard_offsets[-1])
+            label_starts.append(np.load(os.path.join(shard_dir, LABEL_STARTS_FILE)))
+
+    offsets = np.concatenate(offsets)
+    np.save(os.path.join(out_dir, OFFSETS_FILE), offsets)
+    label_starts = np.concatenate(label_starts) if label_starts else np.zeros(0, dtype=np.int32)
+    np.save(os.path.join(out_dir, LABEL_STARTS_FILE), label_starts.astype(np.int32))
+    return len(offsets) - 1
+
+class MemmapTokenDataset(Dataset):
+    """
+    读取 TokenFileWriter / merge_token_dirs 写出的数据目录
+    __getitem__ 返回 {"input_ids", "labels"}（int64 张量），由 PaddingCollator 组 batch
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.offsets = np.load(os.path.join(data_dir, OFFSETS_FILE), mmap_mode='r')
+        self.label_starts = np.load(os.path.join(data_dir, LABEL_STARTS_FILE), mmap_mode='r')
+        self._tokens = None
+
+    @property
+    def tokens(self):
+        # 延迟打开，DataLoader worker 各自映射同一个文件，不会把数据复制进子进程
+        if self._tokens is None:
+            path = os.path.join(self.data_dir, TOKENS_FILE)
+            if os.path.getsize(path) == 0:
+                self._tokens = np.zeros(0, dtype=TOKEN_DTYPE)
+            else:
+                self._tokens = np.memmap(path, dtype=TOKEN_DTYPE, mode='r')
+        return self._tokens
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_tokens"] = None
+        return state
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        """每条样本的 token 数"""
+        return np.diff(self.offsets)
+
+    def __getitem__(self, index):
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        input_ids = torch.from_numpy(self.tokens[start:end].astype(np.int64))
+        labels = input_ids.clone()
+        labels[:int(self.label_starts[index])] = IGNORE_INDEX
+        return {"input_ids": input_ids, "labels": labels}
+
+class PaddingCollator:
+    """右填充到 batch 内最长样本，labels 的填充位置为 -100"""
+
+    def __init__(self, pad_token_id, pad_to_multiple_of=None):
+        self.pad_token_id = pad_token_id
+        self.pad_to_multiple_of = pad_to_multiple_of
+
+    def __call__(self, features):
+        max_len = max(len(f["input_ids"]) for f in features)
+        if self.pad_to_multiple_of:
+            max_len = (max_len + self.pad_to_multiple_of - 1) // self.pad_to_multiple_of * self.pad_to_multiple_of
+
+        input_ids = torch.full((len(features), max_len), self.pad_token_id, dtype=torch.long)
+        labels = torch.full((len(features), max_len), IGNORE_INDEX, dtype=torch.long)
+        attention_mask = torch.zeros((len(features), max_len), dtype=torch.long)
+        for i, f in enumerate(features):
+            n = len(f["input_ids"])
+            input_ids[i, :n] = torch.as_tensor(f["input_ids"])
+            labels[i, :n] = torch.as_tensor(f["labels"])
+            attention_mask[i, :n] = 1
+        return {"input_ids": input_ids, "attention_mask": attention_mask, "labels": labels}
+
+class PackedTokenDataset(Dataset):
+    """
+    序列打包：把多条短样本首尾拼接成不超过 max_length 的一行，减少 padding。
+    每条样本的 position_ids 从 0 重新计数，模型据此构造块对角注意力（样本之间互不可见）；
+    每条样本第一个 token 的 label 置为 -100，避免用上一条样本的结尾预测下一条样本的开头。
+    """
+
+    def __init__(self, dataset, max_length, seed=42):
+        self.dataset = dataset
+        self.max_length = max_length
+        lengths = np.minimum(dataset.lengths, max_length)
+
+        # 按随机顺序贪心装箱，打包结果用两个数组表示：样本顺序 + 每行的起止位置
+        order = np.random.default_rng(seed).permutation(len(lengths))
+        pack_offsets = [0]
+        used = 0
+        for pos, index in enumerate(order):
+            n = int(lengths[index])
+            if used and used + n > max_length:
+                pack_offsets.append(pos)
+                used = 0
+            used += n
+        if len(order):
+            pack_offsets.append(len(order))
+        self._order = order
+        self._pack_offsets = np.asarray(pack_offsets, dtype=np.int64)
+        self.num_tokens = int(lengths.sum())
+
+    def __len__(self):
+        return len(self._pack_offsets) - 1
+
+    @property
+    def efficiency(self):
+        """有效 token 占 len(self) * max_length 的比例"""
+        return self.num_tokens / max(1, len(self) * self.max_length)
+
+    def __getitem__(self, index):
+        start, end = self._pack_offsets[index], self._pack_offsets[index + 1]
+        input_ids, labels, position_ids = [], [], []
+        for sample_index in self._order[start:end]:
+            sample = self.dataset[int(sample_index)]
+            ids = sample["input_ids"][:self.max_length]
+            sample_labels = sample["labels"][:self.max_length].clone()
+            sample_labels[0] = IGNORE_INDEX
+            input_ids.append(ids)
+            labels.append(sample_labels)
+            position_ids.append(torch.arange(len(ids), dtype=torch.long))
+        return {
+            "input_ids": torch.cat(input_ids),
+            "labels": torch.cat(labels),
+            "position_ids": torch.cat(position_ids),
+        }
+
+class PackedCollator:
+    """
+    打包样本的 collator：不返回 attention_mask，由 position_ids 的重置位置确定样本边界
+    （transformers 会据此生成块对角 causal mask，flash-attention 则走 varlen 路径；
+    transformers 只在没有 KV Cache 时这样做，前向须关闭 use_cache，train.py 已在模型配置中关闭）。
+    行尾的 padding 单独作为一段，position_ids 从 0 开始，label 为 -100。
+    """
+
+    def __init__(self, pad_token_id):
+        self.pad_token_id = pad_token_id
+
+    def __call__(self, features):
+        max_len = max(len(f["input_ids"]) for f in features)
+        input_ids = torch.full((len(features), max_len), self.pad_token_id, dtype=torch.long)
+        labels = torch.full((len(features), max_len), IGNORE_INDEX, dtype=torch.long)
+        position_ids = torch.zeros((len(features), max_len), dtype=torch.long)
+        for i, f in enumerate(features):
+            n = len(f["input_ids"])
+            input_ids[i, :n] = f["input_ids"]
+            labels[i, :n] = f["labels"]
+            position_ids[i, :n] = f["position_ids"]
+            position_ids[i, n:] = torch.arange(max_len - n)
+        return {"input_ids": input_ids, "labels": labels, "position_ids": position_ids}
+
+class LengthGroupedBatchSampler:
+    """
+    按长度分组的 batch sampler（用于不打包的 padding 训练）
+    每个 epoch：打乱全部样本 -> 切成若干大桶 -> 桶内按长度排序后切成 batch -> 打乱 batch 顺序。
+    同一 batch 内长度接近，padding 很少；随机性保留在桶和 batch 两个层面。
+    batch 可以按固定样本数（batch_size）或按 token 预算（max_tokens，按 batch 内最长样本 × 样本数计算）切分，
+    后者让长样本自动组成更小的 batch，避免长尾样本导致显存峰值。
+    epoch 只由 set_epoch 决定（Trainer 每轮开始时调用），同一 epoch 多次迭代得到相同的顺序。
+    按 token 预算切分时 batch 数随分桶结果略有浮动，len() 取第 0 轮的 batch 数并固定下来，
+    其他轮拆分或合并少量 batch 对齐到这个数，Trainer 据此计算的步数与实际迭代一致。
+    """
+
+    def __init__(self, lengths, batch_size=None, max_tokens=None, bucket_size=None, seed=42, drop_last=False):
+        if batch_size is None and max_tokens is None:
+            raise ValueError("batch_size 和 max_tokens 至少指定一个")
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        # 默认每个大桶约 100 个 batch 的样本量
+        self.bucket_size = bucket_size or (batch_size or 8) * 100
+        self.seed = seed
+        self.drop_last = drop_last
+        self.epoch = 0
+        self._cached = None
+        self._num_batches = None
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _split(self, indices):
+        """把已按长度排序的下标切成 batch"""
+        if self.max_tokens is None:
+            return [indices[i:i + self.batch_size] for i in range(0, len(indices), self.batch_size)]
+
+        batches, current, longest = [], [], 0
+        for index in indices:
+            n = int(self.lengths[index])
+            too_many = self.batch_size is not None and len(current) >= self.batch_size
+            if current and (too_many or max(longest, n) * (len(current) + 1) > self.max_tokens):
+                batches.append(current)
+                current, longest = [], 0
+            current.append(index)
+            longest = max(longest, n)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _cost(self, batch):
+        return int(self.lengths[batch].max()) * len(batch)
+
+    def _fit(self, batches, target):
+        """
+        按 token 预算切分的 batch 数对齐到 target：不足时把样本最多的 batch 对半拆开，
+        超出时合并 token 数较少、合并后仍不超预算的两个 batch；找不到可合并的 batch 时保留多出的部分
+        """
+        while len(batches) < target:
+            largest = max(range(len(batches)), key=lambda i: len(batches[i]))
+            batch = batches[largest]
+            if len(batch) < 2:
+                break
+            half = len(batch) // 2
+            batches[largest:largest + 1] = [batch[:half], batch[half:]]
+        while len(batches) > target:
+            # 只在 token 数最少的几十个 batch 里找，避免 batch 很多时两两比较
+            order = sorted(range(len(batches)), key=lambda i: self._cost(batches[i]))[:64]
+            pair = next((
+                (i, j) for k, i in enumerate(order) for j in order[k + 1:]
+                if self._cost(batches[i] + batches[j]) <= self.max_tokens
+                and (self.batch_size is None or len(batches[i]) + len(batches[j]) <= self.batch_size)
+            ), None)
+            if pair is None:
+                break
+            i, j = pair
+            merged = sorted(batches[i] + batches[j], key=lambda index: -self.lengths[index])
+            batches = [b for k, b in enumerate(batches) if k not in pair] + [merged]
+        return batches
+
+    def _build(self, epoch):
+        rng = np.random.default_rng(self.seed + epoch)
+        order = rng.permutation(len(self.lengths))
+        batches = []
+        for start in range(0, len(order), self.bucket_size):
+            bucket = order[start:start + self.bucket_size]
+            bucket = bucket[np.argsort(-self.lengths[bucket], kind="stable")]
+            batches.extend(self._split(bucket.tolist()))
+
+        if self.drop_last and self.max_tokens is None and batches and len(batches[-1]) < self.batch_size:
+            batches = [b for b in batches if len(b) == self.batch_size]
+        return batches, rng
+
+    def _batches(self):
+        if self._cached is not None and self._cached[0] == self.epoch:
+            return self._cached[1]
+
+        batches, rng = self._build(self.epoch)
+        if self.max_tokens is not None:
+            batches = self._fit(batches, len(self))
+        batches = [batches[i] for i in rng.permutation(len(batches))]
+        self._cached = (self.epoch, batches)
+        return batches
+
+    def __iter__(self):
+        return iter(self._batches())
+
+    def __len__(self):
+        # 按样本数切分时各轮 batch 数相同；按 token 预算切分时固定为第 0 轮的 batch 数
+        if self._num_batches is None:
+            self._num_batches = len(self._build(0)[0])
+        return self._num_batches
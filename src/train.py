@@ -1,83 +1,192 @@
 # src/train.py
 import os
 import torch
+import torch.nn.functional as F
+import transformers
+import yaml
+from packaging import version
 from transformers import (
     AutoModelForCausalLM,
     AutoTokenizer,
+    BitsAndBytesConfig,
     TrainingArguments,
-    Trainer,
-    DataCollatorForSeq2Seq
+    Trainer
 )
 from peft import LoraConfig, get_peft_model, TaskType
-from datasets import load_dataset
+from torch.utils.data import DataLoader
+from process_data import build_tokenized_dataset, load_tokenized_dataset
+from losses import chunked_cross_entropy
+from token_dataset import IGNORE_INDEX, LengthGroupedBatchSampler, PackedCollator, PackedTokenDataset, PaddingCollator
+from train_config import TrainConfig, parse_args
 
-def train():
-    # 1. 配置参数
-    model_id = "meta-llama/Meta-Llama-3-8B-Instruct"  # 基座模型路径
-    output_dir = "./model/lora_adapter"
-    data_path = "./data/adgen_train.json"
+class AdGenTrainer(Trainer):
+    """
+    在 Trainer 基础上支持：
+    - 自定义 batch sampler（按长度分组 / 按 token 预算组 batch）
+    - label_only_logits：只对有 label 的位置过 lm_head，prompt 部分不计算 128k 词表的 logits
+    - loss_chunk_size：lm_head 与交叉熵分块融合计算，不生成完整的 [N, vocab] logits
+    """
+
+    def __init__(self, *args, batch_sampler=None, label_only_logits=False, loss_chunk_size=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_sampler = batch_sampler
+        self.label_only_logits = label_only_logits
+        self.loss_chunk_size = loss_chunk_size
+
+    def get_train_dataloader(self):
+        if self.batch_sampler is None:
+            return super().get_train_dataloader()
+        dataloader = DataLoader(
+            self.train_dataset,
+            batch_sampler=self.batch_sampler,
+            collate_fn=self.data_collator,
+            num_workers=self.args.dataloader_num_workers,
+            pin_memory=self.args.dataloader_pin_memory,
+        )
+        return self.accelerator.prepare(dataloader)
+
+    def compute_loss(self, model, inputs, return_outputs=False, num_items_in_batch=None, **kwargs):
+        # DDP 下必须走包装后的 forward 才能同步梯度，此时退回默认实现
+        if not (self.label_only_logits or self.loss_chunk_size) or return_outputs \
+                or isinstance(model, torch.nn.parallel.DistributedDataParallel):
+            if num_items_in_batch is not None:
+                kwargs["num_items_in_batch"] = num_items_in_batch
+            return super().compute_loss(model, inputs, return_outputs=return_outputs, **kwargs)
+
+        inputs = dict(inputs)
+        labels = inputs.pop("labels")
+        causal_lm = model.get_base_model() if hasattr(model, "get_base_model") else model
+        with self.accelerator.autocast():
+            hidden_states = causal_lm.model(**inputs, use_cache=False)[0]
+
+            # 第 t 个位置预测第 t+1 个 token，只取需要计算 loss 的位置
+            shift_labels = labels[:, 1:]
+            label_mask = shift_labels != IGNORE_INDEX
+            hidden_states = hidden_states[:, :-1][label_mask]
+            if self.loss_chunk_size:
+                loss = chunked_cross_entropy(
+                    hidden_states, causal_lm.lm_head.weight, shift_labels[label_mask], self.loss_chunk_size
+                )
+            else:
+                logits = causal_lm.lm_head(hidden_states)
+        if not self.loss_chunk_size:
+            loss = F.cross_entropy(logits.float(), shift_labels[label_mask], reduction="sum")
+
+        # num_items_in_batch 为整个梯度累积周期内的 label 数，与 Trainer 默认的归一化方式一致
+        num_items = num_items_in_batch if num_items_in_batch is not None else label_mask.sum()
+        return loss / num_items
+
+def train(config=None):
+    # 1. 配置参数 (YAML + 命令行，见 train_config.py)
+    config = config or TrainConfig()
+    model_args, quant_args, lora_args = config.model, config.quantization, config.lora
+    data_args, train_args = config.data, config.training
+    os.makedirs(model_args.output_dir, exist_ok=True)
+    with open(os.path.join(model_args.output_dir, "train_config.yaml"), 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config.to_dict(), f, allow_unicode=True, sort_keys=False)
 
     # 2. 加载 Tokenizer
-    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    tokenizer = AutoTokenizer.from_pretrained(model_args.model_id)
     tokenizer.pad_token = tokenizer.eos_token
 
     # 3. 加载基座模型 (4-bit 量化加载 - 显存优化关键)
+    compute_dtype = getattr(torch, quant_args.compute_dtype)
+    quantization_config = None
+    if quant_args.load_in_4bit:
+        quantization_config = BitsAndBytesConfig(
+            load_in_4bit=True,   # QLoRA 核心
+            bnb_4bit_quant_type=quant_args.bnb_4bit_quant_type,
+            bnb_4bit_use_double_quant=quant_args.bnb_4bit_use_double_quant,
+            bnb_4bit_compute_dtype=compute_dtype
+        )
+    model_kwargs = {}
+    if model_args.attn_implementation:
+        model_kwargs["attn_implementation"] = model_args.attn_implementation
     model = AutoModelForCausalLM.from_pretrained(
-        model_id,
+        model_args.model_id,
         device_map="auto",
-        load_in_4bit=True,   # QLoRA 核心
-        torch_dtype=torch.float16
+        quantization_config=quantization_config,
+        torch_dtype=compute_dtype,
+        **model_kwargs
     )
 
     # 4. 配置 LoRA
     peft_config = LoraConfig(
         task_type=TaskType.CAUSAL_LM,
-        r=8,                 # Rank
-        lora_alpha=16,
-        lora_dropout=0.1,
-        target_modules=["q_proj", "v_proj"]
+        r=lora_args.r,                 # Rank
+        lora_alpha=lora_args.lora_alpha,
+        lora_dropout=lora_args.lora_dropout,
+        target_modules=list(lora_args.target_modules)
     )
     model = get_peft_model(model, peft_config)
-    model.print_trainable_parameters() # 打印可训练参数量 (0.1%)
+    model.config.use_cache = False  # 训练不需要 KV Cache；打包模式下也依赖它才会按 position_ids 划分样本
+    if train_args.gradient_checkpointing:
+        model.gradient_checkpointing_enable(gradient_checkpointing_kwargs={"use_reentrant": False})
+        model.enable_input_require_grads()
+    model.print_trainable_parameters() # 打印可训练参数量
 
-    # 5. 加载数据
-    dataset = load_dataset("json", data_files=data_path, split="train")
-    
-    def process_func(example):
-        # 简单的数据处理逻辑 (Alpaca格式)
-        instruction = example["instruction"]
-        input_text = example["input"]
-        output_text = example["output"]
-        prompt = f"<|begin_of_text|><|start_header_id|>system<|end_header_id|>\n\n{instruction}<|eot_id|><|start_header_id|>user<|end_header_id|>\n\n{input_text}<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n"
-        inputs = tokenizer(prompt + output_text + "<|eot_id|>", return_tensors="pt")
-        inputs["labels"] = inputs["input_ids"].clone()
-        return inputs
-
-    tokenized_ds = dataset.map(process_func)
+    # 5. 加载数据 (多进程清洗+分词，结果按分词器和模板缓存，未变化时直接复用；训练时内存映射读取)
+    cache_dir = build_tokenized_dataset(
+        data_args.raw_data_path,
+        model_args.model_id,
+        cache_root=data_args.cache_dir,
+        num_proc=data_args.num_proc,
+        mask_prompt=data_args.mask_prompt
+    )
+    tokenized_ds = load_tokenized_dataset(cache_dir)
+    if data_args.packing:
+        # 块对角 mask 由 transformers 根据 position_ids 的重置位置生成（4.53 起 sdpa/eager 均支持）
+        if version.parse(transformers.__version__) < version.parse("4.53.0") \
+                and model.config._attn_implementation != "flash_attention_2":
+            raise RuntimeError("序列打包需要 transformers>=4.53 或 flash_attention_2")
+        tokenized_ds = PackedTokenDataset(tokenized_ds, data_args.max_seq_length, seed=train_args.seed)
+        data_collator = PackedCollator(tokenizer.pad_token_id)
+        print(f"序列打包: {len(tokenized_ds)} 行, 填充率 {tokenized_ds.efficiency:.1%}")
+        batch_sampler = None
+    else:
+        data_collator = PaddingCollator(tokenizer.pad_token_id)
+        # 长度相近的样本组成一个 batch，减少 padding，长样本自动组成更小的 batch
+        max_tokens = data_args.max_tokens_per_batch
+        batch_sampler = LengthGroupedBatchSampler(
+            tokenized_ds.lengths,
+            batch_size=None if max_tokens else train_args.per_device_train_batch_size,
+            max_tokens=max_tokens,
+            seed=train_args.seed
+        )
 
     # 6. 配置训练参数
     args = TrainingArguments(
-        output_dir=output_dir,
-        per_device_train_batch_size=2,
-        gradient_accumulation_steps=4, # 梯度累积
-        learning_rate=2e-4,            # 学习率
-        num_train_epochs=5,
-        logging_steps=10,
-        fp16=True,                     # 混合精度
-        save_strategy="epoch"
+        output_dir=model_args.output_dir,
+        per_device_train_batch_size=train_args.per_device_train_batch_size,
+        gradient_accumulation_steps=train_args.gradient_accumulation_steps, # 梯度累积
+        learning_rate=train_args.learning_rate,            # 学习率
+        num_train_epochs=train_args.num_train_epochs,
+        lr_scheduler_type=train_args.lr_scheduler_type,
+        warmup_steps=train_args.warmup_steps,
+        logging_steps=train_args.logging_steps,
+        fp16=train_args.fp16,                     # 混合精度
+        bf16=train_args.bf16,
+        save_strategy=train_args.save_strategy,
+        save_steps=train_args.save_steps,
+        save_total_limit=train_args.save_total_limit,
+        dataloader_num_workers=train_args.dataloader_num_workers,
+        seed=train_args.seed
     )
 
     # 7. 开始训练
-    trainer = Trainer(
+    trainer = AdGenTrainer(
         model=model,
         args=args,
         train_dataset=tokenized_ds,
-        data_collator=DataCollatorForSeq2Seq(tokenizer=tokenizer, padding=True),
+        data_collator=data_collator,
+        batch_sampler=batch_sampler,
+        label_only_logits=train_args.label_only_logits,
+        loss_chunk_size=train_args.loss_chunk_size,
     )
     
-    trainer.train()
-    trainer.save_model(output_dir)
+    trainer.train(resume_from_checkpoint=train_args.resume_from_checkpoint)
+    trainer.save_model(model_args.output_dir)
     print("Training Completed! Model saved.")
 
 if __name__ == "__main__":
-    train()
\ No newline at end of file
+    train(parse_args())
@@ -0,0 +1,155 @@
+# src/train_config.py
+"""
+训练配置：YAML 文件 + 命令行覆盖
+
+优先级：命令行 > YAML > 默认值。
+- YAML 按 model / quantization / lora / data / training 分节，字段与下面的 dataclass 一一对应；
+- 常用参数有快捷命令行选项（scripts/run.sh 使用的 --epoch / --lr / --batch_size 等）；
+- 任意字段都可以用 --set section.key=value 覆盖，值按 YAML 语法解析，便于做参数扫描：
+  python src/train.py --config configs/lora_adgen.yaml --set lora.r=16 --set "lora.target_modules=[q_proj,v_proj]"
+"""
+import argparse
+from dataclasses import asdict, dataclass, field, fields
+from typing import List, Optional, Union, get_args, get_origin, get_type_hints
+
+import yaml
+
+def _coerce(annotation, value):
+    """按字段类型转换数值（PyYAML 会把 2e-4 这类写法解析成字符串）"""
+    if value is None:
+        return None
+    if get_origin(annotation) is Union:
+        annotation = next(a for a in get_args(annotation) if a is not type(None))
+    if annotation is float and isinstance(value, (int, str)) and not isinstance(value, bool):
+        return float(value)
+    if annotation is int and isinstance(value, str):
+        return int(value)
+    return value
+
+@dataclass
+class ModelArgs:
+    model_id: str = "meta-llama/Meta-Llama-3-8B-Instruct"  # 基座模型路径
+    output_dir: str = "./model/lora_adapter"
+    attn_implementation: Optional[str] = None  # sdpa / eager / flash_attention_2，None 使用 transformers 默认
+
+@dataclass
+class QuantizationArgs:
+    load_in_4bit: bool = True           # QLoRA 核心
+    bnb_4bit_quant_type: str = "nf4"
+    bnb_4bit_use_double_quant: bool = False
+    compute_dtype: str = "float16"
+
+@dataclass
+class LoraArgs:
+    r: int = 8
+    lora_alpha: int = 16
+    lora_dropout: float = 0.1
+    # 与发布的适配器（results/adapter_config.json）一致：注意力与 MLP 的全部 7 个投影层
+    target_modules: List[str] = field(default_factory=lambda: [
+        "q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"
+    ])
+
+@dataclass
+class DataArgs:
+    raw_data_path: str = "./data/raw_data.json"  # 原始 AdGen JSONL，清洗与分词一次完成
+    cache_dir: str = "./data/tokenized"
+    num_proc: Optional[int] = None
+    mask_prompt: bool = True            # 只对回复计算 loss
+    packing: bool = True                # 序列打包：多条短样本拼成一行，样本间注意力隔离
+    max_seq_length: int = 1024          # 打包后每行的最大 token 数
+    max_tokens_per_batch: Optional[int] = 4096  # 不打包时按 token 预算组 batch（含 padding），None 则使用固定 batch_size
+
+@dataclass
+class TrainingArgs:
+    num_train_epochs: float = 5
+    learning_rate: float = 2e-4
+    per_device_train_batch_size: int = 2
+    gradient_accumulation_steps: int = 4
+    lr_scheduler_type: str = "linear"
+    warmup_steps: int = 0
+    logging_steps: int = 10
+    fp16: bool = True                   # 混合精度
+    bf16: bool = False
+    gradient_checkpointing: bool = False
+    save_strategy: str = "epoch"
+    save_steps: int = 500
+    save_total_limit: Optional[int] = None
+    resume_from_checkpoint: Optional[str] = None
+    dataloader_num_workers: int = 0
+    seed: int = 42
+    label_only_logits: bool = True      # 只对有 label 的位置计算 logits
+    loss_chunk_size: Optional[int] = 1024  # lm_head + 交叉熵分块计算，None 则一次性计算 logits
+
+@dataclass
+class TrainConfig:
+    model: ModelArgs = field(default_factory=ModelArgs)
+    quantization: QuantizationArgs = field(default_factory=QuantizationArgs)
+    lora: LoraArgs = field(default_factory=LoraArgs)
+    data: DataArgs = field(default_factory=DataArgs)
+    training: TrainingArgs = field(default_factory=TrainingArgs)
+
+    def set(self, dotted_key, value):
+        """按 section.key 设置单个字段"""
+        section_name, _, key = dotted_key.partition(".")
+        section = getattr(self, section_name, None)
+        if section is None or not key or key not in {f.name for f in fields(section)}:
+            raise ValueError(f"未知的配置项: {dotted_key}")
+        setattr(section, key, _coerce(get_type_hints(type(section))[key], value))
+
+    def update(self, values):
+        """用嵌套字典（YAML 内容）更新配置"""
+        for section_name, section_values in (values or {}).items():
+            if not isinstance(section_values, dict):
+                raise ValueError(f"配置节 {section_name} 应为字典")
+            for key, value in section_values.items():
+                self.set(f"{section_name}.{key}", value)
+        return self
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_yaml(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls().update(yaml.safe_load(f))
+
+# 快捷命令行选项 -> 配置字段
+_SHORTCUTS = {
+    "model_id": "model.model_id",
+    "output_dir": "model.output_dir",
+    "data": "data.raw_data_path",
+    "epoch": "training.num_train_epochs",
+    "lr": "training.learning_rate",
+    "batch_size": "training.per_device_train_batch_size",
+    "grad_accum": "training.gradient_accumulation_steps",
+    "lora_r": "lora.r",
+    "max_seq_length": "data.max_seq_length",
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Llama-3 LoRA 训练脚本")
+    parser.add_argument("--config", type=str, default=None, help="YAML 配置文件")
+    parser.add_argument("--model_id", type=str)
+    parser.add_argument("--output_dir", type=str)
+    parser.add_argument("--data", type=str, help="原始 AdGen JSONL 路径")
+    parser.add_argument("--epoch", type=float)
+    parser.add_argument("--lr", type=float)
+    parser.add_argument("--batch_size", type=int, help="每卡 batch size")
+    parser.add_argument("--grad_accum", type=int, help="梯度累积步数")
+    parser.add_argument("--lora_r", type=int)
+    parser.add_argument("--max_seq_length", type=int)
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="SECTION.KEY=VALUE",
+                        help="覆盖任意配置项，可重复使用")
+    args = parser.parse_args(argv)
+
+    config = TrainConfig.from_yaml(args.config) if args.config else TrainConfig()
+    for option, dotted_key in _SHORTCUTS.items():
+        value = getattr(args, option)
+        if value is not None:
+            config.set(dotted_key, value)
+    for override in args.overrides:
+        dotted_key, sep, value = override.partition("=")
+        if not sep:
+            raise ValueError(f"--set 参数格式应为 section.key=value: {override}")
+        config.set(dotted_key.strip(), yaml.safe_load(value))
+    return config
@@ -0,0 +1,205 @@
+# app/weight_loader.py
+"""
+safetensors 分片并行加载
+
+from_pretrained 逐个分片读取权重，再逐个张量拷贝到模型里。这里改为：
+1. 先在目标设备上构建不做随机初始化的模型骨架（参数存储已分配，但不写入）；
+2. 每个分片一个线程，用私有内存映射（写时复制）打开文件，张量直接引用映射的页面，
+   由 copy_ 从页缓存一次拷进参数存储（同时完成 bf16 -> fp16 等类型转换），不经过中间张量；
+   CPU 上 dtype 一致时直接让参数引用映射的页面（零拷贝，按需换入）；
+3. 加载在后台进行，调用方可以同时加载分词器、往骨架上挂 LoRA 适配器，最后 join。
+
+不适用（多卡切分、显存放不下、非 safetensors 权重等）时 build_empty_model 返回 None，调用方退回 from_pretrained。
+"""
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import torch
+from transformers import AutoConfig, AutoModelForCausalLM, GenerationConfig
+
+try:
+    from transformers.initialization import no_init_weights
+except ImportError:
+    try:
+        from transformers.modeling_utils import no_init_weights
+    except ImportError:
+        no_init_weights = nullcontext
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "model.safetensors.index.json"
+SINGLE_FILE = "model.safetensors"
+
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def safetensors_shards(model_path):
+    """模型目录下的 safetensors 分片路径；没有 safetensors 权重时返回空列表"""
+    index_path = os.path.join(model_path, INDEX_FILE)
+    if os.path.exists(index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            weight_map = json.load(f)["weight_map"]
+        return [os.path.join(model_path, name) for name in sorted(set(weight_map.values()))]
+    single_path = os.path.join(model_path, SINGLE_FILE)
+    return [single_path] if os.path.exists(single_path) else []
+
+
+def read_safetensors_header(path):
+    """返回 (张量元信息字典, 数据区起始偏移)"""
+    with open(path, 'rb') as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    header.pop("__metadata__", None)
+    return header, 8 + header_size
+
+
+def _dtype(name, info):
+    dtype = _SAFETENSORS_DTYPES.get(info["dtype"])
+    if dtype is None:
+        raise ValueError(f"不支持的 safetensors 类型 {info['dtype']}: {name}")
+    return dtype
+
+
+def mmap_safetensors(path):
+    """零拷贝打开 safetensors 文件，返回 {名称: 张量}，张量直接引用文件的私有内存映射"""
+    header, data_start = read_safetensors_header(path)
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    tensors = {}
+    for name, info in header.items():
+        dtype = _dtype(name, info)
+        begin, end = info["data_offsets"]
+        numel = (end - begin) // torch.empty((), dtype=dtype).element_size()
+        if numel == 0:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+        else:
+            tensors[name] = torch.frombuffer(buffer, dtype=dtype, count=numel, offset=data_start + begin).view(info["shape"])
+    return tensors
+
+
+def _checkpoint_numel(shards):
+    """只读各分片的头部，统计浮点参数总数"""
+    total = 0
+    for path in shards:
+        for name, info in read_safetensors_header(path)[0].items():
+            if _dtype(name, info).is_floating_point:
+                total += math.prod(info["shape"])
+    return total
+
+
+def build_empty_model(model_path, torch_dtype, trust_remote_code=True, device=None):
+    """
+    在单一设备上构建未初始化权重的模型骨架，返回 (model, 分片列表)
+    device 为 None 时单卡用 cuda:0、无卡用 CPU；
+    多卡、显存不足或没有 safetensors 分片时返回 None，由调用方走 from_pretrained(device_map="auto")
+    """
+    shards = safetensors_shards(model_path)
+    if not shards:
+        return None
+    if device is None:
+        if torch.cuda.device_count() > 1:
+            return None
+        device = "cuda:0" if torch.cuda.is_available() else "cpu"
+
+    device = torch.device(device)
+    if device.type == "cuda":
+        # 按目标 dtype 估算权重大小，留 10% 余量给激活与 KV Cache；放不下时交给 device_map 做 CPU offload
+        needed = _checkpoint_numel(shards) * torch.empty((), dtype=torch_dtype).element_size() * 1.1
+        if torch.cuda.mem_get_info(device)[0] < needed:
+            return None
+
+    config = AutoConfig.from_pretrained(model_path, trust_remote_code=trust_remote_code, local_files_only=True)
+    with torch.device(device), no_init_weights():
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=torch_dtype, trust_remote_code=trust_remote_code)
+    # 先绑定共享权重，加载时只需写入其中一个名称
+    model.tie_weights()
+    if os.path.exists(os.path.join(model_path, "generation_config.json")):
+        model.generation_config = GenerationConfig.from_pretrained(model_path)
+    model.eval()
+    return model, shards
+
+
+class ShardedWeightLoader:
+    """
+    把分片权重并行加载进模型（每个分片一个线程），start() 后在后台运行，join() 等待完成并返回统计
+    加载目标在构造时按参数名记录，之后给模型挂 LoRA（模块被包装、参数名改变）也不影响写入。
+    """
+
+    def __init__(self, model, shards, num_workers=None):
+        self.shards = list(shards)
+        self.num_workers = max(1, min(num_workers or len(self.shards), len(self.shards)))
+        self._targets = model.state_dict(keep_vars=True)
+        self._thread = None
+        self._error = None
+        self._loaded_ids = set()
+        self._lock = threading.Lock()
+        self.bytes_loaded = 0
+        self.elapsed = None
+
+    def _load_shard(self, path):
+        loaded_bytes = 0
+        for name, source in mmap_safetensors(path).items():
+            target = self._targets.get(name)
+            if target is None:
+                continue
+            if target.shape != source.shape:
+                raise ValueError(f"权重形状不匹配 {name}: 模型 {tuple(target.shape)}，文件 {tuple(source.shape)}")
+            with torch.no_grad():
+                if target.device.type == "cpu" and target.dtype == source.dtype:
+                    target.data = source
+                else:
+                    target.copy_(source)
+            loaded_bytes += source.numel() * source.element_size()
+            with self._lock:
+                self._loaded_ids.add(id(target))
+        with self._lock:
+            self.bytes_loaded += loaded_bytes
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(self.num_workers, thread_name_prefix="weight-shard") as pool:
+                list(pool.map(self._load_shard, self.shards))
+            missing = [name for name, tensor in self._targets.items() if id(tensor) not in self._loaded_ids]
+            if missing:
+                raise ValueError(f"权重文件缺少 {len(missing)} 个张量，例如: {missing[:3]}")
+        except Exception as e:
+            self._error = e
+        finally:
+            self.elapsed = time.perf_counter() - start
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="weight-loader", daemon=True)
+        self._thread.start()
+        return self
+
+    def join(self):
+        """等待加载结束；加载失败时抛出异常"""
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    @property
+    def throughput_gb_s(self):
+        return self.bytes_loaded / 1e9 / self.elapsed if self.elapsed else 0.0
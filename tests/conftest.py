@@ -0,0 +1,82 @@
+# tests/conftest.py
+"""
+测试公共夹具：复用 bench/common.py 的小型随机 Llama（2 层，hidden 64），CPU 即可运行
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.common import build_tiny_checkpoint, setup_import_paths
+
+setup_import_paths()
+
+
+@pytest.fixture(scope="session")
+def tiny_checkpoint(tmp_path_factory):
+    """(base_path, lora_path)：整个测试会话共用一份小模型与随机 LoRA"""
+    return build_tiny_checkpoint(str(tmp_path_factory.mktemp("tiny")))
+
+
+@pytest.fixture(scope="session")
+def tiny_model(tiny_checkpoint):
+    """(model, tokenizer)：不带 LoRA 的小模型，eval 模式"""
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    base_path, _ = tiny_checkpoint
+    model = AutoModelForCausalLM.from_pretrained(base_path).eval()
+    return model, AutoTokenizer.from_pretrained(base_path)
+
+
+@pytest.fixture(scope="session")
+def second_lora(tiny_checkpoint, tmp_path_factory):
+    """与 tiny_checkpoint 的 LoRA 结构相同、权重不同的第二个适配器"""
+    import torch
+    from peft import LoraConfig, get_peft_model
+    from transformers import AutoModelForCausalLM
+
+    base_path, _ = tiny_checkpoint
+    path = str(tmp_path_factory.mktemp("lora_b"))
+    torch.manual_seed(1)
+    model = AutoModelForCausalLM.from_pretrained(base_path)
+    config = LoraConfig(
+        r=8,
+        lora_alpha=16,
+        target_modules=["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"],
+        init_lora_weights=False,
+    )
+    get_peft_model(model, config).save_pretrained(path)
+    return path
+
+
+@pytest.fixture
+def chat_model_factory(tiny_checkpoint, monkeypatch):
+    """按需覆盖 Config 后加载 LoraChatModel，测试结束时恢复 Config"""
+    from app.config import Config
+    from app.chat_model import LoraChatModel
+
+    base_path, lora_path = tiny_checkpoint
+    defaults = dict(
+        BASE_MODEL_PATH=base_path,
+        LORA_CHECKPOINT_PATH=lora_path,
+        LORA_ADAPTERS={},
+        MERGE_LORA=False,
+        ENABLE_BATCHING=False,
+        INFERENCE_DEVICE="cpu",
+        CPU_QUANTIZATION=None,
+        CPU_DTYPE="float32",
+        SPECULATIVE_DECODING=None,
+        ENABLE_RESPONSE_CACHE=False,
+        RESPONSE_CACHE_PATH=None,
+    )
+
+    def _make(**overrides):
+        for name, value in {**defaults, **overrides}.items():
+            monkeypatch.setattr(Config, name, value)
+        chat_model = LoraChatModel()
+        chat_model.load_model()
+        return chat_model
+
+    return _make
@@ -0,0 +1,56 @@
+# tests/test_adapter_registry.py
+import pytest
+import torch
+from peft import PeftModel
+from transformers import AutoModelForCausalLM
+
+from app.adapter_registry import AdapterRegistry
+
+
+def _logits(model, name):
+    input_ids = torch.tensor([[0, 10, 20, 30, 40]])
+    with torch.no_grad():
+        return model(input_ids=input_ids, adapter_names=[name]).logits
+
+
+def _reference_logits(base_path, lora_path):
+    model = PeftModel.from_pretrained(AutoModelForCausalLM.from_pretrained(base_path), lora_path).eval()
+    with torch.no_grad():
+        return model(input_ids=torch.tensor([[0, 10, 20, 30, 40]])).logits
+
+
+@pytest.fixture
+def registry(tiny_checkpoint):
+    base_path, lora_path = tiny_checkpoint
+    registry = AdapterRegistry({"default": lora_path}, max_resident=2)
+    registry.attach(AutoModelForCausalLM.from_pretrained(base_path).eval(), "default")
+    return registry
+
+
+def test_replacing_the_only_resident_adapter_loads_new_weights(tiny_checkpoint, second_lora, registry):
+    base_path, lora_path = tiny_checkpoint
+    replaced = []
+    registry.on_replace = replaced.append
+    assert torch.allclose(_logits(registry.model, "default"), _reference_logits(base_path, lora_path), atol=1e-5)
+
+    registry.register("default", second_lora)
+
+    assert registry.resident == ["default"]
+    assert registry.adapter_paths["default"] == second_lora
+    assert torch.allclose(_logits(registry.model, "default"), _reference_logits(base_path, second_lora), atol=1e-5)
+    assert replaced == ["default"]
+
+
+def test_failed_or_blocked_replacement_keeps_old_adapter(tiny_checkpoint, second_lora, registry, tmp_path):
+    base_path, lora_path = tiny_checkpoint
+    before = _logits(registry.model, "default")
+
+    with pytest.raises(Exception):
+        registry.register("default", str(tmp_path / "missing"))
+    assert registry.adapter_paths["default"] == lora_path
+
+    with registry.using(["default"]):
+        with pytest.raises(RuntimeError):
+            registry.register("default", second_lora)
+    assert registry.adapter_paths["default"] == lora_path
+    assert torch.allclose(_logits(registry.model, "default"), before)
@@ -0,0 +1,61 @@
+# tests/test_batch_generate.py
+import json
+import os
+import subprocess
+import sys
+
+import torch
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+def test_module_entry_point_runs_as_app_package(tmp_path):
+    # 按部署方式把 src 作为 app 包（不在 sys.path 上），训练侧的顶层模块不可导入
+    os.symlink(SRC_DIR, tmp_path / "app")
+    result = subprocess.run(
+        [sys.executable, "-m", "app.batch_generate", "--help"],
+        cwd=tmp_path, env={**os.environ, "PYTHONPATH": ""}, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    assert "--input" in result.stdout
+
+
+def test_generate_batch_counts_generated_ids(chat_model_factory):
+    from app.process_data import SYSTEM_PROMPT, build_prompt
+
+    chat_model = chat_model_factory()
+    questions = ["类型#裤*版型#宽松*风格#性感", "类型#口红*质地#丝绒", "hello"]
+    prompts = [build_prompt(SYSTEM_PROMPT, q) for q in questions]
+    results = chat_model.generate_batch(prompts, questions, temperature=0.0, max_new_tokens=12)
+
+    for prompt, question, (text, generated) in zip(prompts, questions, results):
+        input_ids = chat_model.tokenizer(prompt, return_tensors="pt")["input_ids"]
+        with torch.no_grad():
+            single = chat_model.model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                                               max_new_tokens=12, do_sample=False, repetition_penalty=1.1,
+                                               eos_token_id=chat_model.tokenizer.eos_token_id,
+                                               pad_token_id=chat_model.tokenizer.eos_token_id)
+        new_ids = single[0, input_ids.shape[1]:].tolist()
+        eos = chat_model.tokenizer.eos_token_id
+        # 计数来自生成的 id 本身：到第一个结束符为止，与清理后文本的长度无关
+        assert generated == (new_ids.index(eos) if eos in new_ids else len(new_ids))
+        full = chat_model.tokenizer.decode(single[0], skip_special_tokens=True)
+        assert text == chat_model._extract_clean_response_for_current_question(full, prompt, question)
+
+
+def test_batch_generate_writes_and_resumes(chat_model_factory, tmp_path):
+    from app.batch_generate import batch_generate
+
+    chat_model_factory()
+    input_path, output_path = tmp_path / "skus.jsonl", tmp_path / "out" / "copy.jsonl"
+    contents = ["类型#裤*版型#宽松", "not json", "类型#口红*质地#丝绒", "类型#裙*颜色#淡紫色"]
+    input_path.write_text("\n".join(c if c == "not json" else json.dumps({"content": c}, ensure_ascii=False)
+                                    for c in contents) + "\n", encoding="utf-8")
+
+    batch_generate(str(input_path), str(output_path), batch_size=2, temperature=0.0, max_new_tokens=8)
+    records = [json.loads(line) for line in output_path.read_text(encoding="utf-8").splitlines()]
+    assert sorted(r["index"] for r in records) == [0, 2, 3]
+
+    # 重新运行时跳过已完成的行
+    batch_generate(str(input_path), str(output_path), batch_size=2, temperature=0.0, max_new_tokens=8)
+    assert output_path.read_text(encoding="utf-8").count("\n") == 3
@@ -0,0 +1,99 @@
+# tests/test_batch_scheduler.py
+import threading
+
+import pytest
+
+from app.batch_scheduler import BatchScheduler
+
+PROMPTS = ["类型#裤*版型#宽松*风格#性感", "类型#口红*质地#丝绒", "hello", "类型#裙*材质#雪纺*颜色#淡紫色*风格#清新"]
+
+
+def _recording(generate_fn, batches):
+    def _generate(prompts, temperatures, max_new_tokens, adapters):
+        batches.append(len(prompts))
+        return generate_fn(prompts, temperatures, max_new_tokens, adapters)
+    return _generate
+
+
+def _submit_all(scheduler, requests):
+    """max_batch_size 等于请求数、等待窗口足够长，保证这些请求合并成一批"""
+    try:
+        futures = [scheduler.submit(*request) for request in requests]
+        return [future.result(timeout=60) for future in futures]
+    finally:
+        scheduler.stop()
+
+
+def test_mixed_temperature_batch_keeps_greedy_rows(chat_model_factory):
+    chat_model = chat_model_factory()
+    batches = []
+    scheduler = BatchScheduler(_recording(chat_model._generate_batch, batches), max_batch_size=4, max_wait_ms=5000)
+
+    temperatures = [0.0, 0.7, 0.0, 1.3]
+    results = _submit_all(scheduler, [(p, t, 16) for p, t in zip(PROMPTS, temperatures)])
+
+    assert batches == [4]
+    for prompt, temperature, result in zip(PROMPTS, temperatures, results):
+        if temperature == 0.0:
+            assert result == chat_model._generate_batch([prompt], [0.0], [16])[0]
+
+
+def test_row_with_smaller_max_new_tokens_stops_on_time(chat_model_factory):
+    chat_model = chat_model_factory()
+    batches = []
+    scheduler = BatchScheduler(_recording(chat_model._generate_batch, batches), max_batch_size=3, max_wait_ms=5000)
+
+    limits = [4, 20, 9]
+    results = _submit_all(scheduler, [(p, 0.0, n) for p, n in zip(PROMPTS, limits)])
+
+    assert batches == [3]
+    for prompt, limit, result in zip(PROMPTS, limits, results):
+        assert result == chat_model._generate_batch([prompt], [0.0], [limit])[0]
+        # 达到各自上限后不再继续生成
+        longer = chat_model._generate_batch([prompt], [0.0], [limit + 1])[0]
+        assert longer.startswith(result) and longer != result
+
+
+def test_failed_generate_resolves_every_future():
+    batches = []
+
+    def _fail(prompts, temperatures, max_new_tokens, adapters):
+        raise RuntimeError("injected generate failure")
+
+    scheduler = BatchScheduler(_recording(_fail, batches), max_batch_size=3, max_wait_ms=5000)
+    try:
+        futures = [scheduler.submit(p, 0.7, 16) for p in PROMPTS[:3]]
+        for future in futures:
+            with pytest.raises(RuntimeError, match="injected"):
+                future.result(timeout=10)
+        assert batches == [3]
+
+        # 调度线程在失败后继续工作
+        scheduler.generate_fn = lambda prompts, *args: [p.upper() for p in prompts]
+        assert scheduler.submit("hello", 0.7, 16).result(timeout=10) == "HELLO"
+    finally:
+        scheduler.stop()
+
+
+def test_stop_resolves_queued_requests_and_rejects_new_ones():
+    release = threading.Event()
+
+    def _blocking(prompts, *args):
+        release.wait(timeout=10)
+        return list(prompts)
+
+    scheduler = BatchScheduler(_blocking, max_batch_size=1, max_wait_ms=0)
+    running = scheduler.submit("running", 0.7, 16)
+    queued = [scheduler.submit(f"queued-{i}", 0.7, 16) for i in range(3)]
+    stopper = threading.Thread(target=scheduler.stop)
+    stopper.start()
+    release.set()
+    stopper.join(timeout=10)
+
+    assert not stopper.is_alive()
+    assert running.result(timeout=0) == "running"
+    # 停止时仍在队列中的请求以异常结束，不会有 Future 悬空
+    for future in queued:
+        assert future.done()
+    with pytest.raises(RuntimeError):
+        scheduler.submit("late", 0.7, 16)
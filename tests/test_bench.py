@@ -0,0 +1,43 @@
+# tests/test_bench.py
+import json
+
+from bench import bench_cleaning, reference_cleaning, run
+
+
+def test_quick_suite_writes_json_report(tmp_path):
+    output = tmp_path / "latest.json"
+    run.main(["--quick", "--suites", "inference,eval", "--batch_sizes", "1,2", "--seq_lens", "32",
+              "--max_new_tokens", "4", "--repeats", "1", "--output", str(output)])
+
+    report = json.loads(output.read_text(encoding="utf-8"))
+    suites = {r["suite"] for r in report["results"]}
+    assert {"inference", "eval"} <= suites
+    assert report["meta"]["model"] == {"hidden_size": 64, "num_layers": 2}
+
+
+def test_compare_flags_throughput_and_latency_regressions():
+    base = {"suite": "inference", "case": "chat", "batch_size": 1, "seq_len": 32,
+            "tokens_per_s": 100.0, "latency_ms": {"p95": 10.0}}
+    slower = {**base, "tokens_per_s": 70.0, "latency_ms": {"p95": 13.0}}
+    within = {**base, "tokens_per_s": 90.0, "latency_ms": {"p95": 11.0}}
+
+    regressions = run.compare([slower], {"results": [base]}, tolerance=0.2)
+    assert [metric for _, metric, _, _ in regressions] == ["tokens_per_s", "latency_ms.p95"]
+    assert run.compare([within], {"results": [base]}, tolerance=0.2) == []
+
+
+def test_cleaning_matches_golden_corpus_from_reference(tmp_path):
+    assert bench_cleaning.verify_golden() == []
+
+    # 黄金语料就是参考实现（原 LoraChatModel 的清理方法）的输出，而不是被测模块自己的输出
+    regenerated = tmp_path / "golden.jsonl"
+    bench_cleaning.update_golden(str(regenerated))
+    assert bench_cleaning.load_golden(str(regenerated)) == bench_cleaning.load_golden()
+
+
+def test_cleaning_matches_reference_on_random_inputs():
+    import response_cleaning
+
+    for response, question in bench_cleaning._corpus_inputs(num_cases=3000, seed=1):
+        expected = bench_cleaning._outputs(reference_cleaning, response, question)
+        assert bench_cleaning._outputs(response_cleaning, response, question) == expected, (response, question)
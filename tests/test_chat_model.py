@@ -0,0 +1,99 @@
+# tests/test_chat_model.py
+import threading
+
+import pytest
+
+from app.chat_model import _StreamingCleaner
+from app.response_cleaning import extract_clean_response
+
+STREAMED_REPLIES = [
+    "assistant: 这款裤子采用宽松版型，穿着舒适。",
+    "助手：好的，这款连衣裙<|eot_id|>显瘦又时尚。",
+    "好的，[备注]这款口红(丝绒质地)颜色很显白。",
+    "<|start_header_id|>assistant<|end_header_id|>\n\n嗯，这个裙子很清新。",
+    "Assistant: 简约百搭的T恤，<|reserved_special_token_3|>日常通勤都合适。",
+    "  这款外套的面料挺括(含羊毛)，版型利落。",
+]
+
+
+@pytest.mark.parametrize("reply", STREAMED_REPLIES)
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5])
+def test_streaming_cleaner_matches_full_cleaning(reply, chunk_size):
+    prompt = "<|begin_of_text|>...<|start_header_id|>assistant<|end_header_id|>\n\n"
+    expected = extract_clean_response(prompt + reply, prompt, "类型#裤")
+    cleaner = _StreamingCleaner(None)
+    shown = []
+    # 按小块逐段喂入，前缀词与 <|...|> 标记会被切在块之间
+    for i in range(0, len(reply), chunk_size):
+        text = cleaner.feed(reply[i:i + chunk_size])
+        if text is not None and (not shown or text != shown[-1]):
+            shown.append(text)
+
+    assert shown[-1] == expected
+    # 中途展示的内容都是最终结果的前缀，不会先显示再消失
+    assert all(expected.startswith(text) for text in shown)
+
+
+@pytest.mark.parametrize("speculative", [None, "prompt_lookup"])
+def test_closing_stream_stops_generation_before_releasing_adapter(chat_model_factory, speculative):
+    chat_model = chat_model_factory(SPECULATIVE_DECODING=speculative)
+    threads_before = threading.active_count()
+    released_while_generating = []
+    release = chat_model.adapters.release
+
+    def _checked_release(names):
+        released_while_generating.append(threading.active_count() > threads_before)
+        release(names)
+
+    chat_model.adapters.release = _checked_release
+    stream = chat_model.chat_stream("类型#裤*版型#宽松*风格#性感", [], 0.7, 500)
+    next(stream)
+    stream.close()
+
+    assert released_while_generating == [False]
+    assert chat_model.adapters._resident["default"] == 0
+    assert threading.active_count() == threads_before
+
+
+def test_external_cancel_ends_stream_without_caching(chat_model_factory):
+    chat_model = chat_model_factory(ENABLE_RESPONSE_CACHE=True)
+    cancel = threading.Event()
+    stream = chat_model.chat_stream("类型#裤*版型#宽松*风格#性感", [], 0.7, 500, cancel=cancel)
+    next(stream)
+    cancel.set()
+
+    # generate 在下一个 token 处停止，剩余的增量文本产出完后生成器结束，不产出最终清理结果
+    list(stream)
+    assert len(chat_model.response_cache) == 0
+    assert chat_model.adapters._resident["default"] == 0
+
+
+def test_quantized_model_is_not_cached_when_lora_fails(chat_model_factory, tmp_path):
+    broken_lora = tmp_path / "broken_lora"
+    broken_lora.mkdir()
+    cache_dir = tmp_path / "quantized"
+    chat_model = chat_model_factory(
+        LORA_CHECKPOINT_PATH=str(broken_lora), CPU_QUANTIZATION="int8", QUANTIZED_MODEL_CACHE_DIR=str(cache_dir)
+    )
+
+    assert chat_model.is_loaded
+    assert not cache_dir.exists() or not any(cache_dir.iterdir())
+
+
+def test_prefix_cache_keeps_greedy_replies(chat_model_factory):
+    cached = chat_model_factory(ENABLE_PREFIX_CACHE=True)
+    uncached = chat_model_factory(ENABLE_PREFIX_CACHE=False)
+    assert uncached.prefix_cache is None
+
+    def _conversation(chat_model):
+        first = chat_model.chat("类型#裤*版型#宽松*风格#性感", [], 0.0, 40)
+        # 第二轮的 prompt 以第一轮的完整 prompt 开头，命中上一轮写入的前缀
+        second = chat_model.chat("类型#口红*质地#丝绒", [["类型#裤*版型#宽松*风格#性感", first]], 0.0, 40)
+        # 新对话只共享系统提示词前缀
+        third = chat_model.chat("类型#裙*颜色#淡紫色", [], 0.0, 40)
+        return [first, second, third]
+
+    expected = _conversation(uncached)
+    assert _conversation(cached) == expected
+    assert cached.prefix_cache.hits >= 2
+    assert all(expected) and not any(reply.startswith("抱歉") for reply in expected)
@@ -0,0 +1,156 @@
+# tests/test_continuous_batching.py
+import pytest
+import torch
+import torch.nn as nn
+
+from app.continuous_batching import ContinuousBatchingEngine
+
+PROMPTS = ["类型#裤*版型#宽松*风格#性感", "类型#口红*质地#丝绒", "hello", "类型#裙*材质#雪纺*颜色#淡紫色*风格#清新"]
+MAX_NEW_TOKENS = 12
+
+
+class _ForwardWrapper(nn.Module):
+    """把 adapter_names 从前向参数中去掉（基础模型不认识它），并可以让前向按需失败"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.fail = False
+
+    @property
+    def device(self):
+        return self.model.device
+
+    def forward(self, adapter_names=None, **kwargs):
+        if self.fail:
+            raise RuntimeError("injected forward failure")
+        return self.model(**kwargs)
+
+
+class _RecordingRegistry:
+    """只记录 acquire / release 次数的适配器注册表"""
+
+    def __init__(self):
+        self.pinned = {}
+
+    def acquire(self, names):
+        for name in names:
+            self.pinned[name] = self.pinned.get(name, 0) + 1
+
+    def release(self, names):
+        for name in names:
+            self.pinned[name] -= 1
+
+
+def _reference(model, tokenizer, prompt):
+    input_ids = torch.tensor([tokenizer(prompt)["input_ids"]])
+    with torch.no_grad():
+        output = model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=MAX_NEW_TOKENS,
+            do_sample=False,
+            repetition_penalty=1.1,
+            eos_token_id=tokenizer.eos_token_id,
+            pad_token_id=tokenizer.eos_token_id,
+        )
+    return tokenizer.decode(output[0], skip_special_tokens=True)
+
+
+def _drain(engine):
+    while engine.has_pending():
+        engine.step()
+
+
+def test_greedy_outputs_match_unbatched_generate(tiny_model):
+    model, tokenizer = tiny_model
+    engine = ContinuousBatchingEngine(model, tokenizer, max_batch_size=3)
+
+    # 不同长度的 prompt 分批到达，后来的请求在前面的请求解码途中并入批次
+    seqs = [engine.add_request(p, 0.0, MAX_NEW_TOKENS) for p in PROMPTS[:2]]
+    engine.step()
+    engine.step()
+    seqs += [engine.add_request(p, 0.0, MAX_NEW_TOKENS) for p in PROMPTS[2:]]
+    _drain(engine)
+
+    for prompt, seq in zip(PROMPTS, seqs):
+        assert seq.future.result(timeout=0) == _reference(model, tokenizer, prompt)
+
+
+def test_failed_forward_resolves_active_and_dequeued_requests(tiny_model):
+    model, tokenizer = tiny_model
+    wrapper = _ForwardWrapper(model)
+    registry = _RecordingRegistry()
+    engine = ContinuousBatchingEngine(wrapper, tokenizer, max_batch_size=4,
+                                      adapter_registry=registry, default_adapter="default")
+
+    active = engine.add_request(PROMPTS[0], 0.0, MAX_NEW_TOKENS)
+    engine.step()
+    newcomer = engine.add_request(PROMPTS[1], 0.0, MAX_NEW_TOKENS)
+
+    # 解码步失败：活跃请求和本步刚取出队列的新请求都必须以异常结束
+    wrapper.fail = True
+    with pytest.raises(RuntimeError):
+        engine.step()
+    for seq in (active, newcomer):
+        with pytest.raises(RuntimeError, match="injected"):
+            seq.future.result(timeout=0)
+    assert not engine.active and not engine.has_pending()
+    assert registry.pinned == {"default": 0}
+
+    # prefill 失败：已经 acquire 的适配器被释放
+    failed = engine.add_request(PROMPTS[2], 0.0, MAX_NEW_TOKENS)
+    with pytest.raises(RuntimeError):
+        engine.step()
+    with pytest.raises(RuntimeError, match="injected"):
+        failed.future.result(timeout=0)
+    assert registry.pinned == {"default": 0}
+
+
+def test_background_loop_survives_failure(tiny_model):
+    model, tokenizer = tiny_model
+    wrapper = _ForwardWrapper(model)
+    engine = ContinuousBatchingEngine(wrapper, tokenizer, max_batch_size=4)
+    try:
+        wrapper.fail = True
+        futures = [engine.submit(p, 0.0, MAX_NEW_TOKENS) for p in PROMPTS[:3]]
+        for future in futures:
+            with pytest.raises(RuntimeError, match="injected"):
+                future.result(timeout=30)
+
+        wrapper.fail = False
+        assert engine.submit(PROMPTS[0], 0.0, MAX_NEW_TOKENS).result(timeout=30) == _reference(model, tokenizer, PROMPTS[0])
+    finally:
+        engine.stop()
+
+
+def test_top_k_one_sampling_matches_greedy(tiny_model):
+    model, tokenizer = tiny_model
+    engine = ContinuousBatchingEngine(model, tokenizer, max_batch_size=3, top_k=1)
+
+    # top_k=1 时温度采样只剩重复惩罚后的 argmax，结果必须与贪心解码一致；分批到达覆盖历史张量的合并与扩容
+    seqs = [engine.add_request(p, 0.8, MAX_NEW_TOKENS) for p in PROMPTS[:2]]
+    engine.step()
+    seqs += [engine.add_request(p, 1.2, MAX_NEW_TOKENS) for p in PROMPTS[2:]]
+    _drain(engine)
+
+    for prompt, seq in zip(PROMPTS, seqs):
+        assert seq.future.result(timeout=0) == _reference(model, tokenizer, prompt)
+
+
+def test_sampled_tokens_stay_within_top_k(tiny_model):
+    model, tokenizer = tiny_model
+    engine = ContinuousBatchingEngine(model, tokenizer, top_p=1.0, top_k=5, repetition_penalty=1.0)
+    seqs = [engine.add_request(p, 5.0, MAX_NEW_TOKENS) for p in PROMPTS[:2]]
+    history, history_len = engine._new_history(seqs)
+
+    torch.manual_seed(0)
+    logits = torch.randn(len(seqs), len(tokenizer))
+    allowed = logits.topk(5, dim=-1).indices
+    for _ in range(50):
+        history, history_len = engine._sample(seqs, logits, history, history_len)
+    for row, seq in enumerate(seqs):
+        # 高温下分布接近均匀，只有 top_k 过滤才能保证采样结果落在前 5 个 token 中
+        assert set(seq.generated) <= set(allowed[row].tolist())
+        assert len(set(seq.generated)) > 1
+        assert history[row, :history_len[row]].tolist() == seq.prompt_ids + seq.generated
@@ -0,0 +1,19 @@
+# tests/test_evaluate.py
+from evaluate import generate_predictions, length_buckets
+
+INPUTS = ["类型#裤*版型#宽松*风格#性感", "类型#口红", "类型#裙*材质#雪纺*颜色#淡紫色*风格#清新*图案#碎花", "hi"]
+
+
+def test_length_buckets_cover_every_index_longest_first():
+    buckets = length_buckets([3, 9, 1, 7, 5], batch_size=2)
+    assert buckets == [[1, 3], [4, 0], [2]]
+
+
+def test_batched_predictions_match_one_by_one(tiny_model, monkeypatch):
+    model, tokenizer = tiny_model
+    # generate_predictions 会把分词器改成左填充，测试结束后恢复，不影响共用同一分词器的其他测试
+    monkeypatch.setattr(tokenizer, "padding_side", tokenizer.padding_side)
+    monkeypatch.setattr(tokenizer, "pad_token", tokenizer.pad_token)
+    one_by_one = generate_predictions(model, tokenizer, INPUTS, batch_size=1, max_new_tokens=12)
+    batched = generate_predictions(model, tokenizer, INPUTS, batch_size=3, max_new_tokens=12)
+    assert batched == one_by_one
@@ -0,0 +1,47 @@
+# tests/test_losses.py
+import pytest
+import torch
+import torch.nn.functional as F
+
+from losses import chunked_cross_entropy
+
+
+def _inputs(n=37, hidden=16, vocab=50, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    hidden_states = torch.randn(n, hidden, generator=generator, dtype=torch.float64)
+    weight = torch.randn(vocab, hidden, generator=generator, dtype=torch.float64)
+    labels = torch.randint(0, vocab, (n,), generator=generator)
+    return hidden_states, weight, labels
+
+
+def _loss_and_grads(fn, hidden_states, weight, labels, upstream):
+    h = hidden_states.clone().requires_grad_()
+    w = weight.clone().requires_grad_()
+    loss = fn(h, w, labels)
+    (loss * upstream).backward()
+    return loss.detach(), h.grad, w.grad
+
+
+@pytest.mark.parametrize("chunk_size", [5, 37, 64])
+@pytest.mark.parametrize("upstream", [1.0, 0.25])
+def test_matches_full_cross_entropy(chunk_size, upstream):
+    # chunk_size=5 不能整除 N=37，最后一块只有 2 行
+    hidden_states, weight, labels = _inputs()
+    expected = _loss_and_grads(
+        lambda h, w, y: F.cross_entropy(h @ w.t(), y, reduction="sum"), hidden_states, weight, labels, upstream
+    )
+    actual = _loss_and_grads(
+        lambda h, w, y: chunked_cross_entropy(h, w, y, chunk_size=chunk_size), hidden_states, weight, labels, upstream
+    )
+    for a, e in zip(actual, expected):
+        assert torch.allclose(a.double(), e, rtol=1e-5, atol=1e-6)
+
+
+def test_frozen_weight_gets_no_grad():
+    hidden_states, weight, labels = _inputs()
+    h = hidden_states.clone().requires_grad_()
+    chunked_cross_entropy(h, weight, labels, chunk_size=8).backward()
+    expected = torch.autograd.grad(F.cross_entropy(hidden_states.requires_grad_() @ weight.t(), labels, reduction="sum"),
+                                   hidden_states)[0]
+    assert weight.grad is None
+    assert torch.allclose(h.grad, expected, rtol=1e-5, atol=1e-6)
@@ -0,0 +1,37 @@
+# tests/test_metrics.py
+from app.metrics import MetricsRegistry
+
+
+def _families(text):
+    """返回 {指标名: 类型} 以及所有样本行的指标名"""
+    types, samples = {}, []
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, type_name = line.split(" ")
+            types[name] = type_name
+        elif line and not line.startswith("#"):
+            samples.append(line.split("{")[0].split(" ")[0])
+    return types, samples
+
+
+def test_counter_type_and_samples_share_name():
+    registry = MetricsRegistry()
+    registry.counter("adgen_requests", "生成请求数", ("kind", "status")).inc(kind="chat", status="ok")
+    registry.counter("adgen_tokens_total", "token 数").inc(3)
+    text = registry.render()
+
+    assert "# HELP adgen_requests_total 生成请求数" in text
+    assert 'adgen_requests_total{kind="chat",status="ok"} 1' in text
+    assert "adgen_tokens_total 3" in text
+    types, samples = _families(text)
+    assert types == {"adgen_requests_total": "counter", "adgen_tokens_total": "counter"}
+    assert set(samples) == set(types)
+
+
+def test_histogram_samples_belong_to_declared_family():
+    registry = MetricsRegistry()
+    registry.histogram("adgen_stage_seconds", "阶段耗时", ("stage",), buckets=(0.1, 1.0)).observe(0.5, stage="decode")
+    types, samples = _families(registry.render())
+
+    assert types == {"adgen_stage_seconds": "histogram"}
+    assert set(samples) == {"adgen_stage_seconds_bucket", "adgen_stage_seconds_sum", "adgen_stage_seconds_count"}
@@ -0,0 +1,82 @@
+# tests/test_model_cache.py
+import os
+import shutil
+
+import pytest
+
+from app.model_cache import cached_model_dir, model_fingerprint, save_model_to_cache
+
+
+@pytest.fixture
+def checkpoint_copy(tiny_checkpoint, tmp_path):
+    """可以修改的基础模型与适配器副本"""
+    base_path, lora_path = tiny_checkpoint
+    base_copy, lora_copy = str(tmp_path / "base"), str(tmp_path / "lora")
+    shutil.copytree(base_path, base_copy)
+    shutil.copytree(lora_path, lora_copy)
+    return base_copy, lora_copy
+
+
+def _shard(base_path):
+    return next(os.path.join(base_path, n) for n in sorted(os.listdir(base_path)) if n.endswith(".safetensors"))
+
+
+def _flip_last_byte(path):
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 1]))
+
+
+def test_fingerprint_tracks_adapter_and_shards(checkpoint_copy):
+    base_path, lora_path = checkpoint_copy
+    fingerprint = model_fingerprint(base_path, lora_path)
+    assert model_fingerprint(base_path, lora_path) == fingerprint
+    assert model_fingerprint(base_path) != fingerprint
+    assert model_fingerprint(base_path, lora_path, extra={"quantization": "int8"}) != fingerprint
+
+    _flip_last_byte(os.path.join(lora_path, "adapter_model.safetensors"))
+    adapter_changed = model_fingerprint(base_path, lora_path)
+    assert adapter_changed != fingerprint
+
+    # 分片不做内容哈希：大小不变的重新写入靠修改时间识别
+    shard = _shard(base_path)
+    stat = os.stat(shard)
+    _flip_last_byte(shard)
+    os.utime(shard, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert os.path.getsize(shard) == stat.st_size
+    assert model_fingerprint(base_path, lora_path) != adapter_changed
+
+
+class _InterruptedModel:
+    """save_pretrained 写到一半时中断"""
+
+    def __init__(self, error):
+        self.error = error
+
+    def save_pretrained(self, path, safe_serialization=True):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "config.json"), "w") as f:
+            f.write("{}")
+        raise self.error
+
+
+@pytest.mark.parametrize("error", [OSError("disk full"), KeyboardInterrupt()])
+def test_interrupted_save_leaves_no_usable_cache(tiny_model, tmp_path, error):
+    model, _ = tiny_model
+    cache_root = str(tmp_path / "cache")
+
+    with pytest.raises(type(error)):
+        save_model_to_cache(_InterruptedModel(error), cache_root, "abc")
+    assert cached_model_dir(cache_root, "abc") is None
+    assert os.listdir(cache_root) == []
+
+    path = save_model_to_cache(model, cache_root, "abc")
+    assert cached_model_dir(cache_root, "abc") == path
+    # 覆盖已有缓存时中断，旧缓存保持完整可用
+    with pytest.raises(type(error)):
+        save_model_to_cache(_InterruptedModel(error), cache_root, "abc")
+    assert cached_model_dir(cache_root, "abc") == path
+    assert sorted(os.listdir(path)) == sorted(os.listdir(save_model_to_cache(model, str(tmp_path / "fresh"), "abc")))
+    assert os.listdir(cache_root) == ["abc"]
@@ -0,0 +1,95 @@
+# tests/test_process_data.py
+import json
+
+import pytest
+from transformers import AutoTokenizer
+
+import process_data
+from process_data import _line_aligned_shards, build_tokenized_dataset, format_data, tokenized_cache_key
+
+COLORS = ["红色", "白色", "黑色", "淡紫色", "藏青色", "米白色", "卡其色", "粉色"]
+STYLES = ["宽松", "修身", "直筒", "阔腿", "紧身"]
+
+
+def _write_raw(path, n=200):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(n):
+            color, style = COLORS[i % len(COLORS)], STYLES[i % len(STYLES)]
+            record = {
+                "content": f"类型#裤*版型#{style}*颜色#{color}*编号#{i}",
+                "summary": f"这款{color}的{style}裤子，第{i}号款式，穿着舒适又显瘦，日常通勤都很合适。",
+            }
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _pairs(entries):
+    return {(e["input"], e["output"]) for e in entries}
+
+
+@pytest.fixture
+def raw_file(tmp_path):
+    path = tmp_path / "raw_data.json"
+    _write_raw(path)
+    return str(path)
+
+
+def test_formatted_and_tokenized_splits_agree(raw_file, tmp_path, tiny_checkpoint):
+    base_path, _ = tiny_checkpoint
+    output_dir = tmp_path / "formatted"
+    format_data(raw_file, str(output_dir), split_ratio=0.8)
+    with open(output_dir / "adgen_train.json", encoding='utf-8') as f:
+        train = _pairs(json.load(f))
+    with open(output_dir / "adgen_dev.json", encoding='utf-8') as f:
+        dev = _pairs(json.load(f))
+
+    cache_dir = build_tokenized_dataset(raw_file, base_path, cache_root=str(tmp_path / "tokenized"),
+                                        split_ratio=0.8, num_proc=2)
+    with open(f"{cache_dir}/adgen_dev.jsonl", encoding='utf-8') as f:
+        tokenized_dev = _pairs(json.loads(line) for line in f)
+    with open(f"{cache_dir}/meta.json", encoding='utf-8') as f:
+        meta = json.load(f)
+
+    assert dev and train
+    assert not train & dev
+    # evaluate.py 读取的验证集与训练时的分词缓存划分一致，其中的样本都没有参与训练
+    assert dev == tokenized_dev
+    assert meta["train"] == len(train)
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+@pytest.mark.parametrize("trailing_newline", [True, False])
+@pytest.mark.parametrize("shard_bytes,min_shards", [(64, 1), (1 << 20, 50), (1, 1)])
+def test_line_aligned_shards_cover_each_line_once(tmp_path, newline, trailing_newline, shard_bytes, min_shards):
+    lines = [f'{{"content": "类型#裤*编号#{i}", "summary": "{"很舒适" * (i % 7)}"}}' for i in range(9)]
+    data = newline.join(lines) + (newline if trailing_newline else "")
+    path = tmp_path / "raw.jsonl"
+    path.write_bytes(data.encode("utf-8"))
+
+    shards = _line_aligned_shards(str(path), shard_bytes=shard_bytes, min_shards=min_shards)
+    raw = path.read_bytes()
+    # 区间首尾相接覆盖整个文件，每个区间都从行首开始、不为空，分片数不超过行数
+    assert shards[0][0] == 0 and shards[-1][1] == len(raw)
+    assert all(end == next_start for (_, end), (next_start, _) in zip(shards[:-1], shards[1:]))
+    assert all(start < end and (start == 0 or raw[start - 1:start] == b"\n") for start, end in shards)
+    assert len(shards) <= len(lines)
+    chunks = [raw[start:end].decode("utf-8").splitlines() for start, end in shards]
+    assert [line for chunk in chunks for line in chunk] == lines
+
+
+def test_tokenized_cache_key_tracks_tokenizer_and_template(raw_file, tiny_checkpoint, monkeypatch):
+    base_path, _ = tiny_checkpoint
+    tokenizer = AutoTokenizer.from_pretrained(base_path)
+    key = tokenized_cache_key(raw_file, tokenizer, 0.8)
+    assert tokenized_cache_key(raw_file, AutoTokenizer.from_pretrained(base_path), 0.8) == key
+    assert tokenized_cache_key(raw_file, tokenizer, 0.9) != key
+    assert tokenized_cache_key(raw_file, tokenizer, 0.8, mask_prompt=False) != key
+
+    changed = AutoTokenizer.from_pretrained(base_path)
+    changed.add_special_tokens({"additional_special_tokens": ["<|reserved_special_token_0|>"]})
+    assert tokenized_cache_key(raw_file, changed, 0.8) != key
+
+    monkeypatch.setattr(process_data, "SYSTEM_PROMPT", process_data.SYSTEM_PROMPT + "文案不超过100字。")
+    assert tokenized_cache_key(raw_file, tokenizer, 0.8) != key
+    monkeypatch.undo()
+    monkeypatch.setattr(process_data, "EOT_TOKEN", "<|end_of_text|>")
+    assert tokenized_cache_key(raw_file, tokenizer, 0.8) != key
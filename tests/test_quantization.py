@@ -0,0 +1,96 @@
+# tests/test_quantization.py
+import pytest
+import torch
+import torch.nn as nn
+
+from app.quantization import Int4Linear, Int8Linear, prepare_quantized_model, quantize_model
+
+
+def _linear(in_features, out_features, bias=True, seed=0):
+    torch.manual_seed(seed)
+    linear = nn.Linear(in_features, out_features, bias=bias)
+    with torch.no_grad():
+        linear.weight.normal_(0, 0.05)
+    return linear
+
+
+def _inputs(rows, in_features):
+    torch.manual_seed(1)
+    return torch.randn(rows, in_features)
+
+
+def _int8_bound(module, x):
+    """逐元素的舍入误差上界：|Δw| <= scale / 2，故 |Δy| <= scale_i / 2 * ||x||_1"""
+    return 0.5 * x.abs().sum(dim=-1, keepdim=True) * module.scales.float()
+
+
+def _int4_bound(module, x):
+    groups = x.abs().view(x.shape[0], -1, module.group_size).sum(dim=-1)
+    return 0.5 * groups @ module.scales.float().t()
+
+
+# 覆盖低比特内核（行数 <= KERNEL_MAX_ROWS）与反量化 + F.linear 两条路径
+@pytest.mark.parametrize("rows", [1, 64])
+def test_int8_error_within_rounding_bound(rows):
+    linear = _linear(256, 96)
+    module = Int8Linear.from_linear(linear, torch.float32)
+    x = _inputs(rows, 256)
+    with torch.no_grad():
+        expected, actual = linear(x), module(x)
+
+    assert ((actual - expected).abs() <= _int8_bound(module, x) * 1.001 + 1e-5).all()
+    assert (actual - expected).norm() / expected.norm() < 0.01
+
+
+@pytest.mark.parametrize("rows", [1, 64])
+@pytest.mark.parametrize("group_size", [32, 64, 128])
+def test_int4_error_within_rounding_bound(rows, group_size):
+    linear = _linear(256, 96)
+    module = Int4Linear.from_linear(linear, group_size, torch.float32)
+    x = _inputs(rows, 256)
+    with torch.no_grad():
+        expected, actual = linear(x), module(x)
+        bound = _int4_bound(module, x)
+        assert ((actual - expected).abs() <= bound * 1.001 + 1e-5).all()
+        assert (actual - expected).norm() / expected.norm() < 0.15
+
+        # 转成内核布局后结果不变（内核不可用或不支持该形状时保持反量化路径）
+        module.prepare()
+        assert torch.allclose(module(x), actual, atol=1e-4, rtol=1e-4)
+
+
+def test_bfloat16_activations_stay_close_to_fp32():
+    linear = _linear(256, 96)
+    x = _inputs(4, 256)
+    with torch.no_grad():
+        expected = linear(x)
+        for module in (Int8Linear.from_linear(linear, torch.bfloat16),
+                       prepare_quantized_model(Int4Linear.from_linear(linear, 64, torch.bfloat16))):
+            actual = module(x.bfloat16()).float()
+            assert (actual - expected).norm() / expected.norm() < 0.15
+
+
+@pytest.mark.parametrize("group_size", [48, 7])
+def test_int4_keeps_layers_whose_width_does_not_split_into_groups(group_size):
+    # 输入维度 96 / 64：group_size=48 只整除其中一个，7 为奇数，两个 4bit 值无法成对打包
+    model = nn.Sequential()
+    model.add_module("q_proj", _linear(96, 64, seed=0))
+    model.add_module("down_proj", _linear(64, 96, seed=1))
+    reference = {name: module.weight.clone() for name, module in model.named_children()}
+
+    replaced = quantize_model(model, "int4", group_size=group_size, dtype=torch.float32)
+    prepare_quantized_model(model)
+
+    x = _inputs(3, 96)
+    with torch.no_grad():
+        expected = x @ reference["q_proj"].t() + model.q_proj.bias
+        if group_size == 48:
+            assert replaced == 1
+            assert isinstance(model.q_proj, Int4Linear)
+            assert isinstance(model.down_proj, nn.Linear) and torch.equal(model.down_proj.weight, reference["down_proj"])
+            bound = _int4_bound(model.q_proj, x)
+            assert ((model.q_proj(x) - expected).abs() <= bound * 1.001 + 1e-5).all()
+        else:
+            # 不能分组的层保持原精度，输出与 fp32 完全一致
+            assert replaced == 0
+            assert torch.equal(model.q_proj(x), expected)
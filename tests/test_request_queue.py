@@ -0,0 +1,51 @@
+# tests/test_request_queue.py
+import asyncio
+import threading
+
+from app.request_queue import GenerationQueue, iterate_in_thread
+
+
+def test_aclose_waits_for_blocked_generator():
+    events = []
+
+    def _blocking_stream(cancel):
+        try:
+            yield "first"
+            # 模拟等待下一个 token：只有 cancel 被设置才会结束
+            assert cancel.wait(timeout=10)
+            events.append("cancelled")
+        finally:
+            events.append("closed")
+
+    async def _main():
+        cancel = threading.Event()
+        stream = iterate_in_thread(_blocking_stream, cancel, stop=cancel)
+        assert await stream.__anext__() == "first"
+        await stream.aclose()
+        # aclose 返回时工作线程已经结束，调用方此时归还名额是安全的
+        assert events == ["cancelled", "closed"]
+        assert not any(t.name == "stream-worker" for t in threading.enumerate())
+
+    asyncio.run(_main())
+
+
+def test_release_hands_slot_to_next_waiter():
+    async def _main():
+        queue = GenerationQueue(max_concurrency=1, max_queue_size=1)
+        async for _ in queue.admit():
+            pass
+        positions = []
+
+        async def _wait():
+            async for position in queue.admit(poll_interval=0.01):
+                positions.append(position)
+
+        waiter = asyncio.create_task(_wait())
+        await asyncio.sleep(0.05)
+        assert queue.stats()["waiting"] == 1
+        queue.release()
+        await waiter
+        assert positions == [1]
+        assert queue.stats() == {"active": 1, "waiting": 0, "admitted": 2, "rejected": 0}
+
+    asyncio.run(_main())
@@ -0,0 +1,40 @@
+# tests/test_response_cache.py
+from app.response_cache import ResponseCache, response_cache_key
+
+
+def _key(message):
+    return response_cache_key("ns", message, "default", 0.7, 128)
+
+
+def test_sqlite_hits_rotate_without_committing_each_lookup(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    cache = ResponseCache(num_variants=2, path=path)
+    key = _key("类型#裤*版型#宽松")
+    cache.store(key, "回复一", 0.7)
+    cache.store(key, "回复二", 0.7)
+
+    store = cache._store
+    commits = []
+    store._conn.set_trace_callback(lambda sql: commits.append(sql) if sql.startswith("COMMIT") else None)
+    results = [cache.lookup(_key("版型#宽松*类型#裤"), 0.7) for _ in range(4)]
+
+    assert results == ["回复一", "回复二", "回复一", "回复二"]
+    assert commits == []
+
+    # 提交后的游标在重新打开时仍然有效
+    store.flush()
+    reopened = ResponseCache(num_variants=2, path=path)
+    assert reopened.lookup(key, 0.7) == "回复一"
+
+
+def test_sqlite_touches_flush_in_batches(tmp_path):
+    cache = ResponseCache(num_variants=1, path=str(tmp_path / "responses.sqlite3"))
+    cache._store.flush_every = 3
+    keys = [_key(f"类型#裤*颜色#{i}") for i in range(3)]
+    for key in keys:
+        cache.store(key, "回复", 0.0)
+
+    for key in keys:
+        assert cache.lookup(key, 0.0) == "回复"
+    assert cache._store._touched == {}
+    assert cache.hits == 3
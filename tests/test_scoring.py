@@ -0,0 +1,24 @@
+# tests/test_scoring.py
+import pytest
+
+from scoring import METRICS, score_corpus, score_pair, verify_against_reference
+
+
+def test_matches_rouge_and_nltk():
+    pytest.importorskip("rouge")
+    pytest.importorskip("nltk")
+    ok, max_diff = verify_against_reference()
+    assert ok, max_diff
+
+
+def test_parallel_corpus_scores_match_serial():
+    predictions = ["这款裤子采用宽松版型", "", "丝绒口红显白", "裙"] * 10
+    references = ["宽松的阔腿裤版型", "白色上衣", "丝绒质地的口红很显白", "裙"] * 10
+    serial, per_sample = score_corpus(predictions, references, num_workers=1, chunk_size=8)
+    parallel, _ = score_corpus(predictions, references, num_workers=2, chunk_size=8)
+
+    assert parallel == pytest.approx(serial)
+    # 空预测计 0 分，不会被丢弃
+    assert len(per_sample) == len(predictions)
+    assert all(per_sample[1][m] == 0.0 for m in METRICS)
+    assert per_sample[3] == score_pair("裙", "裙")
@@ -0,0 +1,54 @@
+# tests/test_speculative.py
+import pytest
+import torch
+from transformers import AutoModelForCausalLM
+
+from app.speculative import DraftModel, PromptLookupDrafter, SpeculativeDecoder
+
+PROMPTS = ["类型#裤*版型#宽松*风格#性感*版型#宽松", "类型#口红*质地#丝绒", "hello hello hello"]
+MAX_NEW_TOKENS = 24
+
+
+@pytest.fixture(scope="module")
+def other_model(tiny_checkpoint):
+    """结构相同、权重不同的草稿模型，用来覆盖草稿被拒绝的分支"""
+    base_path, _ = tiny_checkpoint
+    model = AutoModelForCausalLM.from_pretrained(base_path).eval()
+    torch.manual_seed(1)
+    with torch.no_grad():
+        for parameter in model.parameters():
+            parameter.add_(torch.randn_like(parameter) * 0.05)
+    return model
+
+
+def _reference(model, tokenizer, input_ids):
+    with torch.no_grad():
+        return model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=MAX_NEW_TOKENS,
+            do_sample=False,
+            repetition_penalty=1.1,
+            eos_token_id=tokenizer.eos_token_id,
+            pad_token_id=tokenizer.eos_token_id,
+        )
+
+
+@pytest.mark.parametrize("drafter_kind", ["prompt_lookup", "same_model", "other_model"])
+def test_greedy_speculative_matches_generate(tiny_model, other_model, drafter_kind):
+    model, tokenizer = tiny_model
+    drafter = {
+        "prompt_lookup": lambda: PromptLookupDrafter(),
+        "same_model": lambda: DraftModel(model),
+        "other_model": lambda: DraftModel(other_model),
+    }[drafter_kind]()
+    decoder = SpeculativeDecoder(model, drafter, tokenizer.eos_token_id, num_draft_tokens=4, top_k=50)
+
+    for prompt in PROMPTS:
+        input_ids = torch.tensor([tokenizer(prompt)["input_ids"]])
+        output = decoder.generate(input_ids, 0.0, MAX_NEW_TOKENS)
+        assert output.sequences.tolist() == _reference(model, tokenizer, input_ids).tolist()
+        assert output.stats.target_steps <= output.stats.generated
+        if drafter_kind == "same_model":
+            # 草稿与目标模型相同时草稿全部被接受，覆盖一轮输出多个 token 的路径
+            assert output.stats.target_steps < output.stats.generated
@@ -0,0 +1,118 @@
+# tests/test_token_dataset.py
+import numpy as np
+import pytest
+import torch
+
+from token_dataset import (
+    IGNORE_INDEX, LengthGroupedBatchSampler, MemmapTokenDataset, PackedCollator, PackedTokenDataset, TokenFileWriter,
+    merge_token_dirs
+)
+
+
+def _lengths(n=3000):
+    rng = np.random.default_rng(0)
+    return np.clip(rng.lognormal(5, 0.6, n).astype(int), 8, 1024)
+
+
+def test_epoch_only_changes_through_set_epoch():
+    sampler = LengthGroupedBatchSampler(_lengths(), batch_size=8, bucket_size=256)
+    first = list(sampler)
+    assert list(sampler) == first
+    assert sampler.epoch == 0
+
+    sampler.set_epoch(1)
+    assert list(sampler) != first
+    sampler.set_epoch(0)
+    assert list(sampler) == first
+
+
+def test_token_budget_length_is_stable_across_epochs():
+    lengths = _lengths()
+    sampler = LengthGroupedBatchSampler(lengths, max_tokens=2048, bucket_size=256)
+    expected = len(sampler)
+    for epoch in range(6):
+        sampler.set_epoch(epoch)
+        batches = list(sampler)
+        assert len(sampler) == expected
+        assert len(batches) == expected
+        assert all(int(lengths[b].max()) * len(b) <= 2048 for b in batches)
+        assert sorted(i for b in batches for i in b) == list(range(len(lengths)))
+
+
+def _write_samples(data_dir, samples):
+    with TokenFileWriter(str(data_dir)) as writer:
+        for input_ids, label_start in samples:
+            writer.add(input_ids, label_start)
+
+
+def test_merged_shards_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    # Llama-3 词表超过 uint16 范围，取到接近上限的 id；中间放一个空分片
+    shards = [
+        [(rng.integers(0, 128256, n).tolist(), int(rng.integers(0, n))) for n in rng.integers(1, 40, size)]
+        for size in (5, 0, 7, 1)
+    ]
+    shards[0][0] = ([128255, 0, 128000], 2)
+    shard_dirs = []
+    for i, samples in enumerate(shards):
+        _write_samples(tmp_path / f"shard_{i}", samples)
+        shard_dirs.append(str(tmp_path / f"shard_{i}"))
+
+    expected = [sample for samples in shards for sample in samples]
+    assert merge_token_dirs(shard_dirs, str(tmp_path / "merged")) == len(expected)
+    dataset = MemmapTokenDataset(str(tmp_path / "merged"))
+
+    assert len(dataset) == len(expected)
+    assert dataset.offsets.tolist() == np.cumsum([0] + [len(ids) for ids, _ in expected]).tolist()
+    assert dataset.label_starts.tolist() == [label_start for _, label_start in expected]
+    assert dataset.lengths.tolist() == [len(ids) for ids, _ in expected]
+    for item, (input_ids, label_start) in zip(dataset, expected):
+        assert item["input_ids"].tolist() == input_ids
+        assert (item["labels"][:label_start] == IGNORE_INDEX).all()
+        assert item["labels"][label_start:].tolist() == input_ids[label_start:]
+
+
+@pytest.fixture
+def packed_source(tmp_path, tiny_model):
+    _, tokenizer = tiny_model
+    texts = [("类型#裤*版型#宽松", "宽松的裤子很舒适"), ("类型#口红", "丝绒质地显白"),
+             ("hello", "world wide"), ("类型#裙*颜色#淡紫色", "淡紫色的雪纺裙清新又温柔")]
+    samples = [(p + r, len(p)) for p, r in (
+        (tokenizer(prompt)["input_ids"], tokenizer(reply, add_special_tokens=False)["input_ids"]) for prompt, reply in texts
+    )]
+    _write_samples(tmp_path / "data", samples)
+    return MemmapTokenDataset(str(tmp_path / "data")), samples
+
+
+def test_packed_rows_reset_positions_and_mask_boundaries(packed_source):
+    dataset, samples = packed_source
+    packed = PackedTokenDataset(dataset, max_length=4096)
+    assert len(packed) == 1
+    row = packed[0]
+
+    starts = (row["position_ids"] == 0).nonzero().flatten().tolist()
+    assert len(starts) == len(samples)
+    bounds = starts + [len(row["input_ids"])]
+    seen = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        assert row["position_ids"][start:end].tolist() == list(range(end - start))
+        assert row["labels"][start] == IGNORE_INDEX
+        seen.append(row["input_ids"][start:end].tolist())
+    assert sorted(seen) == sorted(ids for ids, _ in samples)
+
+
+def test_packed_loss_matches_per_sample_loss(packed_source, tiny_model):
+    model, tokenizer = tiny_model
+    dataset, _ = packed_source
+    batch = PackedCollator(tokenizer.eos_token_id)([PackedTokenDataset(dataset, max_length=4096)[0]])
+
+    def _token_sum(labels, **inputs):
+        # HF 的 loss 是有效 label 的平均值，乘回有效 token 数后才能跨样本相加；
+        # 与训练一致关闭 KV Cache，transformers 只在没有 cache 时按 position_ids 的重置位置构造块对角 mask
+        loss = model(**inputs, labels=labels, use_cache=False).loss
+        return loss * (labels[:, 1:] != IGNORE_INDEX).sum()
+
+    with torch.no_grad():
+        packed_sum = _token_sum(**batch)
+        per_sample_sum = sum(_token_sum(labels=s["labels"][None], input_ids=s["input_ids"][None]) for s in dataset)
+    assert torch.allclose(packed_sum, per_sample_sum, rtol=1e-4)
@@ -0,0 +1,57 @@
+# tests/test_train.py
+import pytest
+import torch
+from transformers import TrainingArguments
+
+from process_data import EOT_TOKEN, SYSTEM_PROMPT, build_prompt, tokenize_texts
+from token_dataset import IGNORE_INDEX, MemmapTokenDataset, PaddingCollator, TokenFileWriter
+from train import AdGenTrainer
+
+INPUTS = ["类型: 裤; 版型: 宽松; 风格: 性感", "类型: 口红; 质地: 丝绒"]
+OUTPUTS = ["宽松的阔腿裤版型，穿上显瘦又舒适。", "丝绒质地的口红，颜色很显白。"]
+ASSISTANT_HEADER = "<|start_header_id|>assistant<|end_header_id|>\n\n"
+
+
+@pytest.fixture
+def tokenized(tiny_model, tmp_path):
+    """tokenize_texts 的结果写成数据目录，按训练时的方式读回 input_ids / labels"""
+    _, tokenizer = tiny_model
+    prompts = [build_prompt(SYSTEM_PROMPT, text) for text in INPUTS]
+    samples = tokenize_texts(tokenizer, prompts, [text + EOT_TOKEN for text in OUTPUTS])
+    with TokenFileWriter(str(tmp_path / "data")) as writer:
+        for input_ids, label_start in samples:
+            writer.add(input_ids, label_start)
+    return prompts, samples, MemmapTokenDataset(str(tmp_path / "data"))
+
+
+def test_prompt_tokens_are_masked(tiny_model, tokenized):
+    _, tokenizer = tiny_model
+    prompts, samples, dataset = tokenized
+    for prompt, output, (input_ids, label_start), item in zip(prompts, OUTPUTS, samples, dataset):
+        assert label_start == len(tokenizer(prompt)["input_ids"])
+        # assistant 头及之前的 label 全部为 -100，之后是回复本身
+        assert tokenizer.decode(input_ids[:label_start]).endswith(ASSISTANT_HEADER)
+        assert (item["labels"][:label_start] == IGNORE_INDEX).all()
+        assert item["labels"][label_start:].tolist() == input_ids[label_start:]
+        assert tokenizer.decode(input_ids[label_start:]) == output + EOT_TOKEN
+
+    unmasked = tokenize_texts(tokenizer, prompts, OUTPUTS, mask_prompt=False)
+    assert [label_start for _, label_start in unmasked] == [0, 0]
+
+
+@pytest.mark.parametrize("label_only_logits,loss_chunk_size", [(True, None), (False, 3), (True, 7)])
+def test_label_only_loss_matches_full_logits(tiny_model, tokenized, tmp_path, label_only_logits, loss_chunk_size):
+    model, tokenizer = tiny_model
+    _, _, dataset = tokenized
+    inputs = PaddingCollator(tokenizer.eos_token_id)(list(dataset))
+    trainer = AdGenTrainer(
+        model=model,
+        args=TrainingArguments(output_dir=str(tmp_path / "out"), report_to=[], use_cpu=True),
+        label_only_logits=label_only_logits,
+        loss_chunk_size=loss_chunk_size,
+    )
+
+    with torch.no_grad():
+        expected = model(**inputs).loss
+        actual = trainer.compute_loss(model, inputs)
+    assert torch.allclose(actual, expected, rtol=1e-5)
@@ -0,0 +1,66 @@
+# tests/test_train_config.py
+import os
+
+import pytest
+
+from train_config import TrainConfig, parse_args
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "configs", "lora_adgen.yaml")
+
+
+def test_yaml_matches_dataclass_defaults():
+    assert TrainConfig.from_yaml(CONFIG_PATH).to_dict() == TrainConfig().to_dict()
+
+
+def test_shortcuts_land_on_fields():
+    config = parse_args(["--config", CONFIG_PATH, "--epoch", "5", "--lr", "2e-4", "--batch_size", "2",
+                         "--data", "raw.jsonl", "--lora_r", "16"])
+    assert config.training.num_train_epochs == 5.0
+    assert config.training.learning_rate == 2e-4 and isinstance(config.training.learning_rate, float)
+    assert config.training.per_device_train_batch_size == 2
+    assert config.data.raw_data_path == "raw.jsonl"
+    assert config.lora.r == 16
+
+
+def test_set_overrides_are_coerced():
+    config = parse_args([
+        "--set", "lora.target_modules=[q_proj,v_proj]",
+        "--set", "training.learning_rate=2e-4",
+        "--set", "training.num_train_epochs=3",
+        "--set", "training.loss_chunk_size=null",
+        "--set", "data.packing=false",
+    ])
+    assert config.lora.target_modules == ["q_proj", "v_proj"]
+    # PyYAML 把 2e-4 解析成字符串，需要按字段类型转换
+    assert config.training.learning_rate == 2e-4 and isinstance(config.training.learning_rate, float)
+    assert config.training.num_train_epochs == 3.0 and isinstance(config.training.num_train_epochs, float)
+    assert config.training.loss_chunk_size is None
+    assert config.data.packing is False
+
+
+def test_command_line_overrides_yaml(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text("training:\n  learning_rate: 1e-3\n  seed: 7\n", encoding="utf-8")
+    config = parse_args(["--config", str(path), "--lr", "5e-5"])
+    assert config.training.learning_rate == 5e-5
+    assert config.training.seed == 7
+
+
+@pytest.mark.parametrize("override", ["lora.rank=8", "optimizer.lr=1e-4", "training=1", "training.learning_rate"])
+def test_unknown_set_keys_are_rejected(override):
+    with pytest.raises(ValueError):
+        parse_args(["--set", override])
+
+
+def test_unknown_yaml_keys_and_options_are_rejected(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text("lora:\n  rank: 8\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="lora.rank"):
+        parse_args(["--config", str(path)])
+
+    path.write_text("lora: 8\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        parse_args(["--config", str(path)])
+
+    with pytest.raises(SystemExit):
+        parse_args(["--epochs", "3"])
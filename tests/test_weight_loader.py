@@ -0,0 +1,78 @@
+# tests/test_weight_loader.py
+import os
+import shutil
+
+import pytest
+import torch
+from safetensors.torch import load_file, save_file
+from transformers import AutoModelForCausalLM
+
+from app.weight_loader import SINGLE_FILE, ShardedWeightLoader, build_empty_model, safetensors_shards
+
+
+def _load(model_path, dtype):
+    model, shards = build_empty_model(model_path, dtype, device="cpu")
+    ShardedWeightLoader(model, shards).start().join()
+    return model, shards
+
+
+def _assert_same_state(model, reference):
+    state, expected = model.state_dict(), reference.state_dict()
+    assert state.keys() == expected.keys()
+    for name, tensor in expected.items():
+        assert state[name].dtype == tensor.dtype, name
+        assert torch.equal(state[name], tensor), name
+
+
+@pytest.fixture(scope="module")
+def sharded_checkpoint(tiny_checkpoint, tmp_path_factory):
+    """同一个小模型按多个分片 + index 保存"""
+    base_path, _ = tiny_checkpoint
+    path = str(tmp_path_factory.mktemp("sharded"))
+    AutoModelForCausalLM.from_pretrained(base_path).save_pretrained(path, max_shard_size="100KB")
+    return path
+
+
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float16])
+@pytest.mark.parametrize("layout", ["single", "sharded"])
+def test_loader_matches_from_pretrained(tiny_checkpoint, sharded_checkpoint, dtype, layout):
+    model_path = tiny_checkpoint[0] if layout == "single" else sharded_checkpoint
+    model, shards = _load(model_path, dtype)
+    if layout == "sharded":
+        assert len(shards) > 1
+    # float32 时参数直接引用映射页面，float16 时经 copy_ 转换
+    reference = AutoModelForCausalLM.from_pretrained(model_path, dtype=dtype).eval()
+    _assert_same_state(model, reference)
+
+    input_ids = torch.tensor([[1, 5, 9, 42, 7]])
+    with torch.no_grad():
+        assert torch.equal(model(input_ids).logits, reference(input_ids).logits)
+
+
+def _rewrite_single_file(tiny_checkpoint, tmp_path, edit):
+    base_path, _ = tiny_checkpoint
+    path = str(tmp_path / "broken")
+    shutil.copytree(base_path, path)
+    tensors = load_file(os.path.join(path, SINGLE_FILE))
+    edit(tensors)
+    save_file(tensors, os.path.join(path, SINGLE_FILE), metadata={"format": "pt"})
+    assert safetensors_shards(path) == [os.path.join(path, SINGLE_FILE)]
+    return path
+
+
+def test_missing_tensor_raises(tiny_checkpoint, tmp_path):
+    path = _rewrite_single_file(tiny_checkpoint, tmp_path, lambda t: t.pop("model.layers.1.mlp.down_proj.weight"))
+    model, shards = build_empty_model(path, torch.float32, device="cpu")
+    with pytest.raises(ValueError, match="缺少 1 个张量.*model.layers.1.mlp.down_proj.weight"):
+        ShardedWeightLoader(model, shards).start().join()
+
+
+def test_shape_mismatch_raises(tiny_checkpoint, tmp_path):
+    def _truncate(tensors):
+        name = "model.layers.0.self_attn.q_proj.weight"
+        tensors[name] = tensors[name][:-1].contiguous()
+
+    path = _rewrite_single_file(tiny_checkpoint, tmp_path, _truncate)
+    model, shards = build_empty_model(path, torch.float32, device="cpu")
+    with pytest.raises(ValueError, match="形状不匹配"):
+        ShardedWeightLoader(model, shards).start().join()